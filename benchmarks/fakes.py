@@ -0,0 +1,528 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for the bot's external services, used by the benchmark and
+soak harnesses. Nothing in here talks to the network except the fake LLM and
+Slack servers, which listen on localhost.
+"""
+import asyncio
+import copy
+import json
+import logging
+import random
+import re
+import socket
+import threading
+import time
+import zlib
+from collections import Counter
+
+import discord
+import numpy as np
+from aiohttp import web
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore import ArrayUnion, Increment
+
+REALTIME_KEYWORDS = ("price", "latest", "news", "current", "just announce", "right now", "live", "what's", "whats")
+EMBEDDING_DIM = 256
+
+
+# --- Local HTTP servers ---
+class _ThreadedServer:
+    """
+    Runs an aiohttp app on its own thread and event loop, so that blocking work
+    in the code under test does not distort the simulated service latency.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._runner: web.AppRunner | None = None
+        self._started = threading.Event()
+
+    def build_app(self) -> web.Application:
+        raise NotImplementedError
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        if not self._started.wait(timeout=10):
+            raise RuntimeError(f"{type(self).__name__} did not start in time.")
+        return self
+
+    def stop(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread:
+            self._thread.join(timeout=10)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start_site())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _start_site(self):
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        self.port = sock.getsockname()[1]
+        await web.SockSite(self._runner, sock).start()
+
+
+# --- Fake LLM server (OpenAI + Grok compatible) ---
+class FakeLLMServer(_ThreadedServer):
+    """
+    An OpenAI/xAI-compatible HTTP server with configurable latency.
+
+    OpenAI endpoints live under /openai/v1 and Grok under /xai/v1, so calls to
+    each provider are counted separately. Responses are deterministic for a
+    given prompt, and the latency jitter comes from a seeded RNG.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, seed: int = 0,
+                 chat_latency_ms: float = 800, grok_latency_ms: float = 1500,
+                 embedding_latency_ms: float = 150, moderation_latency_ms: float = 100,
+                 jitter: float = 0.2):
+        super().__init__(host, port)
+        self.latency_ms = {
+            "openai_chat": chat_latency_ms,
+            "grok_chat": grok_latency_ms,
+            "embedding": embedding_latency_ms,
+            "moderation": moderation_latency_ms,
+        }
+        self.jitter = jitter
+        self.calls: Counter = Counter()
+        self.tokens: Counter = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def openai_base(self) -> str:
+        return f"http://{self.host}:{self.port}/openai/v1"
+
+    @property
+    def xai_base(self) -> str:
+        return f"http://{self.host}:{self.port}/xai/v1"
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/openai/v1/chat/completions", self._openai_chat)
+        app.router.add_post("/openai/v1/embeddings", self._embeddings)
+        app.router.add_post("/openai/v1/moderations", self._moderations)
+        app.router.add_post("/xai/v1/chat/completions", self._grok_chat)
+        return app
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.tokens.clear()
+
+    # --- Helpers ---
+    async def _simulate(self, route: str):
+        with self._lock:
+            self.calls[route] += 1
+            mean = self.latency_ms[route] / 1000.0
+            delay = max(0.0, self._rng.gauss(mean, mean * self.jitter))
+        await asyncio.sleep(delay)
+
+    def _chat_response(self, model: str, prompt: str, content: str, logprobs: bool = False) -> web.Response:
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        with self._lock:
+            self.tokens[f"{model}:prompt"] += prompt_tokens
+            self.tokens[f"{model}:completion"] += completion_tokens
+        choice = {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        if logprobs:
+            # A deterministic first-token probability between about 0.6 and 1.0.
+            choice["logprobs"] = {"content": [{"token": content[:4], "logprob": -(zlib.crc32(prompt.encode()) % 100) / 200}]}
+        return web.json_response({
+            "id": f"fake-{zlib.crc32(prompt.encode())}",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [choice],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    # --- Routes ---
+    async def _openai_chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await self._simulate("openai_chat")
+        prompt = body["messages"][-1]["content"]
+        return self._chat_response(body.get("model", "gpt-4"), prompt, fake_completion(prompt), bool(body.get("logprobs")))
+
+    async def _grok_chat(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await self._simulate("grok_chat")
+        prompt = body["messages"][-1]["content"]
+        return self._chat_response(body.get("model", "grok-3-latest"), prompt, fake_completion(prompt))
+
+    async def _embeddings(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await self._simulate("embedding")
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        data = [{"object": "embedding", "index": i, "embedding": fake_embedding(text).tolist()}
+                for i, text in enumerate(inputs)]
+        tokens = sum(max(1, len(text) // 4) for text in inputs)
+        return web.json_response({"object": "list", "data": data, "model": body.get("model"),
+                                  "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    async def _moderations(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        await self._simulate("moderation")
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return web.json_response({"id": "modr-fake", "results": [
+            {"flagged": "FLAGME" in text, "categories": {}, "category_scores": {}} for text in inputs]})
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    """A deterministic unit vector; texts sharing words end up close together."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        rng = np.random.default_rng(zlib.crc32(word.encode()))
+        vector += rng.standard_normal(dim).astype(np.float32)
+    if not vector.any():
+        vector[0] = 1.0
+    return vector / np.linalg.norm(vector)
+
+
+def fake_completion(prompt: str) -> str:
+    """Picks a plausible, deterministic completion for each of the bot's prompt types."""
+    if "hyper-efficient routing agent" in prompt:
+        user_message = prompt.rsplit("USER MESSAGE:", 1)[-1].lower()
+        return "REALTIME_FACTS" if any(k in user_message for k in REALTIME_KEYWORDS) else "PERSONA_OPINION"
+    if "YOUR JSON RESPONSE" in prompt:
+        topic_id = zlib.crc32(prompt.encode()) % 1000
+        return json.dumps({
+            "thought": "Picked the open question from earlier.",
+            "topic_summary": f"follow-up topic {topic_id}",
+            "question": f"circling back to topic {topic_id}, where do people land on it?",
+        })
+    if "running summary of a group chat" in prompt:
+        times = re.findall(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d)\]", prompt, re.M)
+        return json.dumps({
+            "summary": "The group compared L2 rollups and argued about restaking risk.",
+            "hooks": [{"hook": "Nobody answered whether restaking is safe long term.", "last_message_at": times[-1] if times else ""}],
+        })
+    if "Rephrase the following reply" in prompt:
+        return "eth chopping around 3k rn"
+    if "share a link" in prompt:
+        link = re.search(r"- Link: (\S+)", prompt)
+        return f"worth a read {link.group(1) if link else ''}".strip()
+    if "single most important fact" in prompt:
+        return "ETH is trading at 3,012 USD, up 1.4% on the day."
+    return "ngl that's a fair point, been seeing the same"
+
+
+# --- In-memory Firestore ---
+class _Snapshot:
+    def __init__(self, doc_id: str, data: dict | None):
+        self.id = doc_id
+        self._data = data
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> dict | None:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    def __init__(self, db: "InMemoryFirestore", collection: str, doc_id: str):
+        self._db = db
+        self._collection = collection
+        self.id = doc_id
+
+    def _docs(self) -> dict:
+        return self._db._collections.setdefault(self._collection, {})
+
+    def get(self) -> _Snapshot:
+        self._db._latency()
+        self._db.reads += 1
+        return _Snapshot(self.id, self._docs().get(self.id))
+
+    def set(self, data: dict, merge: bool = False):
+        self._db._latency()
+        self._write(data, merge)
+
+    def _write(self, data: dict, merge: bool):
+        with self._db._lock:
+            existing = self._docs().get(self.id) if merge else None
+            merged = dict(existing) if existing else {}
+            for key, value in data.items():
+                if isinstance(value, Increment):
+                    merged[key] = merged.get(key, 0) + value.value
+                elif isinstance(value, ArrayUnion):
+                    current = list(merged.get(key, []))
+                    current.extend(copy.deepcopy(v) for v in value.values if v not in current)
+                    merged[key] = current
+                else:
+                    merged[key] = copy.deepcopy(value)
+            self._docs()[self.id] = merged
+            if existing is None:
+                self._db._trim(self._docs())
+
+    def create(self, data: dict):
+        self._db._latency()
+        with self._db._lock:
+            if self.id in self._docs():
+                raise AlreadyExists(f"Document already exists: {self._collection}/{self.id}")
+            self._write(data, merge=False)
+
+    def collection(self, name: str) -> "FakeCollectionReference":
+        return FakeCollectionReference(self._db, f"{self._collection}/{self.id}/{name}")
+
+    def update(self, data: dict):
+        self._db._latency()
+        with self._db._lock:
+            if self.id not in self._docs():
+                raise KeyError(f"No document to update: {self._collection}/{self.id}")
+            self._docs()[self.id].update(copy.deepcopy(data))
+
+    def delete(self):
+        self._db._latency()
+        with self._db._lock:
+            self._docs().pop(self.id, None)
+
+
+class FakeQuery:
+    def __init__(self, db: "InMemoryFirestore", collection: str, order_field: str | None = None,
+                 descending: bool = False, limit: int | None = None):
+        self._db = db
+        self._collection = collection
+        self._order_field = order_field
+        self._descending = descending
+        self._limit = limit
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        return FakeQuery(self._db, self._collection, field, direction == "DESCENDING", self._limit)
+
+    def limit(self, count: int) -> "FakeQuery":
+        return FakeQuery(self._db, self._collection, self._order_field, self._descending, count)
+
+    def stream(self):
+        self._db._latency()
+        with self._db._lock:
+            items = list(self._db._collections.get(self._collection, {}).items())
+        if self._order_field:
+            items.sort(key=lambda item: item[1].get(self._order_field), reverse=self._descending)
+        if self._limit is not None:
+            items = items[:self._limit]
+        self._db.reads += len(items)
+        return iter([_Snapshot(doc_id, data) for doc_id, data in items])
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db: "InMemoryFirestore", name: str):
+        super().__init__(db, name)
+
+    def document(self, doc_id: str) -> FakeDocumentReference:
+        return FakeDocumentReference(self._db, self._collection, doc_id)
+
+
+class FakeWriteBatch:
+    def __init__(self, db: "InMemoryFirestore"):
+        self._db = db
+        self._writes: list = []
+
+    def set(self, ref: FakeDocumentReference, data: dict, merge: bool = False):
+        self._writes.append((ref, data, merge))
+
+    def commit(self):
+        # One round trip for the whole batch, like the real client.
+        self._db._latency()
+        with self._db._lock:
+            for ref, data, merge in self._writes:
+                ref._write(data, merge)
+        self._writes = []
+
+
+class InMemoryFirestore:
+    """
+    The subset of the Firestore client API the bot uses, kept in memory.
+    Calls block for `latency_ms`, just like the synchronous client does.
+    `max_docs_per_collection` keeps long soak runs from measuring the fake
+    database's own growth; the oldest documents are dropped first.
+    """
+    def __init__(self, latency_ms: float = 0.0, max_docs_per_collection: int | None = None):
+        self.latency_ms = latency_ms
+        self.max_docs_per_collection = max_docs_per_collection
+        self.calls = 0
+        self.reads = 0
+        self._collections: dict[str, dict[str, dict]] = {}
+        self._lock = threading.RLock()
+
+    def _latency(self):
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def collection(self, name: str) -> FakeCollectionReference:
+        return FakeCollectionReference(self, name)
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def _trim(self, docs: dict):
+        if self.max_docs_per_collection and len(docs) > self.max_docs_per_collection:
+            for doc_id in list(docs)[:len(docs) - self.max_docs_per_collection]:
+                del docs[doc_id]
+
+
+# --- Fake mem0 client ---
+class FakeMemoryClient:
+    """
+    Mimics mem0's MemoryClient.search/add. Calls block for `latency_ms`
+    because the real client is synchronous as well. Only the newest
+    `max_memories_per_user` entries are kept, like a server-side store would.
+    """
+    def __init__(self, latency_ms: float = 0.0, max_memories_per_user: int = 200):
+        self.latency_ms = latency_ms
+        self.max_memories_per_user = max_memories_per_user
+        self.calls: Counter = Counter()
+        self._memories: dict[str, list[str]] = {}
+
+    def _latency(self, operation: str):
+        self.calls[operation] += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def search(self, query: str, user_id: str, limit: int = 5):
+        self._latency("search")
+        words = set(query.lower().split())
+        scored = [(len(words & set(m.lower().split())), m) for m in self._memories.get(user_id, [])]
+        best = [m for score, m in sorted(scored, key=lambda item: -item[0]) if score][:limit]
+        return {"results": [{"memory": m} for m in best]}
+
+    def add(self, messages: list[dict], user_id: str):
+        self._latency("add")
+        memories = self._memories.setdefault(user_id, [])
+        memories.extend(m["content"] for m in messages)
+        del memories[:-self.max_memories_per_user]
+
+
+# --- Fake chat platforms ---
+class FakeSlackAPI(_ThreadedServer):
+    """A local Slack Web API endpoint; point AsyncWebClient(base_url=...) at `base_url`."""
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(host, port)
+        self.posted: Counter = Counter()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/api/"
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/chat.postMessage", self._post_message)
+        app.router.add_post("/api/auth.test", self._auth_test)
+        return app
+
+    async def _post_message(self, request: web.Request) -> web.Response:
+        body = await request.post() if request.content_type != "application/json" else await request.json()
+        self.posted[body.get("channel")] += 1
+        return web.json_response({"ok": True, "channel": body.get("channel"), "ts": f"{time.time():.6f}"})
+
+    async def _auth_test(self, request: web.Request) -> web.Response:
+        return web.json_response({"ok": True, "user_id": "UFAKEBOT", "bot_id": "BFAKEBOT"})
+
+
+class FakeSlackApp:
+    """The slice of slack_bolt's AsyncApp used by slack_listener_worker, plus a real web client."""
+    def __init__(self, client):
+        self.client = client
+        self.handlers: dict[str, list] = {}
+
+    def event(self, name: str):
+        def decorator(func):
+            self.handlers.setdefault(name, []).append(func)
+            return func
+        return decorator
+
+    async def emit_message(self, channel_id: str, user_id: str, text: str, ts: str):
+        body = {"event": {"type": "message", "channel": channel_id, "user": user_id, "text": text, "ts": ts}}
+        for handler in self.handlers.get("message", []):
+            await handler(body=body, logger=logging.getLogger("slack_bolt.AsyncApp"))
+
+
+class _FakeTelegramMessage:
+    def __init__(self, message_id: int, chat_id: int, sender_id: int, text: str):
+        self.id = message_id
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.text = text
+
+
+class _FakeTelegramEvent:
+    def __init__(self, message: _FakeTelegramMessage):
+        self.message = message
+
+
+class FakeTelegramClient:
+    """The slice of Telethon's TelegramClient used by the Telegram listener and sender."""
+    def __init__(self):
+        self.handlers: list = []
+        self.sent: Counter = Counter()
+
+    def on(self, event_builder):
+        def decorator(func):
+            self.handlers.append(func)
+            return func
+        return decorator
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def send_message(self, chat_id: int, text: str):
+        self.sent[chat_id] += 1
+
+    async def emit_message(self, message_id: int, chat_id: int, sender_id: int, text: str):
+        event = _FakeTelegramEvent(_FakeTelegramMessage(message_id, chat_id, sender_id, text))
+        for handler in self.handlers:
+            await handler(event)
+
+
+class _FakeDiscordUser:
+    def __init__(self, user_id: int, bot: bool = False):
+        self.id = user_id
+        self.bot = bot
+
+
+class FakeDiscordChannel(discord.abc.Messageable):
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+
+class _FakeDiscordMessage:
+    def __init__(self, message_id: int, channel: FakeDiscordChannel, author: _FakeDiscordUser, content: str):
+        self.id = message_id
+        self.channel = channel
+        self.author = author
+        self.content = content
+
+
+class FakeDiscordClient:
+    """The slice of discord.Client used by the Discord listener and sender."""
+    def __init__(self):
+        self.channels: dict[int, FakeDiscordChannel] = {}
+
+    def event(self, coro):
+        setattr(self, coro.__name__, coro)
+        return coro
+
+    def get_channel(self, channel_id: int) -> FakeDiscordChannel:
+        return self.channels.setdefault(channel_id, FakeDiscordChannel(channel_id))
+
+    async def emit_message(self, message_id: int, channel_id: int, author_id: int, content: str):
+        message = _FakeDiscordMessage(message_id, self.get_channel(channel_id), _FakeDiscordUser(author_id), content)
+        await self.on_message(message)
@@ -0,0 +1,356 @@
+# benchmarks/pipeline_bench.py
+"""
+Offline throughput/latency benchmark for the brain pipeline.
+
+OpenAI and Grok are served by a local fake LLM server, Firestore and mem0 are
+replaced with in-memory stand-ins, and Telegram is replaced by a synthetic (or
+recorded) message stream fed straight into `brain_queue`. Replies are drained
+from the sender queues instead of being delivered. `--storage sqlite` runs the
+state and history on the embedded SQLite backend instead of the Firestore fake.
+
+Usage:
+    python -m benchmarks.pipeline_bench --messages 200 --output bench.json
+    python -m benchmarks.pipeline_bench --replay messages.jsonl --compare bench.json
+
+Runs are reproducible for a given seed and set of options, and the JSON report
+records the git commit so results can be compared across commits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fakes import FakeLLMServer, FakeMemoryClient, InMemoryFirestore, fake_embedding
+
+BENCH_CHANNEL_ID = "-100424242"
+
+SYNTHETIC_OPINIONS = [
+    "gm everyone", "lol", "what do you think about the new L2 rollups?",
+    "anyone here still holding their 2021 NFTs?", "is restaking actually safe long term?",
+    "how does the new token unlock schedule work?", "feels like the bear market never ends",
+    "can someone explain MEV in simple terms?", "wagmi", "which wallet do you guys use for defi?",
+]
+SYNTHETIC_REALTIME = [
+    "what's the current price of ETH?", "any latest news on the SEC case?",
+    "did binance just announce a new listing?", "what's BTC doing right now?",
+]
+
+
+def bench_environment(llm_server: FakeLLMServer, log_level: str) -> dict:
+    """Environment for config/settings.py: dummy credentials, fake endpoints, no side channels."""
+    return {
+        "OPENAI_API_KEY": "sk-bench",
+        "X_API_KEY": "xai-bench",
+        "MEM0_API_KEY": "m0-bench",
+        "OPENAI_API_BASE": llm_server.openai_base,
+        "XAI_API_BASE": llm_server.xai_base,
+        "INGESTOR_BOT_USER": "bench_ingestor",
+        "SENDER_BOT_USERS": "bench_sender",
+        "TELEGRAM_USER_bench_ingestor_API_ID": "1",
+        "TELEGRAM_USER_bench_ingestor_API_HASH": "bench",
+        "TELEGRAM_USER_bench_sender_API_ID": "1",
+        "TELEGRAM_USER_bench_sender_API_HASH": "bench",
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_APP_TOKEN": "xapp-bench",
+        "TELEGRAM_GROUP_ID": BENCH_CHANNEL_ID,
+        "RANDOM_RESPONSE_RATE": "1.0",
+        "MIN_INITIATE_HOURS": "1000",
+        "METRICS_PORT": "0",
+        "PERSONA_RELOAD_INTERVAL_SECS": "0",
+        "DEFERRED_BACKEND": "local",
+        "LOG_LEVEL": log_level,
+    }
+
+
+def synthetic_stream(count: int, realtime_ratio: float, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        pool = SYNTHETIC_REALTIME if rng.random() < realtime_ratio else SYNTHETIC_OPINIONS
+        messages.append({"text": rng.choice(pool), "sender_id": str(1000 + rng.randrange(25))})
+    return messages
+
+
+def load_replay(path: str, limit: int | None) -> list[dict]:
+    """Reads recorded messages, one JSON object per line with at least a 'text' key."""
+    messages = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                messages.append({"text": record["text"], "sender_id": str(record.get("sender_id", "replay"))})
+    return messages[:limit] if limit else messages
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class TimedQueue(asyncio.Queue):
+    """
+    brain_queue stand-in that records enqueue-to-task_done latency. The brain
+    has a single consumer, so items complete in the order they were put.
+    """
+    def __init__(self):
+        super().__init__()
+        self.pending_since: list[float] = []
+        self.latencies: list[float] = []
+
+    def put_nowait(self, item):
+        self.pending_since.append(time.perf_counter())
+        super().put_nowait(item)
+
+    def task_done(self):
+        self.latencies.append(time.perf_counter() - self.pending_since.pop(0))
+        super().task_done()
+
+
+async def drain(queue: asyncio.Queue, sink: list, moderation_gate, pacer=None):
+    """Stands in for a sender: applies the send-time moderation gate, then records the reply."""
+    from src.services.metrics import track_stage
+    from src.services.tracing import record_wait, set_trace
+
+    async def deliver(payload: dict):
+        with track_stage("sender", "moderation"):
+            allowed = await moderation_gate.allow(payload.get("message"))
+        if allowed:
+            if payload.get("reply_to_at"):
+                payload["delivered_after_s"] = time.time() - payload["reply_to_at"]
+            sink.append(payload)
+
+    if pacer:
+        await pacer.run(queue, deliver)
+    while True:
+        payload = await queue.get()
+        set_trace(payload.get("trace_id"))
+        record_wait("queue.sender", payload.get("queued_at"))
+        await deliver(payload)
+        queue.task_done()
+
+
+async def run_pipeline(args, messages: list[dict], llm_server: FakeLLMServer) -> dict:
+    # Imported only now: config/settings.py reads the environment prepared in main().
+    from src.core_logic import memory, response_logic
+    from src.core_logic.internal_message import InternalMessage
+    from src.core_logic.llm_personas import PersonaManager
+    from src.services.metrics import STAGE_DURATION
+    from src.services.moderation import moderation_gate
+    from src.services.state_manager import StateManager
+    from src.services.tracing import trace_writer_worker
+    from src.services.usage import LLM_COST
+    from src.core_logic.model_cascade import CASCADE_REPLIES
+    from src.services.storage.firestore_backend import FirestoreStorage
+    from src.services.storage.sqlite_backend import SQLiteStorage
+    from src.workers.brain import brain_worker
+
+    firestore = InMemoryFirestore(latency_ms=args.firestore_latency_ms)
+    db = SQLiteStorage(args.sqlite_path) if args.storage == "sqlite" else FirestoreStorage(firestore)
+    mem0 = FakeMemoryClient(latency_ms=args.memory_latency_ms)
+    memory.set_memory_client(mem0)
+
+    persona_manager = PersonaManager()
+    response_logic.PERSONA_EMBEDDINGS = {
+        p['persona_name']: fake_embedding(persona_manager.get_persona_profile(p, detailed=True)).tolist()
+        for p in persona_manager.all_personas
+    }
+    state_manager = StateManager(db)
+
+    brain_queue = TimedQueue()
+    sender_queues = {name: asyncio.Queue() for name in ("telegram_sender_queue", "slack_sender_queue", "discord_sender_queue")}
+    replies: list = []
+    pacers = {}
+    if args.send_delay:
+        from src.senders.pacing import SendPacer
+        min_delay, max_delay = (float(value) for value in args.send_delay.split(","))
+        pacers = {name: SendPacer("sender", min_delay, max_delay, lane=lambda msg: msg.get("telegram_user") or "")
+                  for name in sender_queues}
+    workers = [asyncio.create_task(drain(q, replies, moderation_gate, pacers.get(name))) for name, q in sender_queues.items()]
+    if args.trace_dir:
+        workers.append(asyncio.create_task(trace_writer_worker()))
+    workers.append(asyncio.create_task(brain_worker(brain_queue, sender_queues, persona_manager, state_manager, db)))
+
+    llm_server.reset_counters()
+    firestore_calls_before = firestore.calls
+    firestore_reads_before = firestore.reads
+    interval = 1.0 / args.rate if args.rate > 0 else 0.0
+    started = time.perf_counter()
+    for i, record in enumerate(messages):
+        brain_queue.put_nowait(InternalMessage(
+            platform='telegram',
+            channel_id=BENCH_CHANNEL_ID,
+            message_id=f"bench-{i}",
+            text=record["text"],
+            sender_id=record["sender_id"],
+        ))
+        if interval:
+            await asyncio.sleep(max(0.0, started + (i + 1) * interval - time.perf_counter()))
+    await brain_queue.join()
+    elapsed = time.perf_counter() - started
+    for queue in sender_queues.values():
+        await queue.join()
+
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    db.close()
+
+    latencies = sorted(brain_queue.latencies)
+    deliveries = sorted(payload["delivered_after_s"] for payload in replies if "delivered_after_s" in payload)
+    count = len(messages)
+    llm_calls = llm_server.calls["openai_chat"] + llm_server.calls["grok_chat"]
+    stages = {}
+    for (component, stage), child in STAGE_DURATION._children.items():
+        if child.count:
+            stages[f"{component}.{stage}"] = {"count": child.count, "mean_ms": round(child.sum / child.count * 1000, 2)}
+
+    return {
+        "messages": count,
+        "replies": len(replies),
+        "elapsed_s": round(elapsed, 3),
+        "messages_per_s": round(count / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+        },
+        "reply_delivery_s": {
+            "p50": round(percentile(deliveries, 50), 3),
+            "p95": round(percentile(deliveries, 95), 3),
+        },
+        "llm_calls_per_message": round(llm_calls / count, 3) if count else 0.0,
+        "llm_cost_per_message_usd": round(sum(child.value for child in LLM_COST._children.values()) / count, 6) if count else 0.0,
+        "provider_calls": dict(llm_server.calls),
+        "memory_calls": dict(mem0.calls),
+        "storage": db.name,
+        "firestore_calls": firestore.calls - firestore_calls_before,
+        "firestore_reads": firestore.reads - firestore_reads_before,
+        "stages": dict(sorted(stages.items())),
+        "cascade_replies": {"/".join(labels): int(child.value) for labels, child in sorted(CASCADE_REPLIES._children.items())},
+    }
+
+
+def print_report(report: dict, baseline: dict | None):
+    results = report["results"]
+    print(f"\n=== Pipeline benchmark @ {report['meta']['commit']} ({results.get('storage', 'firestore')} storage) ===")
+    rows = [
+        ("messages/s", results["messages_per_s"], "messages_per_s"),
+        ("p50 latency (ms)", results["latency_ms"]["p50"], "latency_ms.p50"),
+        ("p95 latency (ms)", results["latency_ms"]["p95"], "latency_ms.p95"),
+        ("p99 latency (ms)", results["latency_ms"]["p99"], "latency_ms.p99"),
+        ("p50 delivery (s)", results.get("reply_delivery_s", {}).get("p50", 0.0), "reply_delivery_s.p50"),
+        ("p95 delivery (s)", results.get("reply_delivery_s", {}).get("p95", 0.0), "reply_delivery_s.p95"),
+        ("LLM calls/message", results["llm_calls_per_message"], "llm_calls_per_message"),
+        ("LLM $/message", results.get("llm_cost_per_message_usd", 0.0), "llm_cost_per_message_usd"),
+        ("Firestore calls", results["firestore_calls"], "firestore_calls"),
+        ("Firestore doc reads", results["firestore_reads"], "firestore_reads"),
+    ]
+    for label, value, key in rows:
+        line = f"{label:<22}{value:>12}"
+        if baseline:
+            old = baseline["results"]
+            for part in key.split("."):
+                old = old.get(part, {}) if isinstance(old, dict) else {}
+            if isinstance(old, (int, float)) and old:
+                line += f"   (baseline {old}, {100.0 * (value - old) / old:+.1f}%)"
+        print(line)
+    print(f"{'replies queued':<22}{results['replies']:>12}")
+    print("\nStage means (ms):")
+    for stage, data in results["stages"].items():
+        print(f"  {stage:<34}{data['mean_ms']:>10}  (n={data['count']})")
+    if results.get("cascade_replies"):
+        print("\nCascade replies (model/attempts/check):")
+        for key, value in results["cascade_replies"].items():
+            print(f"  {key:<34}{value:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the brain pipeline with stubbed providers.")
+    parser.add_argument("--messages", type=int, default=100, help="Number of synthetic messages (or replay limit).")
+    parser.add_argument("--replay", help="JSONL file of recorded messages to replay instead of synthetic ones.")
+    parser.add_argument("--realtime-ratio", type=float, default=0.2, help="Share of synthetic messages that are realtime queries.")
+    parser.add_argument("--rate", type=float, default=0.0, help="Arrival rate in messages/s (0 = enqueue everything at once).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chat-latency-ms", type=float, default=800)
+    parser.add_argument("--grok-latency-ms", type=float, default=1500)
+    parser.add_argument("--embedding-latency-ms", type=float, default=150)
+    parser.add_argument("--moderation-latency-ms", type=float, default=100)
+    parser.add_argument("--memory-latency-ms", type=float, default=250, help="Blocking latency of each fake mem0 call.")
+    parser.add_argument("--memory-backend", choices=("mem0", "local"), default="mem0",
+                        help="Memory backend: the fake mem0 client or the in-process vector store (not persisted).")
+    parser.add_argument("--no-cascade", action="store_true", help="Send every persona reply to the strongest model, as before the cascade.")
+    parser.add_argument("--firestore-latency-ms", type=float, default=20, help="Blocking latency of each fake Firestore call.")
+    parser.add_argument("--storage", choices=("firestore", "sqlite"), default="firestore",
+                        help="Storage backend: the in-memory Firestore fake or embedded SQLite.")
+    parser.add_argument("--sqlite-path", default=":memory:", help="SQLite database file for --storage sqlite.")
+    parser.add_argument("--send-delay", metavar="MIN,MAX",
+                        help="Pace replies like the senders, with these min and max delays in seconds (default: deliver at once).")
+    parser.add_argument("--trace-dir", help="Write message lifecycle traces (Chrome trace event JSON) to this directory.")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="Write the JSON report to this path.")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against.")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    messages = load_replay(args.replay, args.messages) if args.replay else synthetic_stream(args.messages, args.realtime_ratio, args.seed)
+
+    llm_server = FakeLLMServer(seed=args.seed, chat_latency_ms=args.chat_latency_ms,
+                               grok_latency_ms=args.grok_latency_ms,
+                               embedding_latency_ms=args.embedding_latency_ms,
+                               moderation_latency_ms=args.moderation_latency_ms).start()
+    os.environ.update(bench_environment(llm_server, args.log_level))
+    os.environ.update({"MEMORY_BACKEND": args.memory_backend, "MEMORY_STORE_PATH": "",
+                       "CASCADE_ENABLED": "false" if args.no_cascade else "true"})
+    if args.trace_dir:
+        os.environ.update({"TRACE_DIR": args.trace_dir, "NODE_ID": "bench"})
+
+    from src.services.structured_logging import setup_logging, shutdown_logging
+    setup_logging()
+    try:
+        results = asyncio.run(run_pipeline(args, messages, llm_server))
+    finally:
+        shutdown_logging()
+        llm_server.stop()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "options": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "results": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("options") != report["meta"]["options"]:
+            print("WARNING: baseline was recorded with different options; deltas are not comparable.")
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
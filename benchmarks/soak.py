@@ -0,0 +1,296 @@
+# benchmarks/soak.py
+"""
+Long-running soak test: drives the real listeners, brain, scheduler and senders
+against local fake Telegram, Slack and Discord endpoints at a high message
+rate and tracks process resources over (simulated) time.
+
+Telethon speaks MTProto and discord.py needs a gateway session, so Telegram and
+Discord are faked at the client-object level. Slack goes through the real
+AsyncWebClient against a local HTTP endpoint, so its per-call HTTP sessions and
+sockets are exercised for real.
+
+Usage:
+    python -m benchmarks.soak --sim-hours 6 --msgs-per-sim-min 10 --speedup 60 --timeline soak.csv
+
+The run fails (exit code 1) if RSS, asyncio task count, open sockets or queue
+depths keep growing beyond the configured bounds after the warm-up phase.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fakes import (FakeDiscordClient, FakeLLMServer, FakeMemoryClient, FakeSlackAPI, FakeSlackApp,
+                              FakeTelegramClient, InMemoryFirestore, fake_embedding)
+from benchmarks.pipeline_bench import SYNTHETIC_OPINIONS, SYNTHETIC_REALTIME, bench_environment
+
+TELEGRAM_CHAT_ID = -100424242
+SLACK_CHANNEL_ID = "CSOAK0001"
+DISCORD_CHANNEL_ID = 424242424242
+
+
+# --- Resource probes ---
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    # Not Linux: fall back to the peak RSS, which still catches steady growth.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def open_sockets() -> int:
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return -1
+    count = 0
+    for fd in fds:
+        try:
+            if os.readlink(f"/proc/self/fd/{fd}").startswith("socket:"):
+                count += 1
+        except OSError:
+            continue
+    return count
+
+
+def queue_depths() -> dict[str, float]:
+    from src.services.metrics import QUEUE_DEPTH
+    depths = {}
+    for (name,), child in QUEUE_DEPTH._children.items():
+        depths[name] = child.callback() if child.callback else child.value
+    return depths
+
+
+# --- Load generation ---
+async def drive_platforms(args, telegram: FakeTelegramClient, slack: FakeSlackApp, discord_client: FakeDiscordClient,
+                          stop_at: float, counters: dict):
+    rng = random.Random(args.seed)
+    interval = 60.0 / (args.msgs_per_sim_min * args.speedup)
+    next_at = time.perf_counter()
+    message_id = 0
+    while time.perf_counter() < stop_at:
+        message_id += 1
+        pool = SYNTHETIC_REALTIME if rng.random() < args.realtime_ratio else SYNTHETIC_OPINIONS
+        text = rng.choice(pool)
+        sender = 1000 + rng.randrange(50)
+        target = rng.choices(("telegram", "slack", "discord"), weights=args.platform_weights)[0]
+        if target == "telegram":
+            await telegram.emit_message(message_id, TELEGRAM_CHAT_ID, sender, text)
+        elif target == "slack":
+            await slack.emit_message(SLACK_CHANNEL_ID, f"U{sender}", text, f"{time.time():.6f}")
+        else:
+            await discord_client.emit_message(10**12 + message_id, DISCORD_CHANNEL_ID, sender, text)
+        counters[target] += 1
+        next_at += interval
+        await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+
+async def sample_resources(args, started: float, stop_at: float, samples: list):
+    while True:
+        now = time.perf_counter()
+        sample = {
+            "elapsed_s": round(now - started, 2),
+            "sim_hours": round((now - started) * args.speedup / 3600.0, 3),
+            "rss_mb": round(rss_mb(), 2),
+            "tasks": len(asyncio.all_tasks()),
+            "sockets": open_sockets(),
+        }
+        sample.update({f"queue:{name}": depth for name, depth in queue_depths().items()})
+        samples.append(sample)
+        if now >= stop_at:
+            return
+        await asyncio.sleep(min(args.sample_interval, max(0.0, stop_at - now)))
+
+
+# --- Verdict ---
+def check_bounds(args, samples: list) -> list[str]:
+    """Compares the end of the run with the end of the warm-up phase."""
+    if len(samples) < 4:
+        return ["Not enough samples to judge growth; run longer or sample more often."]
+    warmup_end = max(1, int(len(samples) * args.warmup_fraction))
+    window = max(1, len(samples) // 5)
+    baseline = samples[max(0, warmup_end - window):warmup_end]
+    final = samples[-window:]
+
+    def median(rows, key):
+        return statistics.median(row.get(key, 0) for row in rows)
+
+    failures = []
+    checks = [("rss_mb", args.max_rss_growth_mb, "MB"), ("tasks", args.max_task_growth, "tasks"),
+              ("sockets", args.max_socket_growth, "sockets")]
+    for key, bound, unit in checks:
+        growth = median(final, key) - median(baseline, key)
+        if growth > bound:
+            failures.append(f"{key} grew by {growth:.1f} {unit} after warm-up (bound {bound}).")
+    for key in sorted(k for k in samples[-1] if k.startswith("queue:")):
+        depth = median(final, key)
+        if depth > args.max_queue_depth:
+            failures.append(f"{key[6:]} holds {depth:.0f} items at the end of the run (bound {args.max_queue_depth}).")
+    return failures
+
+
+async def run_soak(args) -> tuple[list, dict]:
+    # Imported only now: config/settings.py reads the environment prepared in main().
+    from slack_sdk.web.async_client import AsyncWebClient
+
+    from src.core_logic import memory, response_logic
+    from src.core_logic.llm_personas import PersonaManager
+    from src.listeners.discord_listener import setup_discord_listener
+    from src.listeners.slack_listener import slack_listener_worker
+    from src.listeners.telegram_listener import setup_telegram_listener
+    from src.senders.discord_sender import discord_sender_worker
+    from src.senders.slack_sender import slack_sender_worker
+    from src.senders.telegram_sender import telegram_sender_worker
+    from src.services.metrics import register_queue
+    from src.services.state_manager import StateManager
+    from src.services.storage.firestore_backend import FirestoreStorage
+    from src.core_logic.inactivity import InactivityTracker
+    from src.workers.brain import brain_worker
+    from src.workers.deferred import deferred_generation_worker
+    from src.workers.scheduler import scheduler_worker
+
+    db = FirestoreStorage(InMemoryFirestore(max_docs_per_collection=2000))
+    memory.set_memory_client(FakeMemoryClient())
+    persona_manager = PersonaManager()
+    response_logic.PERSONA_EMBEDDINGS = {
+        p['persona_name']: fake_embedding(persona_manager.get_persona_profile(p, detailed=True)).tolist()
+        for p in persona_manager.all_personas
+    }
+    state_manager = StateManager(db)
+
+    brain_queue = asyncio.Queue()
+    sender_queues = {name: asyncio.Queue() for name in ("telegram_sender_queue", "slack_sender_queue", "discord_sender_queue")}
+    register_queue("brain_queue", brain_queue)
+    for name, queue in sender_queues.items():
+        register_queue(name, queue)
+
+    slack_api = FakeSlackAPI().start()
+    telegram = FakeTelegramClient()
+    slack_app = FakeSlackApp(AsyncWebClient(token="xoxb-soak", base_url=slack_api.base_url))
+    discord_client = FakeDiscordClient()
+    # Every persona posts through its own Telegram account; all of them share the fake client.
+    telegram_senders = {p['telegram_user']: telegram for p in persona_manager.all_personas if p.get('telegram_user')}
+    telegram_senders.update({user: telegram for user in os.environ["SENDER_BOT_USERS"].split(",")})
+
+    inactivity = InactivityTracker(state_manager)
+    setup_telegram_listener(telegram, brain_queue, frozenset({str(TELEGRAM_CHAT_ID)}))
+    setup_discord_listener(discord_client, brain_queue, frozenset({str(DISCORD_CHANNEL_ID)}))
+    workers = [
+        asyncio.create_task(slack_listener_worker(slack_app, brain_queue, frozenset({SLACK_CHANNEL_ID}))),
+        asyncio.create_task(brain_worker(brain_queue, sender_queues, persona_manager, state_manager, db, inactivity)),
+        asyncio.create_task(deferred_generation_worker(state_manager, db, inactivity)),
+        asyncio.create_task(scheduler_worker(sender_queues, persona_manager, state_manager, db)),
+        asyncio.create_task(telegram_sender_worker(sender_queues["telegram_sender_queue"], telegram_senders)),
+        asyncio.create_task(slack_sender_worker(sender_queues["slack_sender_queue"], slack_app.client)),
+        asyncio.create_task(discord_sender_worker(sender_queues["discord_sender_queue"], discord_client)),
+    ]
+
+    duration = args.sim_hours * 3600.0 / args.speedup
+    started = time.perf_counter()
+    stop_at = started + duration
+    counters = {"telegram": 0, "slack": 0, "discord": 0}
+    samples: list = []
+    try:
+        await asyncio.gather(
+            drive_platforms(args, telegram, slack_app, discord_client, stop_at, counters),
+            sample_resources(args, started, stop_at, samples),
+        )
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        slack_api.stop()
+
+    delivered = {
+        "telegram": sum(telegram.sent.values()),
+        "slack": sum(slack_api.posted.values()),
+        "discord": sum(channel.sent for channel in discord_client.channels.values()),
+    }
+    return samples, {"emitted": counters, "delivered": delivered}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Soak test with fake platforms and resource tracking.")
+    parser.add_argument("--sim-hours", type=float, default=2.0, help="Simulated wall-clock hours to cover.")
+    parser.add_argument("--msgs-per-sim-min", type=float, default=6.0, help="Incoming messages per simulated minute.")
+    parser.add_argument("--speedup", type=float, default=30.0, help="Simulated seconds per real second.")
+    parser.add_argument("--platform-weights", type=float, nargs=3, default=(0.5, 0.3, 0.2),
+                        metavar=("TELEGRAM", "SLACK", "DISCORD"))
+    parser.add_argument("--realtime-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-latency-ms", type=float, default=20)
+    parser.add_argument("--sample-interval", type=float, default=5.0, help="Seconds between resource samples.")
+    parser.add_argument("--warmup-fraction", type=float, default=0.2)
+    parser.add_argument("--max-rss-growth-mb", type=float, default=50.0)
+    parser.add_argument("--max-task-growth", type=float, default=10)
+    parser.add_argument("--max-socket-growth", type=float, default=10)
+    parser.add_argument("--max-queue-depth", type=float, default=50)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--timeline", help="Write resource samples to this CSV file.")
+    parser.add_argument("--output", help="Write the JSON summary to this path.")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    llm_server = FakeLLMServer(seed=args.seed, chat_latency_ms=args.llm_latency_ms, grok_latency_ms=args.llm_latency_ms,
+                               embedding_latency_ms=args.llm_latency_ms / 4, moderation_latency_ms=args.llm_latency_ms / 4).start()
+    env = bench_environment(llm_server, args.log_level)
+    env.update({
+        "TELEGRAM_GROUP_ID": str(TELEGRAM_CHAT_ID),
+        "SLACK_CHANNEL_ID": SLACK_CHANNEL_ID,
+        "DISCORD_BOT_TOKEN": "discord-soak",
+        "DISCORD_CHANNEL_ID": str(DISCORD_CHANNEL_ID),
+        # Human-like send delays would only measure sleeping; the soak is about growth.
+        "MIN_SEND_DELAY_SECS": "0",
+        "MAX_SEND_DELAY_SECS": "0",
+        "DISCORD_MIN_SEND_DELAY_SECS": "0",
+        "DISCORD_MAX_SEND_DELAY_SECS": "0",
+        "DEFERRED_SUBMIT_INTERVAL_SECS": "2",
+    })
+    os.environ.update(env)
+
+    from src.services.structured_logging import setup_logging, shutdown_logging
+    setup_logging()
+    try:
+        samples, traffic = asyncio.run(run_soak(args))
+    finally:
+        shutdown_logging()
+        llm_server.stop()
+
+    failures = check_bounds(args, samples)
+    first, last = samples[0], samples[-1]
+    print(f"\n=== Soak test: {args.sim_hours} simulated hours in {last['elapsed_s']}s ===")
+    print(f"Traffic emitted:   {traffic['emitted']}")
+    print(f"Replies delivered: {traffic['delivered']}")
+    for key in [k for k in last if k not in ("elapsed_s", "sim_hours")]:
+        print(f"  {key:<34}{first[key]:>10} -> {last[key]:>10}")
+    print("RESULT:", "FAIL" if failures else "PASS")
+    for failure in failures:
+        print(f"  - {failure}")
+
+    if args.timeline:
+        fieldnames = sorted({key for sample in samples for key in sample}, key=lambda k: (k.startswith("queue:"), k))
+        with open(args.timeline, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(samples)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"options": vars(args), "traffic": traffic, "failures": failures, "samples": samples}, f, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 # config/settings.py
 import json
 import os
+import socket
 from dotenv import load_dotenv
 
 project_root = os.path.join(os.path.dirname(__file__), '..')
@@ -30,16 +31,114 @@ APP_CONFIG = {
     "min_initiate_hours": float(os.getenv("MIN_INITIATE_HOURS", 1.0)),
     "min_send_delay_secs": float(os.getenv("MIN_SEND_DELAY_SECS", 5.0)),
     "max_send_delay_secs": float(os.getenv("MAX_SEND_DELAY_SECS", 15.0)),
+    "discord_min_send_delay_secs": float(os.getenv("DISCORD_MIN_SEND_DELAY_SECS", 1.0)),
+    "discord_max_send_delay_secs": float(os.getenv("DISCORD_MAX_SEND_DELAY_SECS", 3.0)),
+    "send_typing_chars_per_sec": float(os.getenv("SEND_TYPING_CHARS_PER_SEC", 5.0)),
+    "send_reaction_secs": float(os.getenv("SEND_REACTION_SECS", 2.0)),
+    "send_error_backoff_secs": float(os.getenv("SEND_ERROR_BACKOFF_SECS", 10.0)),
     "random_response_rate": float(os.getenv("RANDOM_RESPONSE_RATE", 1.0)),
+    "inactivity_persist_interval_secs": float(os.getenv("INACTIVITY_PERSIST_INTERVAL_SECS", 60)),
     "xai_api_key": os.getenv("X_API_KEY"),
+    "openai_api_base": os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1"),
+    "xai_api_base": os.getenv("XAI_API_BASE", "https://api.x.ai/v1"),
     "triage_model": os.getenv("TRIAGE_MODEL", "gpt-3.5-turbo"),
     "response_context_messages": int(os.getenv("RESPONSE_CONTEXT_MESSAGES",4)),
     "link_post_cooldown_mins": int(os.getenv("LINK_POST_COOLDOWN_MINS", 15)),
+    "link_prepare_lead_secs": float(os.getenv("LINK_PREPARE_LEAD_SECS", 120)),
+    "link_prepared_max_age_secs": float(os.getenv("LINK_PREPARED_MAX_AGE_SECS", 900)),
     "slack_bot_token": os.getenv("SLACK_BOT_TOKEN"),
     "slack_app_token": os.getenv("SLACK_APP_TOKEN"),
     "slack_channel_id": os.getenv("SLACK_CHANNEL_ID"),
     "discord_bot_token": os.getenv("DISCORD_BOT_TOKEN"),
     "discord_channel_id": os.getenv("DISCORD_CHANNEL_ID"),
+    "persona_reload_interval_secs": float(os.getenv("PERSONA_RELOAD_INTERVAL_SECS", 10)),
+    "metrics_host": os.getenv("METRICS_HOST", "127.0.0.1"),
+    "metrics_port": int(os.getenv("METRICS_PORT", 9108)),
+    "log_level": os.getenv("LOG_LEVEL", "INFO").upper(),
+    "log_format": os.getenv("LOG_FORMAT", "text"),
+    "log_prompts": os.getenv("LOG_PROMPTS", "false").lower() in ("1", "true", "yes"),
+    "log_payload_sample_rate": float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", 1.0)),
+    "log_max_payload_chars": int(os.getenv("LOG_MAX_PAYLOAD_CHARS", 300)),
+    "log_max_message_chars": int(os.getenv("LOG_MAX_MESSAGE_CHARS", 2000)),
+    "fact_cache_enabled": os.getenv("FACT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "fact_cache_similarity": float(os.getenv("FACT_CACHE_SIMILARITY", 0.9)),
+    "fact_cache_max_entries": int(os.getenv("FACT_CACHE_MAX_ENTRIES", 256)),
+    # Seconds a raw Grok fact stays fresh, per query category ("category=secs,...").
+    "fact_cache_ttls": {
+        name.strip(): float(secs)
+        for name, secs in (item.split("=", 1) for item in os.getenv("FACT_CACHE_TTLS", "price=60,news=600,default=180").split(",") if "=" in item)
+    },
+    "topic_dedupe_similarity": float(os.getenv("TOPIC_DEDUPE_SIMILARITY", 0.85)),
+    "topic_dedupe_half_life_hours": float(os.getenv("TOPIC_DEDUPE_HALF_LIFE_HOURS", 72)),
+    "topic_index_max_entries": int(os.getenv("TOPIC_INDEX_MAX_ENTRIES", 1000)),
+    "channel_summary_enabled": os.getenv("CHANNEL_SUMMARY_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "channel_summary_every_messages": int(os.getenv("CHANNEL_SUMMARY_EVERY_MESSAGES", 20)),
+    "channel_summary_max_hooks": int(os.getenv("CHANNEL_SUMMARY_MAX_HOOKS", 8)),
+    "channel_summary_hook_max_age_hours": float(os.getenv("CHANNEL_SUMMARY_HOOK_MAX_AGE_HOURS", 48)),
+    "channel_summary_retry_secs": float(os.getenv("CHANNEL_SUMMARY_RETRY_SECS", 300)),
+    "summary_model": os.getenv("SUMMARY_MODEL", "gpt-4o-mini"),
+    "storage_backend": os.getenv("STORAGE_BACKEND", "firestore").lower(),
+    "sqlite_path": os.getenv("SQLITE_PATH", os.path.join(project_root, 'data', 'bot_storage.sqlite3')),
+    "sqlite_batch_size": int(os.getenv("SQLITE_BATCH_SIZE", 100)),
+    "sqlite_commit_interval_ms": float(os.getenv("SQLITE_COMMIT_INTERVAL_MS", 50)),
+    "journal_enabled": os.getenv("JOURNAL_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "journal_fsync_interval_secs": float(os.getenv("JOURNAL_FSYNC_INTERVAL_SECS", 1.0)),
+    "journal_segment_bytes": int(os.getenv("JOURNAL_SEGMENT_BYTES", 4 * 1024 * 1024)),
+    "journal_max_segments": int(os.getenv("JOURNAL_MAX_SEGMENTS", 8)),
+    "moderation_enabled": os.getenv("MODERATION_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "moderation_batch_window_ms": float(os.getenv("MODERATION_BATCH_WINDOW_MS", 20)),
+    "moderation_max_batch": int(os.getenv("MODERATION_MAX_BATCH", 32)),
+    "moderation_cache_size": int(os.getenv("MODERATION_CACHE_SIZE", 2048)),
+    "loop_monitor_enabled": os.getenv("LOOP_MONITOR_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "loop_monitor_interval_ms": float(os.getenv("LOOP_MONITOR_INTERVAL_MS", 50)),
+    "loop_block_threshold_ms": float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", 100)),
+    "loop_monitor_report_interval_secs": float(os.getenv("LOOP_MONITOR_REPORT_INTERVAL_SECS", 300)),
+    "loop_monitor_top_n": int(os.getenv("LOOP_MONITOR_TOP_N", 10)),
+    "trace_enabled": os.getenv("TRACE_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "trace_dir": os.getenv("TRACE_DIR", os.path.join(project_root, 'data', 'traces')),
+    "trace_sample_rate": float(os.getenv("TRACE_SAMPLE_RATE", 1.0)),
+    "trace_max_file_mb": float(os.getenv("TRACE_MAX_FILE_MB", 50)),
+    "trace_flush_interval_secs": float(os.getenv("TRACE_FLUSH_INTERVAL_SECS", 1.0)),
+    "usage_hourly_budget_usd": float(os.getenv("USAGE_HOURLY_BUDGET_USD", 0)),
+    "usage_daily_budget_usd": float(os.getenv("USAGE_DAILY_BUDGET_USD", 0)),
+    "usage_economy_at": float(os.getenv("USAGE_ECONOMY_AT", 0.8)),
+    "usage_prices": json.loads(os.getenv("USAGE_PRICES") or "{}"),
+    "usage_persist_interval_secs": float(os.getenv("USAGE_PERSIST_INTERVAL_SECS", 60)),
+    "economy_model": os.getenv("ECONOMY_MODEL", "gpt-4o-mini"),
+    "cascade_enabled": os.getenv("CASCADE_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "cascade_models": [m.strip() for m in os.getenv("CASCADE_MODELS", "gpt-4o-mini,gpt-4o,gpt-4").split(",") if m.strip()],
+    "cascade_short_message_chars": int(os.getenv("CASCADE_SHORT_MESSAGE_CHARS", 40)),
+    "cascade_long_message_chars": int(os.getenv("CASCADE_LONG_MESSAGE_CHARS", 280)),
+    "cascade_min_triage_confidence": float(os.getenv("CASCADE_MIN_TRIAGE_CONFIDENCE", 0.75)),
+    "deferred_generation_enabled": os.getenv("DEFERRED_GENERATION_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "deferred_backend": os.getenv("DEFERRED_BACKEND", "openai").lower(),
+    "deferred_lead_secs": float(os.getenv("DEFERRED_LEAD_SECS", 1800)),
+    "deferred_submit_interval_secs": float(os.getenv("DEFERRED_SUBMIT_INTERVAL_SECS", 60)),
+    "deferred_max_age_secs": float(os.getenv("DEFERRED_MAX_AGE_SECS", 7200)),
+    "deferred_max_batch": int(os.getenv("DEFERRED_MAX_BATCH", 50)),
+    "memory_backend": os.getenv("MEMORY_BACKEND", "mem0").lower(),
+    "memory_store_path": os.getenv("MEMORY_STORE_PATH", os.path.join(project_root, 'data', 'memory', 'memories.jsonl')),
+    "memory_vector_dtype": os.getenv("MEMORY_VECTOR_DTYPE", "float32").lower(),
+    "memory_retention_days": float(os.getenv("MEMORY_RETENTION_DAYS", 90)),
+    "memory_max_per_user": int(os.getenv("MEMORY_MAX_PER_USER", 500)),
+    "memory_min_score": float(os.getenv("MEMORY_MIN_SCORE", 0.3)),
+    "catchup_enabled": os.getenv("CATCHUP_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "catchup_max_messages": int(os.getenv("CATCHUP_MAX_MESSAGES", 500)),
+    "catchup_max_age_hours": float(os.getenv("CATCHUP_MAX_AGE_HOURS", 24)),
+    "catchup_batch_size": int(os.getenv("CATCHUP_BATCH_SIZE", 100)),
+    "history_tail_size": int(os.getenv("HISTORY_TAIL_SIZE", 120)),
+    "history_cache_ttl_secs": float(os.getenv("HISTORY_CACHE_TTL_SECS", 300)),
+    "history_tail_flush_messages": int(os.getenv("HISTORY_TAIL_FLUSH_MESSAGES", 20)),
+    "history_tail_flush_secs": float(os.getenv("HISTORY_TAIL_FLUSH_SECS", 30)),
+    "history_bucket_max_messages": int(os.getenv("HISTORY_BUCKET_MAX_MESSAGES", 2000)),
+    "history_bucket_max_bytes": int(os.getenv("HISTORY_BUCKET_MAX_BYTES", 512 * 1024)),
+    "sharding_enabled": os.getenv("SHARDING_ENABLED", "false").lower() in ("1", "true", "yes"),
+    # Keys the node's journal and Telethon sessions when sharding, so it must survive restarts (see below).
+    "node_id": os.getenv("NODE_ID") or socket.gethostname(),
+    "shard_lease_ttl_secs": float(os.getenv("SHARD_LEASE_TTL_SECS", 30)),
+    "shard_renew_interval_secs": float(os.getenv("SHARD_RENEW_INTERVAL_SECS", 10)),
+    "shard_host": os.getenv("SHARD_HOST", "127.0.0.1"),
+    "shard_port": int(os.getenv("SHARD_PORT", 0)),
 }
 
 TELEGRAM_USERS = {}
@@ -63,6 +162,24 @@ if not APP_CONFIG["slack_bot_token"] or not APP_CONFIG["slack_app_token"]:
 if not APP_CONFIG["discord_bot_token"] or not APP_CONFIG["discord_channel_id"]:
     print("Warning: DISCORD_BOT_TOKEN or DISCORD_CHANNEL_ID not set. Discord functionality will be disabled.")
 
+if APP_CONFIG["storage_backend"] not in ("firestore", "sqlite"):
+    raise ValueError(f"CRITICAL: Unknown STORAGE_BACKEND '{APP_CONFIG['storage_backend']}'. Use 'firestore' or 'sqlite'.")
+if not APP_CONFIG["cascade_models"]:
+    raise ValueError("CRITICAL: CASCADE_MODELS must list at least one model, cheapest first.")
+if APP_CONFIG["send_typing_chars_per_sec"] <= 0:
+    raise ValueError("CRITICAL: SEND_TYPING_CHARS_PER_SEC must be positive.")
+if APP_CONFIG["deferred_backend"] not in ("openai", "local"):
+    raise ValueError(f"CRITICAL: Unknown DEFERRED_BACKEND '{APP_CONFIG['deferred_backend']}'. Use 'openai' or 'local'.")
+if APP_CONFIG["memory_backend"] not in ("mem0", "local"):
+    raise ValueError(f"CRITICAL: Unknown MEMORY_BACKEND '{APP_CONFIG['memory_backend']}'. Use 'mem0' or 'local'.")
+if APP_CONFIG["memory_vector_dtype"] not in ("float32", "int8"):
+    raise ValueError(f"CRITICAL: Unknown MEMORY_VECTOR_DTYPE '{APP_CONFIG['memory_vector_dtype']}'. Use 'float32' or 'int8'.")
+if APP_CONFIG["sharding_enabled"] and APP_CONFIG["storage_backend"] != "firestore":
+    raise ValueError("CRITICAL: SHARDING_ENABLED requires STORAGE_BACKEND=firestore; nodes share their leases and state there.")
+if APP_CONFIG["sharding_enabled"] and not os.getenv("NODE_ID"):
+    raise ValueError("CRITICAL: SHARDING_ENABLED requires NODE_ID, stable across restarts so a node finds its own journal "
+                     "(scripts/run_shards.py sets NODE_ID=<prefix>-<index>).")
+
 if APP_CONFIG["ingestor_bot_user"] not in TELEGRAM_USERS:
     raise ValueError(f"CRITICAL: Credentials for ingestor '{APP_CONFIG['ingestor_bot_user']}' are missing.")
 for user in APP_CONFIG["sender_bot_users"]:
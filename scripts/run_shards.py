@@ -0,0 +1,78 @@
+# scripts/run_shards.py
+"""
+Starts several bot nodes on this machine with sharding enabled.
+
+Each node is a separate `python -m src.main` process with its own NODE_ID,
+metrics port and shard port; channel ownership is negotiated through the
+lease table in Firestore. NODE_ID is `<prefix>-<index>` and is kept when a
+node is restarted, so the node replays its own journal. Use a distinct
+--node-prefix on each machine. Each node needs its own authorized Telethon session
+files, named `<user>.<node_id>.session` in the data directory (copy an
+authorized `<user>.session` to create them).
+
+Usage:
+    python scripts/run_shards.py --nodes 3
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several sharded bot nodes locally.")
+    parser.add_argument("--nodes", type=int, default=2)
+    parser.add_argument("--node-prefix", default="node")
+    parser.add_argument("--metrics-base-port", type=int, default=9108, help="Node i serves metrics on base + i (0 disables).")
+    parser.add_argument("--shard-base-port", type=int, default=9208, help="Node i serves the shard endpoint on base + i.")
+    parser.add_argument("--restart-delay", type=float, default=5.0, help="Seconds before restarting a node that exited.")
+    args = parser.parse_args()
+
+    def spawn(index: int) -> subprocess.Popen:
+        node_id = f"{args.node_prefix}-{index}"
+        env = dict(os.environ)
+        env.update({
+            "SHARDING_ENABLED": "true",
+            "NODE_ID": node_id,
+            "METRICS_PORT": str(args.metrics_base_port + index if args.metrics_base_port else 0),
+            "SHARD_PORT": str(args.shard_base_port + index),
+        })
+        print(f"Starting {node_id}...")
+        return subprocess.Popen([sys.executable, "-m", "src.main"], cwd=PROJECT_ROOT, env=env)
+
+    processes = {index: spawn(index) for index in range(args.nodes)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while not stopping:
+        time.sleep(1)
+        for index, process in list(processes.items()):
+            if process.poll() is not None and not stopping:
+                # The node's leases expire on their own and the other nodes take its channels meanwhile.
+                print(f"{args.node_prefix}-{index} exited with code {process.returncode}; restarting in {args.restart_delay}s.")
+                time.sleep(args.restart_delay)
+                processes[index] = spawn(index)
+
+    print("Stopping all nodes...")
+    for process in processes.values():
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+    for process in processes.values():
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+# src/core_logic/channel_registry.py
+"""
+Registry of the channels the bot serves, across all platforms.
+
+Channels come from config/channels.json (optional) plus the legacy
+TELEGRAM_GROUP_ID / SLACK_CHANNEL_ID / DISCORD_CHANNEL_ID values. Lookups are
+dict hits keyed by (platform, channel_id), and listeners filter against a
+precomputed set of ids per platform.
+
+channels.json format:
+    [
+      {"platform": "telegram", "channel_id": "-100123", "name": "main",
+       "personas": ["Crypto OG", "Meme Lord"], "random_response_rate": 0.5,
+       "min_initiate_hours": 4, "initiate": true, "reply_model": "gpt-4o"}
+    ]
+Every field except platform and channel_id is optional; missing values fall
+back to the global settings and an empty persona list allows every persona.
+"reply_model" pins persona replies to one model (see model_cascade.py).
+"""
+import json
+import logging
+import os
+from dataclasses import dataclass
+
+from config.settings import APP_CONFIG
+
+logger = logging.getLogger(__name__)
+
+CHANNELS_FILE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'config', 'channels.json')
+PLATFORMS = ("telegram", "slack", "discord")
+
+
+def channel_key(platform: str, channel_id) -> str:
+    return f"{platform}:{channel_id}"
+
+
+@dataclass(frozen=True)
+class ChannelConfig:
+    platform: str
+    channel_id: str
+    name: str = ""
+    personas: tuple[str, ...] = ()
+    random_response_rate: float | None = None
+    min_initiate_hours: float | None = None
+    initiate: bool = True
+    reply_model: str | None = None
+
+    @property
+    def key(self) -> str:
+        return channel_key(self.platform, self.channel_id)
+
+    @property
+    def response_rate(self) -> float:
+        if self.random_response_rate is not None:
+            return self.random_response_rate
+        return APP_CONFIG.get("random_response_rate", 1.0)
+
+    @property
+    def initiate_after_secs(self) -> float:
+        hours = self.min_initiate_hours if self.min_initiate_hours is not None else APP_CONFIG['min_initiate_hours']
+        return hours * 3600
+
+
+def _legacy_channels() -> list[ChannelConfig]:
+    # Before the registry only Telegram initiated topics; keep that for the env-configured channels.
+    legacy = [
+        ("telegram", APP_CONFIG.get("telegram_group_id"), True),
+        ("slack", APP_CONFIG.get("slack_channel_id"), False),
+        ("discord", APP_CONFIG.get("discord_channel_id"), False),
+    ]
+    return [ChannelConfig(platform, str(channel_id), initiate=initiate) for platform, channel_id, initiate in legacy if channel_id]
+
+
+def _parse_channel(entry: dict) -> ChannelConfig:
+    platform = entry["platform"]
+    if platform not in PLATFORMS:
+        raise ValueError(f"Unknown platform '{platform}'")
+    return ChannelConfig(
+        platform=platform,
+        channel_id=str(entry["channel_id"]),
+        name=entry.get("name", ""),
+        personas=tuple(entry.get("personas", ())),
+        random_response_rate=entry.get("random_response_rate"),
+        min_initiate_hours=entry.get("min_initiate_hours"),
+        initiate=entry.get("initiate", True),
+        reply_model=entry.get("reply_model"),
+    )
+
+
+class ChannelRegistry:
+    def __init__(self, file_path: str = CHANNELS_FILE_PATH, channels: list[ChannelConfig] | None = None):
+        self.file_path = file_path
+        self._channels: dict[tuple[str, str], ChannelConfig] = {}
+        self._by_id: dict[str, ChannelConfig] = {}
+        self._ids_by_platform: dict[str, frozenset[str]] = {}
+        self._load(self._read_file() if channels is None else channels)
+        logger.info("Registered %s channels: %s", len(self._channels),
+                    {platform: len(ids) for platform, ids in self._ids_by_platform.items()})
+
+    def _read_file(self) -> list[ChannelConfig]:
+        channels = []
+        if os.path.exists(self.file_path):
+            try:
+                with open(self.file_path, 'r', encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logger.error("Could not load '%s': %s. Using legacy channel settings only.", self.file_path, e)
+                entries = []
+            for entry in entries:
+                try:
+                    channels.append(_parse_channel(entry))
+                except (KeyError, TypeError, ValueError) as e:
+                    logger.error("Skipping invalid channel entry %s: %s", entry, e)
+        # File entries win over the legacy single-channel settings.
+        return channels + _legacy_channels()
+
+    def _load(self, channels: list[ChannelConfig]):
+        for channel in channels:
+            self._channels.setdefault((channel.platform, channel.channel_id), channel)
+        for channel in self._channels.values():
+            self._by_id.setdefault(channel.channel_id, channel)
+        self._ids_by_platform = {
+            platform: frozenset(channel_id for (p, channel_id) in self._channels if p == platform)
+            for platform in PLATFORMS
+        }
+
+    def get(self, platform: str, channel_id) -> ChannelConfig | None:
+        return self._channels.get((platform, str(channel_id)))
+
+    def lookup(self, channel_id) -> ChannelConfig | None:
+        """Finds a channel by id alone, for call sites that don't carry the platform."""
+        return self._by_id.get(str(channel_id))
+
+    def channel_ids(self, platform: str) -> frozenset[str]:
+        """The ids listeners accept for `platform`."""
+        return self._ids_by_platform.get(platform, frozenset())
+
+    def all(self) -> list[ChannelConfig]:
+        return list(self._channels.values())
+
+    def personas_for(self, channel_id) -> tuple[str, ...]:
+        channel = self.lookup(channel_id)
+        return channel.personas if channel else ()
+
+    def __len__(self) -> int:
+        return len(self._channels)
+
+
+channel_registry = ChannelRegistry()
@@ -0,0 +1,165 @@
+# src/core_logic/channel_summary.py
+"""
+Incrementally maintained per-channel summaries for topic initiation.
+
+Initiation used to read the last 100 messages and send a 3,000 character slice
+of them to the LLM. Instead, the brain notes every saved message here, and
+every CHANNEL_SUMMARY_EVERY_MESSAGES messages a background task folds just the
+new ones into the channel's running summary. The summary keeps a short list of
+"hooks": unresolved threads with the time of their latest message. Initiation
+then reads the summary from memory (or one state document after a restart).
+
+Summary document (bot_state_prod/summaries/entries/{platform:channel_id}):
+    {"summary": "...", "hooks": [{"hook": "...", "last_message_at": 1718000000.0}],
+     "updated_at": 1718000000.0, "messages_folded": 340}
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from datetime import datetime, timezone
+
+from config.settings import APP_CONFIG
+from src.core_logic.channel_registry import channel_key
+from src.core_logic.internal_message import InternalMessage
+from src.services.metrics import Counter, track_stage
+from src.services.openai_chat import get_llm_response
+from src.services.state_manager import StateManager
+from src.services.usage import set_usage_channel, usage_ledger
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_UPDATES = Counter(
+    "bot_channel_summary_updates_total",
+    "Rolling channel summary updates by outcome (updated, failed).",
+    ("outcome",))
+
+TIME_FORMAT = "%Y-%m-%d %H:%M"
+MAX_PENDING_MESSAGES = 200
+# A reply wrapped in a ```json ... ``` fence.
+FENCED_JSON = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(TIME_FORMAT)
+
+
+def _parse_time(value, default: float) -> float:
+    try:
+        return datetime.strptime(str(value), TIME_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return default
+
+
+def _parse_reply(response: str) -> dict:
+    fenced = FENCED_JSON.match(response)
+    return json.loads(fenced.group(1) if fenced else response)
+
+
+def format_hooks(summary: dict) -> str:
+    return "\n".join(f"- [{_format_time(h['last_message_at'])} UTC] {h['hook']}" for h in summary.get("hooks", []))
+
+
+class ChannelSummarizer:
+    """Running summaries per channel. All methods run on the event loop thread."""
+    def __init__(self, every_messages: int | None = None, max_hooks: int | None = None,
+                 hook_max_age_hours: float | None = None, enabled: bool | None = None):
+        self.every_messages = every_messages or APP_CONFIG.get("channel_summary_every_messages", 20)
+        self.max_hooks = max_hooks or APP_CONFIG.get("channel_summary_max_hooks", 8)
+        hook_max_age_hours = APP_CONFIG.get("channel_summary_hook_max_age_hours", 48.0) if hook_max_age_hours is None else hook_max_age_hours
+        self.hook_max_age = hook_max_age_hours * 3600
+        self.enabled = APP_CONFIG.get("channel_summary_enabled", True) if enabled is None else enabled
+        self.retry_secs = APP_CONFIG.get("channel_summary_retry_secs", 300.0)
+        self._summaries: dict[str, dict] = {}
+        self._pending: dict[str, list[tuple[float, str, str]]] = {}
+        self._updating: dict[str, asyncio.Task] = {}
+        # channel -> (consecutive failed updates, time before which no update is tried)
+        self._backoff: dict[str, tuple[int, float]] = {}
+
+    def _load(self, key: str, state_manager: StateManager) -> dict:
+        if key not in self._summaries:
+            self._summaries[key] = state_manager.get_channel_summary(key)
+        return self._summaries[key]
+
+    def note_message(self, message: InternalMessage, state_manager: StateManager, timestamp: float | None = None):
+        """Buffers a saved message (sent at `timestamp`, default now) and starts a background update once enough have arrived."""
+        if not self.enabled or not message.text:
+            return
+        key = channel_key(message.platform, message.channel_id)
+        pending = self._pending.setdefault(key, [])
+        pending.append((time.time() if timestamp is None else timestamp, message.sender_id, message.text))
+        if len(pending) > MAX_PENDING_MESSAGES:
+            # Updates keep failing; summarize the most recent stretch rather than grow forever.
+            del pending[:len(pending) - MAX_PENDING_MESSAGES]
+        # In economy mode the messages wait, up to MAX_PENDING_MESSAGES, for the budget to recover;
+        # after a failed update they wait out the channel's backoff.
+        if (len(pending) >= self.every_messages and key not in self._updating and not usage_ledger.economy()
+                and time.time() >= self._backoff.get(key, (0, 0.0))[1]):
+            task = asyncio.create_task(self._update(key, state_manager))
+            self._updating[key] = task
+            task.add_done_callback(lambda _: self._updating.pop(key, None))
+
+    async def _update(self, key: str, state_manager: StateManager):
+        set_usage_channel(key)
+        batch = self._pending.pop(key, [])
+        current = self._load(key, state_manager)
+        new_messages = "\n".join(f"[{_format_time(ts)}] User {sender}: {text[:300]}" for ts, sender, text in batch)
+        prompt = f"""You keep a running summary of a group chat so that a member can later revive an unfinished conversation.
+
+CURRENT SUMMARY:
+{current.get("summary") or "(none yet)"}
+
+OPEN THREADS SO FAR:
+{format_hooks(current) or "(none yet)"}
+
+NEW MESSAGES SINCE THE LAST UPDATE:
+{new_messages}
+
+Update the summary (at most 80 words) and the list of open threads: conversations that ended without resolution, such as an unanswered question, a disagreement or an idea nobody followed up on. Drop threads that were resolved. Keep at most {self.max_hooks}, the most interesting first, each one short and specific. For each thread give the time of its latest message exactly in the format shown (YYYY-MM-DD HH:MM).
+
+Respond with ONLY a JSON object:
+{{"summary": "...", "hooks": [{{"hook": "...", "last_message_at": "YYYY-MM-DD HH:MM"}}]}}"""
+        try:
+            with track_stage("summary", "update"):
+                response = await get_llm_response(prompt, model=APP_CONFIG.get("summary_model", "gpt-4o-mini"), max_tokens=400)
+            data = _parse_reply(response)
+            now = time.time()
+            hooks = [
+                {"hook": str(h["hook"]), "last_message_at": _parse_time(h.get("last_message_at"), now)}
+                for h in data.get("hooks", []) if isinstance(h, dict) and h.get("hook")
+            ]
+            summary = {
+                "summary": str(data.get("summary", "")),
+                "hooks": [h for h in hooks if now - h["last_message_at"] <= self.hook_max_age][:self.max_hooks],
+                "updated_at": now,
+                "messages_folded": current.get("messages_folded", 0) + len(batch),
+            }
+        except Exception as e:
+            # Put the messages back so the next update folds them in, but not before the backoff (doubling, up to an hour).
+            self._pending[key] = batch + self._pending.get(key, [])
+            failures = self._backoff.get(key, (0, 0.0))[0] + 1
+            delay = min(self.retry_secs * 2 ** (failures - 1), 3600.0)
+            self._backoff[key] = (failures, time.time() + delay)
+            SUMMARY_UPDATES.labels("failed").inc()
+            logger.error("Failed to update summary for %s: %s. Retrying in %.0fs at the earliest.", key, e, delay)
+            return
+        self._backoff.pop(key, None)
+        self._summaries[key] = summary
+        await asyncio.to_thread(state_manager.save_channel_summary, key, summary)
+        SUMMARY_UPDATES.labels("updated").inc()
+        logger.info("Updated summary for %s with %s messages (%s open threads).", key, len(batch), len(summary["hooks"]))
+
+    def get(self, platform: str, channel_id: str, state_manager: StateManager) -> dict | None:
+        """The channel's summary if it has open threads that are still fresh, else None."""
+        if not self.enabled:
+            return None
+        summary = self._load(channel_key(platform, channel_id), state_manager)
+        now = time.time()
+        hooks = [h for h in summary.get("hooks", []) if now - h["last_message_at"] <= self.hook_max_age]
+        if not hooks:
+            return None
+        return {**summary, "hooks": hooks}
+
+
+channel_summarizer = ChannelSummarizer()
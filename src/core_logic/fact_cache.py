@@ -0,0 +1,196 @@
+# src/core_logic/fact_cache.py
+"""
+Semantic TTL cache for the raw facts returned by Grok live search.
+
+Realtime questions tend to arrive in bursts ("what's ETH at?", "eth price now?")
+and each one would otherwise start its own search call of up to 90 seconds.
+Entries are keyed by the embedding of the user's question. A new question
+reuses a cached fact when it falls in the same category, names the same assets
+and is at least FACT_CACHE_SIMILARITY similar (cosine). Facts expire after a
+per-category TTL, and a question that matches a search still in flight waits
+for that search instead of starting another one.
+"""
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+import numpy as np
+
+from config.settings import APP_CONFIG
+from src.services.metrics import Counter, Gauge, Histogram
+from src.services.openai_chat import get_embedding
+
+logger = logging.getLogger(__name__)
+
+FACT_CACHE_LOOKUPS = Counter(
+    "bot_fact_cache_lookups_total",
+    "Realtime fact lookups by outcome (hit, coalesced, miss, bypass).",
+    ("category", "outcome"))
+FACT_CACHE_HIT_AGE = Histogram(
+    "bot_fact_cache_hit_age_seconds",
+    "Age of cached facts when they are served.",
+    ("category",),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+FACT_CACHE_EXPIRED = Counter(
+    "bot_fact_cache_expired_total",
+    "Cached facts dropped because their TTL ran out.",
+    ("category",))
+FACT_CACHE_ENTRIES = Gauge(
+    "bot_fact_cache_entries",
+    "Facts currently held in the cache.")
+
+_CATEGORY_PATTERNS = (
+    ("price", re.compile(r"\b(price|prices|trading at|worth|cost|ath|market ?cap|mcap|pump|dump|chart|doing)\b|\$\d", re.I)),
+    ("news", re.compile(r"\b(news|announce\w*|listing|listed|launch\w*|update|sec|lawsuit|hack\w*|exploit\w*|etf|approved?)\b", re.I)),
+)
+
+# Questions about different assets embed very closely ("BTC price" vs "ETH price"),
+# so the assets a question names must match exactly on top of the similarity check.
+_ASSET_ALIASES = {
+    "bitcoin": "btc", "btc": "btc", "ethereum": "eth", "ether": "eth", "eth": "eth",
+    "solana": "sol", "sol": "sol", "ripple": "xrp", "xrp": "xrp", "dogecoin": "doge", "doge": "doge",
+    "binance": "bnb", "bnb": "bnb", "cardano": "ada", "ada": "ada", "tether": "usdt", "usdt": "usdt",
+}
+_TICKER_PATTERN = re.compile(r"\$?\b([A-Za-z]{2,10})\b")
+
+
+def classify_query(text: str) -> str:
+    for category, pattern in _CATEGORY_PATTERNS:
+        if pattern.search(text):
+            return category
+    return "default"
+
+
+def extract_assets(text: str) -> frozenset:
+    assets = set()
+    for match in _TICKER_PATTERN.finditer(text):
+        word = match.group(1)
+        alias = _ASSET_ALIASES.get(word.lower())
+        if alias:
+            assets.add(alias)
+        elif match.group(0).startswith("$") or (word.isupper() and len(word) <= 6):
+            assets.add(word.lower())
+    return frozenset(assets)
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray
+    category: str
+    assets: frozenset
+    query: str
+    fact: str
+    created_at: float
+    expires_at: float
+
+
+@dataclass
+class _Pending:
+    vector: np.ndarray
+    category: str
+    assets: frozenset
+    future: asyncio.Future
+
+
+class FactCache:
+    """Holds recent raw facts. All methods run on the event loop thread."""
+    def __init__(self, similarity: float | None = None, ttls: dict[str, float] | None = None,
+                 max_entries: int | None = None, enabled: bool | None = None):
+        self.similarity = APP_CONFIG.get("fact_cache_similarity", 0.9) if similarity is None else similarity
+        self.ttls = APP_CONFIG.get("fact_cache_ttls", {}) if ttls is None else ttls
+        self.max_entries = APP_CONFIG.get("fact_cache_max_entries", 256) if max_entries is None else max_entries
+        self.enabled = APP_CONFIG.get("fact_cache_enabled", True) if enabled is None else enabled
+        self._entries: list[_Entry] = []
+        self._pending: list[_Pending] = []
+        FACT_CACHE_ENTRIES.labels().set_function(lambda: len(self._entries))
+
+    def ttl_for(self, category: str) -> float:
+        return self.ttls.get(category, self.ttls.get("default", 0.0))
+
+    def _evict_expired(self, now: float):
+        live = []
+        for entry in self._entries:
+            if entry.expires_at > now:
+                live.append(entry)
+            else:
+                FACT_CACHE_EXPIRED.labels(entry.category).inc()
+        self._entries = live
+
+    def _best_match(self, candidates: list, vector: np.ndarray, category: str, assets: frozenset):
+        """Returns the most similar candidate in the same category/asset group, if above the threshold."""
+        best, best_score = None, self.similarity
+        for candidate in candidates:
+            if candidate.category != category or candidate.assets != assets:
+                continue
+            score = float(np.dot(candidate.vector, vector))
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    async def get_or_fetch(self, query: str, fetch: Callable[[], Awaitable[str]]) -> str:
+        """
+        Returns a fresh cached fact for a near-duplicate `query`, or calls `fetch()`
+        and caches its result. Results containing "Error:" are passed through
+        but never cached.
+        """
+        category = classify_query(query)
+        ttl = self.ttl_for(category)
+        if not self.enabled or ttl <= 0:
+            FACT_CACHE_LOOKUPS.labels(category, "bypass").inc()
+            return await fetch()
+
+        embedding = await get_embedding(query)
+        if not embedding:
+            FACT_CACHE_LOOKUPS.labels(category, "bypass").inc()
+            return await fetch()
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        assets = extract_assets(query)
+
+        now = time.time()
+        self._evict_expired(now)
+        entry = self._best_match(self._entries, vector, category, assets)
+        if entry is not None:
+            age = now - entry.created_at
+            FACT_CACHE_LOOKUPS.labels(category, "hit").inc()
+            FACT_CACHE_HIT_AGE.labels(category).observe(age)
+            logger.info("Reusing %.0fs old %s fact for '%s' (cached for '%s').", age, category, query[:50], entry.query[:50])
+            return entry.fact
+
+        pending = self._best_match(self._pending, vector, category, assets)
+        if pending is not None:
+            FACT_CACHE_LOOKUPS.labels(category, "coalesced").inc()
+            logger.info("Waiting for in-flight %s search instead of starting another for '%s'.", category, query[:50])
+            return await asyncio.shield(pending.future)
+
+        FACT_CACHE_LOOKUPS.labels(category, "miss").inc()
+        pending = _Pending(vector, category, assets, asyncio.get_running_loop().create_future())
+        self._pending.append(pending)
+        try:
+            fact = await fetch()
+        except asyncio.CancelledError:
+            pending.future.cancel()
+            raise
+        except Exception as e:
+            pending.future.set_exception(e)
+            # Nobody may be waiting on the shared future; don't warn about an unretrieved exception.
+            pending.future.exception()
+            raise
+        finally:
+            self._pending.remove(pending)
+
+        pending.future.set_result(fact)
+        if "Error:" not in fact:
+            created_at = time.time()
+            self._entries.append(_Entry(vector, category, assets, query, fact, created_at, created_at + ttl))
+            if len(self._entries) > self.max_entries:
+                del self._entries[:len(self._entries) - self.max_entries]
+        return fact
+
+
+fact_cache = FactCache()
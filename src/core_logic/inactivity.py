@@ -0,0 +1,103 @@
+# src/core_logic/inactivity.py
+"""
+Per-channel inactivity tracking for topic initiation.
+
+Last-activity times live in memory. Every channel that may initiate has a
+deadline (last activity + its idle threshold) on a min-heap; touching a channel
+pushes a new deadline and leaves the old entry to be skipped when it surfaces.
+The brain waits on its queue only until the earliest deadline, so initiation
+fires when a channel actually goes quiet instead of on a one-second poll.
+
+Activity is written to the channel state documents lazily, at most every
+INACTIVITY_PERSIST_INTERVAL_SECS, rather than once per message. A crash loses
+at most that much activity history, which only makes an initiation come early.
+"""
+import heapq
+import logging
+import time
+
+from config.settings import APP_CONFIG
+from src.core_logic.channel_registry import ChannelConfig, channel_registry
+from src.services.state_manager import StateManager
+
+logger = logging.getLogger(__name__)
+
+
+class InactivityTracker:
+    def __init__(self, state_manager: StateManager, channels: list[ChannelConfig] | None = None,
+                 persist_interval: float | None = None):
+        self.state_manager = state_manager
+        self.persist_interval = APP_CONFIG.get("inactivity_persist_interval_secs", 60) if persist_interval is None else persist_interval
+        channels = channel_registry.all() if channels is None else channels
+        self._channels = {channel.key: channel for channel in channels if channel.initiate}
+        default_activity = state_manager.load_bot_state().get("last_activity_time", 0)
+        self._last_activity: dict[str, float] = {
+            key: state.get("last_activity_time", 0)
+            for key, state in state_manager.get_all_channel_states().items()
+        }
+        self._heap: list[tuple[float, str]] = []
+        self._deadlines: dict[str, float] = {}
+        for key, channel in self._channels.items():
+            self._schedule(key, self._last_activity.get(key, default_activity) + channel.initiate_after_secs)
+        self._dirty: set[str] = set()
+        self._last_persist = time.monotonic()
+
+    def _schedule(self, key: str, deadline: float):
+        self._deadlines[key] = deadline
+        heapq.heappush(self._heap, (deadline, key))
+
+    def _drop_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def last_activity(self, key: str) -> float | None:
+        return self._last_activity.get(key)
+
+    def touch(self, key: str, now: float | None = None):
+        """Records activity in a channel and moves its initiation deadline."""
+        now = time.time() if now is None else now
+        self._last_activity[key] = now
+        self._dirty.add(key)
+        channel = self._channels.get(key)
+        if channel:
+            self._schedule(key, now + channel.initiate_after_secs)
+
+    def defer(self, key: str, delay: float, now: float | None = None):
+        """Pushes a due channel's deadline back without counting it as activity."""
+        self._schedule(key, (time.time() if now is None else now) + delay)
+
+    def pop_due(self, now: float | None = None) -> ChannelConfig | None:
+        """The channel whose deadline passed first, if any. Its deadline is cleared until it is touched or deferred."""
+        now = time.time() if now is None else now
+        self._drop_stale()
+        if not self._heap or self._heap[0][0] > now:
+            return None
+        _, key = heapq.heappop(self._heap)
+        self._deadlines.pop(key, None)
+        return self._channels[key]
+
+    def due_within(self, secs: float, now: float | None = None) -> list[ChannelConfig]:
+        """Channels whose deadline falls within the next `secs` seconds, e.g. to prepare their initiation early."""
+        now = time.time() if now is None else now
+        return [self._channels[key] for key, deadline in self._deadlines.items() if 0 < deadline - now <= secs]
+
+    def seconds_until_next(self, now: float | None = None) -> float | None:
+        """How long the brain may wait for a message: until the next deadline or pending persist. None means forever."""
+        now = time.time() if now is None else now
+        self._drop_stale()
+        waits = []
+        if self._heap:
+            waits.append(self._heap[0][0] - now)
+        if self._dirty:
+            waits.append(self._last_persist + self.persist_interval - time.monotonic())
+        return max(min(waits), 0.0) if waits else None
+
+    def persist(self, force: bool = False):
+        """Writes the activity of touched channels once the persist interval has passed (or now, if forced)."""
+        if not self._dirty or (not force and time.monotonic() - self._last_persist < self.persist_interval):
+            return
+        for key in self._dirty:
+            self.state_manager.record_channel_activity(key, self._last_activity[key])
+        logger.debug("Persisted activity of %s channels.", len(self._dirty))
+        self._dirty.clear()
+        self._last_persist = time.monotonic()
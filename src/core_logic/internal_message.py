@@ -1,6 +1,8 @@
 # src/core_logic/internal_message.py
 
-from dataclasses import dataclass
+import os
+import time
+from dataclasses import dataclass, field
 from typing import Literal
 
 @dataclass
@@ -13,4 +15,15 @@ class InternalMessage:
     channel_id: str  # For Telegram, this is the group ID. For Slack, the channel ID.
     message_id: str
     text: str
-    sender_id: str
\ No newline at end of file
+    sender_id: str
+    # Lifecycle tracing (see src/services/tracing.py): the message's trace and when it was received (time.perf_counter).
+    trace_id: str = field(default_factory=lambda: os.urandom(8).hex())
+    received_at: float = field(default_factory=time.perf_counter)
+    # The same moment on the wall clock. Unlike `received_at`, it still means something after the message is
+    # replayed from the journal by a new process or forwarded to another node.
+    received_time: float = field(default_factory=time.time)
+
+    @property
+    def dedupe_key(self) -> str:
+        """The message's id in the dedupe log. Message ids (e.g. Telegram's) are only unique within one chat."""
+        return f"{self.platform}:{self.channel_id}:{self.message_id}"
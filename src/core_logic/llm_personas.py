@@ -1,25 +1,161 @@
 # src/core_logic/llm_personas.py
+import asyncio
+import logging
+import os
 import random
-from config.settings import CHARACTERS_DATA
+import threading
+from dataclasses import dataclass
+from config.settings import APP_CONFIG, CHARACTERS_DATA, CHARACTERS_FILE_PATH, load_characters_config
+
+logger = logging.getLogger(__name__)
+
+
+def build_persona_profile(persona: dict, detailed: bool = False) -> str:
+    """Builds the short (role + voice) or detailed (+ expertise, traits) profile string."""
+    profile = f"Role: {persona.get('role', '')}. Voice: {persona.get('signature_voice', {}).get('tone', '')}."
+    if detailed:
+        profile += (
+            f" Expertise: {', '.join(persona.get('expertise', []))}."
+            f" Traits: {', '.join(persona.get('key_traits', []))}.")
+    return profile
+
+
+@dataclass(frozen=True)
+class _PersonaSnapshot:
+    """An immutable, fully indexed view of one version of characters.json."""
+    utility_prompts: dict
+    all_personas: list[dict]
+    by_name: dict[str, dict]
+    by_telegram_user: dict[str, list[dict]]
+    profiles: dict[str, str]
+    detailed_profiles: dict[str, str]
+    mtime: float = 0.0
+
+
+def _build_snapshot(characters_data: dict, mtime: float = 0.0) -> _PersonaSnapshot:
+    all_personas = []
+    for character in characters_data.get("characters", []):
+        for persona in character.get("personas", []):
+            persona_copy = persona.copy()
+            persona_copy['character_name'] = character.get('character_name')
+            persona_copy['telegram_user'] = character.get('telegram_user')
+            all_personas.append(persona_copy)
+
+    if not all_personas:
+        raise ValueError("No personas found in characters.json.")
+
+    by_telegram_user: dict[str, list[dict]] = {}
+    for persona in all_personas:
+        if persona.get('telegram_user'):
+            by_telegram_user.setdefault(persona['telegram_user'], []).append(persona)
+
+    return _PersonaSnapshot(
+        utility_prompts=characters_data.get("utility_personas", {}),
+        all_personas=all_personas,
+        by_name={p['persona_name']: p for p in all_personas},
+        by_telegram_user=by_telegram_user,
+        profiles={p['persona_name']: build_persona_profile(p) for p in all_personas},
+        detailed_profiles={p['persona_name']: build_persona_profile(p, detailed=True) for p in all_personas},
+        mtime=mtime,
+    )
+
 
 class PersonaManager:
-    """Manages persona definitions from characters.json."""
-    def __init__(self):
-        self.utility_prompts = CHARACTERS_DATA.get("utility_personas", {})
-        self.all_personas = []
-        for character in CHARACTERS_DATA.get("characters", []):
-            for persona in character.get("personas", []):
-                persona_copy = persona.copy()
-                persona_copy['character_name'] = character.get('character_name')
-                persona_copy['telegram_user'] = character.get('telegram_user')
-                self.all_personas.append(persona_copy)
-        
-        if not self.all_personas:
-            raise ValueError("No personas found in characters.json.")
-        print(f"Initialized PersonaManager with {len(self.all_personas)} main personas.")
+    """
+    Manages persona definitions from characters.json.
+
+    All lookups go through an immutable snapshot that is swapped in a single
+    assignment on reload, so a request that already holds a persona dict keeps
+    a consistent view while newer requests see the updated file.
+    """
+    def __init__(self, file_path: str = CHARACTERS_FILE_PATH):
+        self.file_path = file_path
+        self._reload_lock = threading.Lock()
+        self._failed_mtime = 0.0
+        self._snapshot = _build_snapshot(CHARACTERS_DATA, self._get_mtime())
+        logger.info("Initialized PersonaManager with %s main personas.", len(self._snapshot.all_personas))
+
+    # --- Read access (always against the current snapshot) ---
+    @property
+    def utility_prompts(self) -> dict:
+        return self._snapshot.utility_prompts
+
+    @property
+    def all_personas(self) -> list[dict]:
+        return self._snapshot.all_personas
 
     def get_persona_by_name(self, name: str) -> dict | None:
-        return next((p for p in self.all_personas if p['persona_name'] == name), None)
+        return self._snapshot.by_name.get(name)
+
+    def get_postable_persona_names(self, platform: str, names=()) -> list[str]:
+        """
+        The personas that can post on `platform`, restricted to `names` (e.g. a
+        channel's personas) when given. On Telegram a persona posts through its
+        account, so only those of SENDER_BOT_USERS qualify. Falls back to `names`
+        if none does.
+        """
+        if platform != "telegram":
+            return list(names)
+        by_telegram_user = self._snapshot.by_telegram_user
+        postable = [persona['persona_name'] for user in APP_CONFIG.get('sender_bot_users', [])
+                    for persona in by_telegram_user.get(user, [])]
+        return [name for name in postable if not names or name in names] or list(names)
+
+    def get_persona_profile(self, persona: dict, detailed: bool = False) -> str:
+        """Returns the precomputed profile string, building it only for unknown personas."""
+        profiles = self._snapshot.detailed_profiles if detailed else self._snapshot.profiles
+        profile = profiles.get(persona.get('persona_name'))
+        return profile if profile is not None else build_persona_profile(persona, detailed)
+
+    def get_random_persona(self, names=None) -> dict | None:
+        """Picks a random persona, restricted to `names` (e.g. a channel's personas) when given."""
+        snapshot = self._snapshot
+        personas = [snapshot.by_name[name] for name in names if name in snapshot.by_name] if names else None
+        personas = personas or snapshot.all_personas
+        return random.choice(personas) if personas else None
+
+    # --- Hot reload ---
+    def _get_mtime(self) -> float:
+        try:
+            return os.stat(self.file_path).st_mtime
+        except OSError:
+            return 0.0
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reloads characters.json if its modification time changed.
+        A broken or empty file is reported and the current snapshot is kept.
+        """
+        mtime = self._get_mtime()
+        if not mtime or mtime in (self._snapshot.mtime, self._failed_mtime):
+            return False
+
+        with self._reload_lock:
+            if mtime == self._snapshot.mtime:
+                return False
+            try:
+                snapshot = _build_snapshot(load_characters_config(self.file_path), mtime)
+            except (FileNotFoundError, ValueError) as e:
+                self._failed_mtime = mtime
+                logger.error("Reload of '%s' failed, keeping previous personas: %s", self.file_path, e)
+                return False
+            self._snapshot = snapshot
+
+        logger.info("Reloaded %s personas from '%s'.", len(snapshot.all_personas), self.file_path)
+        return True
+
 
-    def get_random_persona(self) -> dict | None:
-        return random.choice(self.all_personas) if self.all_personas else None
\ No newline at end of file
+async def persona_reload_worker(persona_manager: PersonaManager):
+    """Polls characters.json for changes and swaps in a fresh persona snapshot."""
+    interval = APP_CONFIG.get("persona_reload_interval_secs", 10)
+    if interval <= 0:
+        logger.info("Hot reload disabled.")
+        return
+    logger.info("Watching '%s' for changes every %ss.", persona_manager.file_path, interval)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            # Parsing happens off the event loop; the swap itself is a single assignment.
+            await asyncio.to_thread(persona_manager.reload_if_changed)
+        except Exception as e:
+            logger.error("Unexpected error while reloading personas: %s", e)
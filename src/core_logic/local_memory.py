@@ -0,0 +1,270 @@
+# src/core_logic/local_memory.py
+"""
+In-process vector memory, selected with MEMORY_BACKEND=local instead of mem0.
+
+Each memory user (see memory._generate_user_id) owns a matrix of normalized
+message embeddings, stored as float32 or, with MEMORY_VECTOR_DTYPE=int8, as
+int8 rows with one float32 scale each (4x smaller, with a cosine error around
+1%). A search is one matrix-vector product over that user's rows, followed by
+a partial sort for the top k.
+
+Memories are persisted to one append-only JSON-lines file (vectors base64
+encoded), so an add costs one small write. Rows older than
+MEMORY_RETENTION_DAYS, or beyond the newest MEMORY_MAX_PER_USER of a user, stop
+counting immediately. The file is compacted (rewritten with only the live rows)
+once dead rows outnumber live ones. The rewrite runs in a worker thread from a
+copy of the rows; adds made meanwhile are appended before the new file is
+swapped in.
+"""
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from config.settings import APP_CONFIG
+from src.services.metrics import Gauge
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MEMORY_ENTRIES = Gauge(
+    "bot_local_memory_entries",
+    "Live entries in the local vector memory store.")
+
+# Dead rows tolerated in the file before a compaction is worth it.
+MIN_COMPACTION_ROWS = 1000
+
+
+class _UserMemory:
+    """One user's rows, in insertion order, in arrays that grow by doubling."""
+    def __init__(self, dim: int, dtype: np.dtype):
+        self.dim = dim
+        self.size = 0
+        self.vectors = np.empty((16, dim), dtype=dtype)
+        self.scales = np.empty(16, dtype=np.float32)
+        self.times = np.empty(16, dtype=np.float64)
+        self.texts: list[str] = []
+
+    def append(self, vector: np.ndarray, scale: float, timestamp: float, text: str):
+        if self.size == len(self.times):
+            capacity = max(16, 2 * self.size)
+            self.vectors = np.resize(self.vectors, (capacity, self.dim))
+            self.scales = np.resize(self.scales, capacity)
+            self.times = np.resize(self.times, capacity)
+        self.vectors[self.size] = vector
+        self.scales[self.size] = scale
+        self.times[self.size] = timestamp
+        self.texts.append(text)
+        self.size += 1
+
+    def drop_oldest(self, count: int):
+        keep = slice(count, self.size)
+        self.vectors = self.vectors[keep].copy()
+        self.scales = self.scales[keep].copy()
+        self.times = self.times[keep].copy()
+        self.texts = self.texts[count:]
+        self.size -= count
+
+
+class LocalMemoryStore:
+    """Per-user vector memories. All methods run on the event loop thread; an add is one buffered write (compaction aside)."""
+    def __init__(self, path: str | None = None, dtype: str | None = None, retention_days: float | None = None,
+                 max_per_user: int | None = None):
+        self.path = APP_CONFIG.get("memory_store_path", "") if path is None else path
+        self.dtype = np.dtype(dtype or APP_CONFIG.get("memory_vector_dtype", "float32"))
+        if self.dtype not in (np.float32, np.int8):
+            raise ValueError(f"Unsupported memory vector dtype '{self.dtype}'.")
+        retention_days = APP_CONFIG.get("memory_retention_days", 90.0) if retention_days is None else retention_days
+        self.retention = retention_days * 86400
+        self.max_per_user = APP_CONFIG.get("memory_max_per_user", 500) if max_per_user is None else max_per_user
+        self._users: dict[str, _UserMemory] = {}
+        self._dead = 0
+        self._file = None
+        self._compaction: asyncio.Task | None = None
+        # Records added while a compaction writes the new file, or None.
+        self._compaction_tail: list[str] | None = None
+        if self.path:
+            self._load()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._maybe_compact()
+        LOCAL_MEMORY_ENTRIES.labels().set_function(lambda: sum(user.size for user in self._users.values()))
+
+    # --- Encoding ---
+    def _quantize(self, embedding) -> tuple[np.ndarray, float]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        if self.dtype == np.int8:
+            scale = float(np.abs(vector).max()) / 127 or 1.0
+            return np.round(vector / scale).astype(np.int8), scale
+        return vector, 1.0
+
+    def _record(self, user_id: str, text: str, vector: np.ndarray, scale: float, timestamp: float) -> str:
+        return json.dumps({"u": user_id, "c": text, "t": timestamp, "s": scale, "dt": self.dtype.name,
+                           "v": base64.b64encode(vector.tobytes()).decode("ascii")}) + "\n"
+
+    # --- Persistence ---
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        started = time.perf_counter()
+        rows = converted = 0
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    vector = np.frombuffer(base64.b64decode(record["v"]), dtype=np.dtype(record["dt"]))
+                except (ValueError, KeyError, TypeError):
+                    # A torn final write; the rest of the file is intact.
+                    continue
+                rows += 1
+                scale = record["s"]
+                if vector.dtype != self.dtype:
+                    # MEMORY_VECTOR_DTYPE changed; such rows count as dead so the file gets rewritten.
+                    vector, scale = self._quantize(vector.astype(np.float32) * scale)
+                    converted += 1
+                self._insert(record["u"], record["c"], vector, scale, record["t"])
+        live = sum(user.size for user in self._users.values())
+        self._dead = rows - live + converted
+        self._expire(time.time())
+        logger.info("Loaded %s memories for %s users in %.2fs.", sum(user.size for user in self._users.values()),
+                    len(self._users), time.perf_counter() - started)
+
+    def _maybe_compact(self):
+        live = sum(user.size for user in self._users.values())
+        if self._file and self._compaction is None and self._dead >= max(live, MIN_COMPACTION_ROWS):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # Not on the event loop (e.g. loading at startup), so nothing waits on us.
+                self.compact()
+                return
+            self._compaction = asyncio.create_task(self._compact_in_background())
+
+    def _snapshot_rows(self) -> tuple[list[tuple], int]:
+        """Copies of the live rows, and the dead rows they leave behind."""
+        self._expire(time.time())
+        rows = [(user_id, list(user.texts), user.vectors[:user.size].copy(), user.scales[:user.size].copy(),
+                 user.times[:user.size].copy()) for user_id, user in self._users.items()]
+        return rows, self._dead
+
+    def _write_rows(self, rows: list[tuple]) -> str:
+        temp_path = self.path + ".compact"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for user_id, texts, vectors, scales, times in rows:
+                for i in range(len(texts)):
+                    f.write(self._record(user_id, texts[i], vectors[i], float(scales[i]), float(times[i])))
+            f.flush()
+            os.fsync(f.fileno())
+        return temp_path
+
+    def _swap_in(self, temp_path: str, dead: int, tail: list[str]):
+        if not self._file:
+            # Closed meanwhile; the old file is still complete.
+            os.remove(temp_path)
+            return
+        if tail:
+            with open(temp_path, 'a', encoding='utf-8') as f:
+                f.writelines(tail)
+        self._file.close()
+        os.replace(temp_path, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        logger.info("Compacted memory store, dropping %s dead rows.", dead)
+        # Rows that died while the file was written are still in it.
+        self._dead -= dead
+
+    def compact(self):
+        """Rewrites the file with only the live rows, then swaps it in atomically. Blocks; see _maybe_compact."""
+        if not self._file or self._compaction is not None:
+            return
+        rows, dead = self._snapshot_rows()
+        self._swap_in(self._write_rows(rows), dead, [])
+
+    async def _compact_in_background(self):
+        rows, dead = self._snapshot_rows()
+        self._compaction_tail = []
+        try:
+            temp_path = await asyncio.to_thread(self._write_rows, rows)
+            self._swap_in(temp_path, dead, self._compaction_tail)
+        except Exception as e:
+            logger.error("Error compacting memory store: %s", e)
+        finally:
+            self._compaction_tail = None
+            self._compaction = None
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    # --- Memory operations ---
+    def _insert(self, user_id: str, text: str, vector: np.ndarray, scale: float, timestamp: float):
+        user = self._users.get(user_id)
+        if user is None or user.dim != vector.shape[0]:
+            if user is not None:
+                # The embedding model changed; older rows can't be compared with new ones.
+                self._dead += user.size
+            user = self._users[user_id] = _UserMemory(vector.shape[0], self.dtype)
+        user.append(vector, scale, timestamp, text)
+        # Trim in chunks so the arrays are copied once per quarter of the limit, not on every add.
+        if user.size > self.max_per_user + self.max_per_user // 4:
+            overflow = user.size - self.max_per_user
+            user.drop_oldest(overflow)
+            self._dead += overflow
+
+    def _expire(self, now: float):
+        cutoff = now - self.retention
+        for user_id in list(self._users):
+            user = self._users[user_id]
+            expired = int(np.searchsorted(user.times[:user.size], cutoff))
+            if expired == user.size:
+                del self._users[user_id]
+            elif expired:
+                user.drop_oldest(expired)
+            self._dead += expired
+
+    def add(self, user_id: str, text: str, embedding, timestamp: float | None = None):
+        if not text or not len(embedding):
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        vector, scale = self._quantize(embedding)
+        self._insert(user_id, text, vector, scale, timestamp)
+        if self._file:
+            record = self._record(user_id, text, vector, scale, timestamp)
+            self._file.write(record)
+            self._file.flush()
+            if self._compaction_tail is not None:
+                self._compaction_tail.append(record)
+            self._maybe_compact()
+
+    def search(self, user_id: str, embedding, limit: int = 5, min_score: float = 0.0, now: float | None = None) -> list[tuple[str, float]]:
+        """The user's `limit` most similar live memories with their cosine scores, best first."""
+        user = self._users.get(user_id)
+        if user is None or not len(embedding):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        if query.shape[0] != user.dim:
+            return []
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        size = user.size
+        start = max(0, size - self.max_per_user)
+        cutoff = (time.time() if now is None else now) - self.retention
+        # Rows are in time order, so the live ones are a suffix.
+        start = max(start, int(np.searchsorted(user.times[:size], cutoff)))
+        if start >= size:
+            return []
+        scores = user.vectors[start:size] @ query
+        if self.dtype == np.int8:
+            scores = scores * user.scales[start:size]
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(user.texts[start + i], float(scores[i])) for i in top if scores[i] >= min_score]
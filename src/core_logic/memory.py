@@ -1,36 +1,81 @@
 # src/core_logic/memory.py
+import asyncio
+import logging
 from mem0 import MemoryClient
 import os
 from dotenv import load_dotenv
+from config.settings import APP_CONFIG
+from src.services.metrics import track_provider_call
+from src.services.openai_chat import get_embedding
+
+logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-# Initialize Mem0 client
-memory_client = MemoryClient(api_key=os.getenv("MEM0_API_KEY"))
+# The Mem0 client validates its API key over the network when constructed,
+# so it is created on first use rather than at import time.
+memory_client = None
+
+def get_memory_client():
+    global memory_client
+    if memory_client is None:
+        memory_client = MemoryClient(api_key=os.getenv("MEM0_API_KEY"))
+    return memory_client
+
+def set_memory_client(client):
+    """Replaces the Mem0 client, e.g. with a local stand-in for benchmarks."""
+    global memory_client
+    memory_client = client
+
+# With MEMORY_BACKEND=local, memories live in an in-process vector store instead of mem0.
+local_store = None
+
+def uses_local_memory() -> bool:
+    return APP_CONFIG.get("memory_backend", "mem0") == "local"
+
+def get_local_store():
+    global local_store
+    if local_store is None:
+        from src.core_logic.local_memory import LocalMemoryStore
+        local_store = LocalMemoryStore()
+    return local_store
+
+def set_local_store(store):
+    """Replaces the local memory store, e.g. with one that isn't persisted."""
+    global local_store
+    local_store = store
 
 def _generate_user_id(platform: str, user_id: str) -> str:
     """Creates a unique, composite user ID for mem0, e.g., 'telegram_12345'."""
     return f"{platform}_{user_id}"
 
 # MODIFIED: Now accepts platform and user_id, replacing the old hardcoded user_id
-def get_memory_context(query: str, platform: str, user_id: str) -> str:
+async def get_memory_context(query: str, platform: str, user_id: str, embedding: list[float] | None = None) -> str:
     """
     Get relevant memory context for a query without adding it to memory.
-    Now uses a platform-specific user ID.
+    Now uses a platform-specific user ID. With the local backend, `embedding`
+    (the query's, if the caller has it already) saves an embedding request.
     """
     # Create the dynamic ID for this specific user on this specific platform
     mem0_user_id = _generate_user_id(platform, user_id)
     
     try:
-        search_result = memory_client.search(query=query, user_id=mem0_user_id, limit=5)
-        
-        # Your original logic for handling the response structure is kept
-        if isinstance(search_result, list):
-            relevant_memories = [entry.get("memory", "") for entry in search_result if isinstance(entry, dict)]
-        elif isinstance(search_result, dict) and "results" in search_result:
-            relevant_memories = [entry.get("memory", "") for entry in search_result["results"]]
+        if uses_local_memory():
+            embedding = embedding or await get_embedding(query)
+            with track_provider_call("local_memory", "search"):
+                matches = get_local_store().search(mem0_user_id, embedding, limit=5, min_score=APP_CONFIG.get("memory_min_score", 0.3))
+            relevant_memories = [text for text, _ in matches]
         else:
-            relevant_memories = []
+            with track_provider_call("mem0", "search"):
+                search_result = await asyncio.to_thread(get_memory_client().search, query=query, user_id=mem0_user_id, limit=5)
+        
+            # Your original logic for handling the response structure is kept
+            if isinstance(search_result, list):
+                relevant_memories = [entry.get("memory", "") for entry in search_result if isinstance(entry, dict)]
+            elif isinstance(search_result, dict) and "results" in search_result:
+                relevant_memories = [entry.get("memory", "") for entry in search_result["results"]]
+            else:
+                relevant_memories = []
         
         if relevant_memories:
             memories_str = "\n".join(f"- {m}" for m in relevant_memories if m)
@@ -39,11 +84,11 @@ def get_memory_context(query: str, platform: str, user_id: str) -> str:
             return ""
             
     except Exception as e:
-        print(f"[MEMORY] Error getting memory context for '{mem0_user_id}': {e}")
+        logger.error("Error getting memory context for '%s': %s", mem0_user_id, e)
         return ""
 
 # MODIFIED: Now accepts platform and user_id, replacing the old hardcoded user_id
-def add_to_memory(content: str, role: str, platform: str, user_id: str):
+async def add_to_memory(content: str, role: str, platform: str, user_id: str, embedding: list[float] | None = None):
     """
     Add content to memory without searching, using a platform-specific ID.
     
@@ -52,12 +97,19 @@ def add_to_memory(content: str, role: str, platform: str, user_id: str):
         role: Either "user" or "assistant"
         platform: The originating platform (e.g., 'telegram', 'slack')
         user_id: The user's ID on that platform
+        embedding: The content's embedding, if already known (local backend only)
     """
     # Create the dynamic ID for this specific user on this specific platform
     mem0_user_id = _generate_user_id(platform, user_id)
     
     try:
-        memory_client.add([{"role": role, "content": content}], user_id=mem0_user_id)
-        print(f"[MEMORY] Added {role} content to memory for '{mem0_user_id}'")
+        if uses_local_memory():
+            embedding = embedding or await get_embedding(content)
+            with track_provider_call("local_memory", "add"):
+                get_local_store().add(mem0_user_id, content, embedding)
+        else:
+            with track_provider_call("mem0", "add"):
+                await asyncio.to_thread(get_memory_client().add, [{"role": role, "content": content}], user_id=mem0_user_id)
+        logger.debug("Added %s content to memory for '%s'", role, mem0_user_id)
     except Exception as e:
-        print(f"[MEMORY] Error adding to memory for '{mem0_user_id}': {e}")
\ No newline at end of file
+        logger.error("Error adding to memory for '%s': %s", mem0_user_id, e)
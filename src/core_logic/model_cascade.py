@@ -0,0 +1,131 @@
+# src/core_logic/model_cascade.py
+"""
+Model cascade for persona replies.
+
+A "gm" or "lol" doesn't need the strongest model. Each reply starts on the
+cheapest model in CASCADE_MODELS (ordered cheapest first) that is likely to be
+good enough, and only moves up when a fast local check rejects the draft:
+
+- A channel's "reply_model" (config/channels.json) pins its replies to one
+  model; if that model is in the cascade, replies may still escalate from it.
+- Messages of CASCADE_LONG_MESSAGE_CHARS or more, and messages triage was
+  unsure about (first-token probability below CASCADE_MIN_TRIAGE_CONFIDENCE),
+  start on the second model.
+- Everything else starts on the first.
+
+The quality check needs no extra request: the draft must be non-empty, not cut
+off by max_tokens, not a refusal or an assistant-style disclaimer, not an echo
+of a longer user message, and free of the word "error" (which the reply handlers
+would drop). The last model's draft is returned whatever the check says.
+
+Routing decisions, escalations and the model that produced each reply are
+exported as bot_cascade_* metrics; spend by model is in bot_llm_cost_usd_total.
+"""
+import logging
+import re
+import time
+
+from config.settings import APP_CONFIG
+from src.core_logic.channel_registry import ChannelConfig
+from src.services.metrics import Counter, Histogram
+from src.services.openai_chat import get_llm_completion
+from src.services.usage import usage_ledger
+
+logger = logging.getLogger(__name__)
+
+CASCADE_ROUTES = Counter(
+    "bot_cascade_routes_total",
+    "Persona replies by why they started on a model (channel, long, low_confidence, short, default).",
+    ("reason", "model"))
+CASCADE_ESCALATIONS = Counter(
+    "bot_cascade_escalations_total",
+    "Drafts rejected by the quality check, by model and failed check.",
+    ("model", "check"))
+CASCADE_REPLIES = Counter(
+    "bot_cascade_replies_total",
+    "Persona replies by the model that produced them, the number of attempts and the final check (passed or the failed one).",
+    ("model", "attempts", "check"))
+CASCADE_ATTEMPT_DURATION = Histogram(
+    "bot_cascade_attempt_seconds",
+    "Duration of each cascade attempt, by model.",
+    ("model",))
+
+REFUSAL_PATTERN = re.compile(
+    r"\b(as an ai|language model|i'?m (just )?an? (ai|assistant|bot)|i can(no|')t (help|assist|do that)|i'?m sorry, but)\b",
+    re.IGNORECASE)
+# Shorter than this is not a chat reply ("k" is fine from a human, not from a persona answering a question).
+MIN_REPLY_CHARS = 2
+
+
+def quality_check(draft: dict, message_text: str) -> str | None:
+    """The name of the first check a draft fails, or None if it is good enough to send."""
+    if "error" in draft:
+        return "error"
+    text = draft["text"]
+    if len(text.strip()) < MIN_REPLY_CHARS:
+        return "empty"
+    if "error" in text.lower():
+        return "error_text"
+    if draft.get("finish_reason") == "length":
+        return "truncated"
+    if REFUSAL_PATTERN.search(text):
+        return "refusal"
+    # "gm" back to a "gm" is fine; parroting a whole sentence is not.
+    if len(message_text.split()) > 3 and text.strip().lower() == message_text.strip().lower():
+        return "echo"
+    return None
+
+
+class ModelCascade:
+    """Routes persona replies to the cheapest adequate model. Stateless apart from configuration."""
+    def __init__(self, models: list[str] | None = None, enabled: bool | None = None):
+        self.models = models or APP_CONFIG.get("cascade_models", ["gpt-4o-mini", "gpt-4o", "gpt-4"])
+        self.enabled = APP_CONFIG.get("cascade_enabled", True) if enabled is None else enabled
+        self.short_chars = APP_CONFIG.get("cascade_short_message_chars", 40)
+        self.long_chars = APP_CONFIG.get("cascade_long_message_chars", 280)
+        self.min_confidence = APP_CONFIG.get("cascade_min_triage_confidence", 0.75)
+
+    def route(self, message_text: str, channel: ChannelConfig | None, triage_confidence: float | None) -> tuple[list[str], str]:
+        """The models to try, in order, and the reason the first one was picked."""
+        pinned = channel.reply_model if channel else None
+        if pinned:
+            if pinned in self.models:
+                return self.models[self.models.index(pinned):], "channel"
+            return [pinned], "channel"
+        if len(self.models) > 1:
+            if len(message_text) >= self.long_chars:
+                return self.models[1:], "long"
+            if triage_confidence is not None and triage_confidence < self.min_confidence:
+                return self.models[1:], "low_confidence"
+        return self.models, "short" if len(message_text) <= self.short_chars else "default"
+
+    async def generate(self, prompt: str, message_text: str, channel: ChannelConfig | None = None,
+                       triage_confidence: float | None = None, max_tokens: int = 300) -> str:
+        """A persona reply to `prompt`, like get_llm_response (an "Error: ..." string on failure)."""
+        if not self.enabled:
+            # The strongest model, as before the cascade.
+            models, reason = self.models[-1:], "disabled"
+        else:
+            models, reason = self.route(message_text, channel, triage_confidence)
+        # In economy mode several tiers may map to the same model; trying it twice won't help.
+        models = list(dict.fromkeys(usage_ledger.choose_model(model) for model in models))
+        CASCADE_ROUTES.labels(reason, models[0]).inc()
+
+        for attempt, model in enumerate(models, start=1):
+            started = time.perf_counter()
+            draft = await get_llm_completion(prompt, model, max_tokens)
+            CASCADE_ATTEMPT_DURATION.labels(model).observe(time.perf_counter() - started)
+            failed = quality_check(draft, message_text)
+            if failed is None or attempt == len(models):
+                break
+            CASCADE_ESCALATIONS.labels(model, failed).inc()
+            logger.info("Cascade: %s draft failed the '%s' check. Escalating to %s.", model, failed, models[attempt])
+
+        CASCADE_REPLIES.labels(model, str(attempt), failed or "passed").inc()
+        if "error" in draft:
+            return draft["error"]
+        logger.info("Cascade: reply by %s (%s route, %s attempts).", model, reason, attempt)
+        return draft["text"]
+
+
+model_cascade = ModelCascade()
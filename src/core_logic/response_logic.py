@@ -1,5 +1,6 @@
 # src/core_logic/response_logic.py
 import json
+import logging
 import re
 import time
 import os
@@ -8,13 +9,26 @@ from sklearn.metrics.pairwise import cosine_similarity
 import asyncio
 
 from config.settings import APP_CONFIG
-from src.services.openai_chat import get_llm_response, get_embedding
+from src.services.openai_chat import DEFAULT_CHAT_MODEL, get_llm_response, get_embedding
 from src.services.fetch_db import get_last_100_message_texts, get_last_n_messages_as_text
 from src.core_logic.llm_personas import PersonaManager
 from src.services.state_manager import StateManager
 from src.services.grok_chat import get_grok_response
-from src.core_logic.memory import get_memory_context, add_to_memory
+from src.core_logic.memory import get_memory_context, add_to_memory, uses_local_memory
+from src.core_logic.model_cascade import model_cascade
+from src.core_logic.fact_cache import fact_cache
+from src.core_logic.topic_index import topic_index
+from src.core_logic.channel_summary import channel_summarizer, format_hooks
+from src.core_logic.channel_registry import channel_key, channel_registry
 from src.core_logic.internal_message import InternalMessage
+from src.services.deferred_generation import deferred_generator
+from src.services.metrics import track_stage
+from src.services.moderation import moderation_gate
+from src.services.structured_logging import log_payload, truncate
+from src.services.tracing import tag_payload
+from src.services.usage import set_usage_channel, set_usage_persona, usage_ledger
+
+logger = logging.getLogger(__name__)
 
 
 
@@ -24,7 +38,7 @@ if os.path.exists(embeddings_path):
         PERSONA_EMBEDDINGS = json.load(f)
 else:
     PERSONA_EMBEDDINGS = {}
-    print("WARNING: 'persona_embeddings.json' not found. Persona matching will be disabled.")
+    logger.warning("'persona_embeddings.json' not found. Persona matching will be disabled.")
 
 
 # Helper function to get the correct queue
@@ -36,21 +50,24 @@ async def humanize_grok_response(grok_data: str, original_question: str, persona
     Takes raw data from Grok and uses OpenAI to transform it into a natural,
     human-sounding chat message.
     """
-    print(f"[BRAIN] Humanizing Grok data: '{grok_data[:50]}...'")
+    logger.info("Humanizing Grok data: '%s...'", grok_data[:50])
+    # Moderate the draft while it is being humanized; it is also the fallback text below.
+    moderation_gate.prefetch(grok_data)
     
-    chosen_persona = persona_manager.get_random_persona()
+    chosen_persona = persona_manager.get_random_persona(channel_registry.personas_for(channel_id))
     if not chosen_persona:
         return f"NO PERSONA: {grok_data}"
 
-    persona_profile = f"Role: {chosen_persona.get('role', '')}. Voice: {chosen_persona.get('signature_voice', {}).get('tone', '')}."
-    print(f"[BRAIN] Using persona: {chosen_persona['persona_name']} with profile: {persona_profile}")
-    print(persona_profile)
+    persona_profile = persona_manager.get_persona_profile(chosen_persona)
+    set_usage_persona(chosen_persona['persona_name'])
+    logger.info("Using persona: %s with profile: %s", chosen_persona['persona_name'], persona_profile)
     # Get last n messages from the group
     try:
-        last_n_messages = await get_last_n_messages_as_text(channel_id, int(os.getenv("RESPONSE_CONTEXT_MESSAGES", "4")), db)
-        print(f"-----last_n_messages-----: {last_n_messages}")
+        with track_stage("humanize", "history_fetch"):
+            last_n_messages = await get_last_n_messages_as_text(channel_id, int(os.getenv("RESPONSE_CONTEXT_MESSAGES", "4")), db)
+        log_payload(logger, "last_n_messages", last_n_messages)
     except Exception as e:
-        print(f"[BRAIN] Error getting last messages: {e}")
+        logger.error("Error getting last messages: %s", e)
         last_n_messages = "No recent context available"
 
     # Humanizer prompt
@@ -109,8 +126,9 @@ async def humanize_grok_response(grok_data: str, original_question: str, persona
     try:
         #max_token = np.random.randint(10, 25)
         #humanized_reply = await get_llm_response(humanizer_prompt, max_tokens=30)
-        humanized_reply = await get_grok_response(humanizer_prompt)
-        print(f"-----humanized_reply-----: {humanized_reply}")
+        with track_stage("humanize", "generation"):
+            humanized_reply = await get_grok_response(humanizer_prompt)
+        log_payload(logger, "humanized_reply", humanized_reply)
         
         # Remove double quotes if the entire message is wrapped in them
         humanized_reply = re.sub(r'^"(.*)"|"(.*)$|^"(.*)', r'\1\2\3', humanized_reply.strip().lower())
@@ -119,86 +137,114 @@ async def humanize_grok_response(grok_data: str, original_question: str, persona
         if not humanized_reply or humanized_reply.strip() == "":
             raise ValueError("Empty response from ------------ GROK LLM -----------")
             
-        print(f"[BRAIN] Successfully humanized response: '{humanized_reply}'")
+        logger.info("Successfully humanized response: '%s'", humanized_reply)
+        moderation_gate.prefetch(humanized_reply)
         return humanized_reply
         
     except Exception as e:
-        print(f"[BRAIN] Humanizer failed with error: {e}. Falling back to raw data.")
+        logger.error("Humanizer failed with error: %s. Falling back to raw data.", e)
         # Return the raw grok data without the "I found this update:" prefix
         return grok_data
 
+
+async def humanize_unless_economy(draft: str, original_question: str, persona_manager: PersonaManager, channel_id: str, db) -> str:
+    """humanize_grok_response, except in economy mode, where the draft is returned as is."""
+    if usage_ledger.economy():
+        logger.info("Usage budget in economy mode. Sending the draft without humanizing it.")
+        moderation_gate.prefetch(draft)
+        return draft
+    return await humanize_grok_response(draft, original_question, persona_manager, channel_id, db)
+
 async def handle_realtime_query(message: InternalMessage, sender_queues: dict[str, asyncio.Queue], persona_manager: PersonaManager, db):
     """
     Handles real-time queries by first getting brief facts from Grok, then
     humanizing the response with OpenAI.
     """
-    print(f"[BRAIN] Routing message ID {message.message_id} from {message.platform} to Grok.")    
+    logger.info("Routing message ID %s from %s to Grok.", message.message_id, message.platform)    
     # Get memory context for the query
-    memory_context = get_memory_context(message.text, message.platform, message.sender_id)
-    print(f"-----memory_context for realtime query and for message {message.text}-----: {memory_context}, {message.message_id, {'platform': message.platform, 'sender_id': message.sender_id}}")
+    with track_stage("realtime_query", "memory_search"):
+        memory_context = await get_memory_context(message.text, message.platform, message.sender_id)
+    log_payload(logger, f"memory_context for realtime query from {message.platform}:{message.sender_id}", memory_context)
     
     grok_prompt = f"""##0. Previous chat Context. Use anything from this context if needed to make your response more natural: {memory_context} Regarding the user's query: '{message.text}'.
 Provide the single most important fact or data point as a raw, unformatted sentence. Be extremely brief. Do not explain.
 """
     
-    raw_grok_data = await get_grok_response(grok_prompt)
+    with track_stage("realtime_query", "grok_search"):
+        # Keyed by the bare question: the memory context only shapes phrasing, not the fact.
+        raw_grok_data = await fact_cache.get_or_fetch(message.text, lambda: get_grok_response(grok_prompt))
     
     if "Error:" in raw_grok_data:
-        print(f"[BRAIN] Grok service failed. Aborting response. Reason: {raw_grok_data}")
+        logger.error("Grok service failed. Aborting response. Reason: %s", raw_grok_data)
         return
 
-    final_reply = await humanize_grok_response(raw_grok_data, message.text, persona_manager, message.channel_id, db)
-    print(f"-----fact:raw grok data-----: {raw_grok_data}")
-    print(f"-----fact:humanized reply-----: {final_reply}")
+    with track_stage("realtime_query", "humanize"):
+        final_reply = await humanize_unless_economy(raw_grok_data, message.text, persona_manager, message.channel_id, db)
+    log_payload(logger, "fact: raw grok data", raw_grok_data)
+    log_payload(logger, "fact: humanized reply", final_reply)
 
     # Check for errors in final reply before sending to Telegram
     if "Error:" in final_reply or "error" in final_reply.lower() or not final_reply.strip():
-        print(f"[BRAIN] Error in final reply, not sending to Telegram: {final_reply}")
+        logger.error("Error in final reply, not sending to Telegram: %s", truncate(final_reply))
         return
 
     # Add query and response to memory
-    add_to_memory(message.text, "user", message.platform, message.sender_id)
-    add_to_memory(final_reply, "assistant", message.platform, "bot_assistant")
-    print(f"[BRAIN] Added query and response to memory for message {message.message_id}.")
+    with track_stage("realtime_query", "memory_add"):
+        await add_to_memory(message.text, "user", message.platform, message.sender_id)
+        await add_to_memory(final_reply, "assistant", message.platform, "bot_assistant")
+    logger.info("Added query and response to memory for message %s.", message.message_id)
     queue = _get_sender_queue(message.platform, sender_queues)
     if queue:
         payload = {
             "channel_id": message.channel_id,
             "message": final_reply,
-            "telegram_user": APP_CONFIG['sender_bot_users'][0] # Default user for facts
+            "telegram_user": APP_CONFIG['sender_bot_users'][0], # Default user for facts
+            "reply_to_at": message.received_time # The send delay counts from here (see src/senders/pacing.py)
         }
-        await queue.put(payload)
-        print(f"[BRAIN] Queued fact response for {message.platform} message {message.message_id}.")
+        moderation_gate.prefetch(payload["message"])
+        await queue.put(tag_payload(payload))
+        logger.info("Queued fact response for %s message %s.", message.platform, message.message_id)
     
-    print(f"[BRAIN] Queued final (humanized) response for message {message.message_id}.")
+    logger.info("Queued final (humanized) response for message %s.", message.message_id)
 
 
-async def handle_reaction(message: InternalMessage, sender_queues: dict[str, asyncio.Queue], persona_manager: PersonaManager, state_manager: StateManager, db):
-    """Generates a reaction using a two-stage process with persona stickiness."""
+async def handle_reaction(message: InternalMessage, sender_queues: dict[str, asyncio.Queue], persona_manager: PersonaManager, state_manager: StateManager, db,
+                          triage_confidence: float | None = None):
+    """Generates a reaction using a two-stage process with persona stickiness. The reply model is picked by the model cascade."""
     text = message.text
-    print(f"[BRAIN] Reacting to Message ID: {message.message_id}  from {message.platform}| Text: '{text[:40]}...'")
+    logger.info("Reacting to Message ID: %s from %s | Text: '%s...'", message.message_id, message.platform, text[:40])
+    channel = channel_registry.get(message.platform, message.channel_id)
+    allowed_personas = persona_manager.get_postable_persona_names(message.platform, channel.personas if channel else ())
+    state_key = channel_key(message.platform, message.channel_id)
     
+    # One embedding of the message serves persona matching and the local memory store.
+    user_embedding = None
+    if PERSONA_EMBEDDINGS or uses_local_memory():
+        with track_stage("reaction", "embedding"):
+            user_embedding = await get_embedding(text)
+
     # Get memory context for the message
-    memory_context = get_memory_context(text, message.platform, message.sender_id)
-    print(f"-----memory_context for reaction and for message {text}-----: {memory_context}")
+    with track_stage("reaction", "memory_search"):
+        memory_context = await get_memory_context(text, message.platform, message.sender_id, user_embedding)
+    log_payload(logger, "memory_context for reaction", memory_context)
     
-    conversation_context = await get_last_n_messages_as_text(message.channel_id, APP_CONFIG['response_context_messages'], db)
-    print(f"-----conversation_context for reaction and for message {text}-----: {conversation_context}")    
+    with track_stage("reaction", "history_fetch"):
+        conversation_context = await get_last_n_messages_as_text(message.channel_id, APP_CONFIG['response_context_messages'], db)
+    log_payload(logger, "conversation_context for reaction", conversation_context)
     # --- STAGE 1: LOCAL PERSONA MATCHING ---
     chosen_persona_name = None
     if PERSONA_EMBEDDINGS:
-        print("[BRAIN] Stage 1: Finding best persona using local embeddings...")
-        user_embedding = await get_embedding(text)
-        
+        logger.info("Stage 1: Finding best persona using local embeddings...")
         if user_embedding:
-            persona_names = list(PERSONA_EMBEDDINGS.keys())
-            persona_vectors = list(PERSONA_EMBEDDINGS.values())
+            # Only the channel's personas compete when it restricts them.
+            persona_names = [name for name in PERSONA_EMBEDDINGS if not allowed_personas or name in allowed_personas] or list(PERSONA_EMBEDDINGS)
+            persona_vectors = [PERSONA_EMBEDDINGS[name] for name in persona_names]
             
             user_vector = np.array(user_embedding).reshape(1, -1)
             scores = cosine_similarity(user_vector, np.array(persona_vectors))[0]
 
             # --- CLEANED UP: Persona Stickiness Logic ---
-            last_persona_info = state_manager.get_last_persona_info()
+            last_persona_info = state_manager.get_last_persona_info(state_key)
             last_persona_name = last_persona_info.get("name")
             last_persona_time = last_persona_info.get("timestamp", 0)
 
@@ -206,35 +252,32 @@ async def handle_reaction(message: InternalMessage, sender_queues: dict[str, asy
                 try:
                     idx = persona_names.index(last_persona_name)
                     bonus = 1.15 # 15% bonus to make it more impactful
-                    print(f"[BRAIN] Applying stickiness bonus of {bonus} to '{last_persona_name}'")
+                    logger.info("Applying stickiness bonus of %s to '%s'", bonus, last_persona_name)
                     scores[idx] *= bonus
                 except ValueError:
-                    print(f"[BRAIN] Warning: Last used persona '{last_persona_name}' not found in embeddings.")
+                    logger.warning("Last used persona '%s' not found in embeddings.", last_persona_name)
                     pass
 
             best_match_index = np.argmax(scores)
             chosen_persona_name = persona_names[best_match_index]
-            print(f"[BRAIN] Best local match found: '{chosen_persona_name}' with score {scores[best_match_index]:.4f}")
+            logger.info("Best local match found: '%s' with score %.4f", chosen_persona_name, scores[best_match_index])
     
     if not chosen_persona_name:
-        random_persona = persona_manager.get_random_persona()
+        random_persona = persona_manager.get_random_persona(allowed_personas)
         if not random_persona:
-            print("ERROR: Could not get a random persona. Aborting reaction.")
+            logger.error("Could not get a random persona. Aborting reaction.")
             return
         chosen_persona_name = random_persona['persona_name']
-        print(f"[BRAIN] Local matching failed. Falling back to random persona: '{chosen_persona_name}'")
+        logger.info("Local matching failed. Falling back to random persona: '%s'", chosen_persona_name)
 
     # --- STAGE 2: FOCUSED LLM CALL ---
     chosen_persona = persona_manager.get_persona_by_name(chosen_persona_name)
     if not chosen_persona:
-        print(f"ERROR: Could not find full profile for persona '{chosen_persona_name}'")
+        logger.error("Could not find full profile for persona '%s'", chosen_persona_name)
         return
 
-    persona_profile = (
-    f"Role: {chosen_persona.get('role', '')}. "
-    f"Voice: {chosen_persona.get('signature_voice', {}).get('tone', '')}. "
-    f"Expertise: {', '.join(chosen_persona.get('expertise', []))}. "
-    f"Traits: {', '.join(chosen_persona.get('key_traits', []))}.")
+    persona_profile = persona_manager.get_persona_profile(chosen_persona, detailed=True)
+    set_usage_persona(chosen_persona_name)
 
 
     super_prompt = f"""
@@ -304,25 +347,29 @@ This is the context of the last few messages. The "User's Message" at the end is
 YOUR REPLY (RAW TEXT ONLY):
 """
 
-    reply = await get_llm_response(super_prompt, max_tokens=60)
+    with track_stage("reaction", "generation"):
+        reply = await model_cascade.generate(super_prompt, text, channel, triage_confidence, max_tokens=60)
     reply = re.sub(r'^"(.*)"$', r'\1', reply.strip())
 
-    print(f"-----Reaction: persona-based-reply-----: {reply}")
-    reply = await humanize_grok_response(reply, text, persona_manager, message.channel_id, db)
-    print(f"-----Reaction:persona-based-reply-after-humanization-----: {reply}")
+    log_payload(logger, "reaction: persona-based reply", reply)
+    with track_stage("reaction", "humanize"):
+        reply = await humanize_unless_economy(reply, text, persona_manager, message.channel_id, db)
+    log_payload(logger, "reaction: persona-based reply after humanization", reply)
 
     # Check for various error patterns before sending to Telegram
     if "Error:" in reply or "error" in reply.lower() or not reply.strip():
-        print(f"Error in LLM response, not sending to Telegram: {reply}")
+        logger.error("Error in LLM response, not sending to Telegram: %s", truncate(reply))
         return
     
     # Add message and response to memory
-    add_to_memory(text, "user", message.platform, message.sender_id)
-    add_to_memory(reply, "assistant", message.platform, "bot_assistant")
+    with track_stage("reaction", "memory_add"):
+        await add_to_memory(text, "user", message.platform, message.sender_id, user_embedding)
+        await add_to_memory(reply, "assistant", message.platform, "bot_assistant")
     
     # --- CLEANED UP: Update the state with the chosen persona ---
-    state_manager.update_last_persona_info(chosen_persona_name)
-    print(f"[BRAIN] Updated last used persona to '{chosen_persona_name}'")
+    with track_stage("reaction", "state_update"):
+        state_manager.update_last_persona_info(chosen_persona_name, state_key)
+    logger.info("Updated last used persona to '%s'", chosen_persona_name)
     
     queue = _get_sender_queue(message.platform, sender_queues)
     if queue:
@@ -330,27 +377,40 @@ YOUR REPLY (RAW TEXT ONLY):
         payload = {
             "channel_id": message.channel_id,
             "message": reply, 
-            "telegram_user": user_to_send
+            "telegram_user": user_to_send,
+            "reply_to_at": message.received_time # The send delay counts from here (see src/senders/pacing.py)
         }
-        await queue.put(payload)
-        print(f"[BRAIN] Queued persona reply for {message.platform} message {message.message_id}.")
-    
-    print(f"Brain: Queued reply from {chosen_persona_name} for message {message.message_id}.")
+        moderation_gate.prefetch(payload["message"])
+        await queue.put(tag_payload(payload))
+        logger.info("Queued persona reply for %s message %s.", message.platform, message.message_id)
     
-async def handle_initiation(platform: str, channel_id: str, sender_queues: dict[str, asyncio.Queue], persona_manager: PersonaManager, state_manager: StateManager, db):
-    """Generates a new, non-repetitive, engaging topic and queues it for sending."""
-    print(f"[BRAIN] Handling topic initiation for {platform}. ..")
+    logger.info("Queued reply from %s for message %s.", chosen_persona_name, message.message_id)
     
-    messages = await get_last_100_message_texts(channel_id, db)
-    if not messages:
-        print("[BRAIN] No chat history found to analyze. Skipping initiation.")
-        return
-
-    chat_history = "\n".join(messages)
+def initiation_key(platform: str, channel_id: str) -> str:
+    """The deferred generation key of a channel's next initiation."""
+    return f"initiation:{channel_key(platform, channel_id)}"
+
+
+async def build_initiation_prompt(platform: str, channel_id: str, state_manager: StateManager, db) -> str | None:
+    """The re-engagement prompt for a channel, or None if there is nothing to initiate from."""
+    # The rolling summary already lists the unresolved threads; fall back to scanning history until it has some.
+    summary = channel_summarizer.get(platform, channel_id, state_manager)
+    if summary:
+        logger.info("Initiating from the rolling summary (%s open threads).", len(summary["hooks"]))
+        analysis_heading = "CHAT SUMMARY AND OPEN THREADS FOR ANALYSIS"
+        analysis_material = f"Summary: {summary['summary']}\nOpen threads (time of their latest message):\n{format_hooks(summary)}"
+    else:
+        with track_stage("initiation", "history_fetch"):
+            messages = await get_last_100_message_texts(channel_id, db)
+        if not messages:
+            logger.info("No chat history found to analyze. Skipping initiation.")
+            return None
+        analysis_heading = "CHAT HISTORY FOR ANALYSIS"
+        analysis_material = "\n".join(messages)[:3000]
     
     # Get memory context for topic initiation
-    memory_context = get_memory_context("topic initiation", platform, "system_initiator")
-    print(f"-----memory_context for topic initiation-----: {memory_context}")
+    memory_context = await get_memory_context("topic initiation", platform, "system_initiator")
+    log_payload(logger, "memory_context for topic initiation", memory_context)
 
     # FULL ORIGINAL PROMPT - keeping everything the same
     reengagement_prompt = f"""
@@ -371,9 +431,9 @@ Analyze the provided chat history. Your mission is to find the single most compe
 - **LAW #3: BE SPECIFIC, NOT GENERIC.** Do not ask "What does everyone think about NFTs?". Instead, ask "Related to the royalties chat, do you think projects will start enforcing them off-chain too?". Be specific to the conversation you are reviving.
 - **LAW #4: BE EXTREMELY BRIEF.** The final question must be short and punchy, as if typed on a phone. Ideally under 20 words.
 
-## 3.5. CHAT HISTORY FOR ANALYSIS
+## 3.5. {analysis_heading}
 ---
-{chat_history[:3000]}
+{analysis_material}
 ---
 
 ## 4. REQUIRED OUTPUT (JSON ONLY)
@@ -394,22 +454,64 @@ Example Output:
 ---
 YOUR JSON RESPONSE:
     """
-    
-    try:
+    return reengagement_prompt
+
+
+async def defer_initiation(platform: str, channel_id: str, state_manager: StateManager, db) -> bool:
+    """Requests a channel's next initiation from the deferred generator, ahead of its idle deadline."""
+    prompt = await build_initiation_prompt(platform, channel_id, state_manager, db)
+    if prompt is None:
+        return False
+    return deferred_generator.request(initiation_key(platform, channel_id), prompt, DEFAULT_CHAT_MODEL, 300,
+                                      {"channel": channel_key(platform, channel_id)})
+
+
+async def handle_initiation(platform: str, channel_id: str, sender_queues: dict[str, asyncio.Queue], persona_manager: PersonaManager, state_manager: StateManager, db):
+    """Generates a new, non-repetitive, engaging topic and queues it for sending."""
+    logger.info("Handling topic initiation for %s.", platform)
+    if usage_ledger.exhausted():
+        logger.warning("Usage budget exhausted. Skipping initiation.")
+        return
+
+    # Prepared in a batch ahead of the deadline if possible; the topic checks below still apply.
+    deferred = deferred_generator.take(initiation_key(platform, channel_id))
+    if deferred is not None:
+        logger.info("Using the initiation generated in a deferred batch.")
+        response_str = deferred["text"]
+    else:
+        reengagement_prompt = await build_initiation_prompt(platform, channel_id, state_manager, db)
+        if reengagement_prompt is None:
+            return
         # Get the LLM response (should be JSON)
-        response_str = await get_llm_response(reengagement_prompt, max_tokens=300)
-        print(f"[BRAIN] Raw LLM response: {response_str}")
+        with track_stage("initiation", "generation"):
+            response_str = await get_llm_response(reengagement_prompt, max_tokens=300)
+
+    try:
+        log_payload(logger, "raw initiation response", response_str)
+
+        # Reject a paraphrase of a recent topic before paying for the humanize call.
+        topic_embedding = []
+        try:
+            draft_topic = json.loads(response_str).get("topic_summary")
+        except (json.JSONDecodeError, AttributeError):
+            draft_topic = None
+        if draft_topic:
+            with track_stage("initiation", "topic_dedupe"):
+                is_duplicate, topic_embedding = await topic_index.check(draft_topic, state_manager)
+            if is_duplicate:
+                logger.info("Topic '%s' repeats a recent one. Skipping initiation.", draft_topic)
+                return
         
         # Now humanize it using humanize_grok_response
-        humanized_response = await humanize_grok_response(response_str, "topic initiation", persona_manager, channel_id, db)        
-        print(f"[BRAIN] Humanized response: {humanized_response}")
+        humanized_response = await humanize_unless_economy(response_str, "topic initiation", persona_manager, channel_id, db)
+        log_payload(logger, "humanized initiation response", humanized_response)
         
         # Try to parse the humanized response as JSON first
         try:
             data = json.loads(humanized_response)
         except json.JSONDecodeError:
             # If humanized response is not JSON, try the original response
-            print("[BRAIN] Humanized response is not JSON, trying original response")
+            logger.info("Humanized response is not JSON, trying original response")
             data = json.loads(response_str)
         
         topic = data.get("topic_summary")
@@ -417,67 +519,86 @@ YOUR JSON RESPONSE:
         
         if not (topic and question):
             raise ValueError("Missing required keys in JSON response")
+        dedupe_text = topic
             
-        print(f"[BRAIN] Parsed topic: '{topic}', question: '{question}'")
+        logger.info("Parsed topic: '%s', question: '%s'", topic, question)
         
         # If we used the original JSON, now humanize just the question
-        if humanized_response != response_str and '"' in humanized_response:
-            # The humanized response was JSON, use it as is
+        if humanized_response == response_str or '"' in humanized_response:
+            # The humanized response was JSON (or the unhumanized draft itself), use its question
             final_question = question
         else:
             # The humanized response was casual text, use that as the question
             final_question = humanized_response
             
-        print(f"[BRAIN] Final question to send: '{final_question}'")
+        logger.info("Final question to send: '%s'", final_question)
         
     except json.JSONDecodeError as e:
-        print(f"[BRAIN] JSON parsing failed completely. Error: {e}")
-        print(f"[BRAIN] Original response: {response_str}")
-        print(f"[BRAIN] Humanized response: {humanized_response}")
+        logger.error("JSON parsing failed completely. Error: %s", e)
+        logger.info("Original response: %s", truncate(response_str))
+        logger.info("Humanized response: %s", truncate(humanized_response))
         
         # If humanized response looks like a question, use it directly
         if "?" in humanized_response or any(word in humanized_response.lower() for word in ["what", "how", "why", "when", "where", "who"]):
             topic = f"humanized_topic_{int(time.time())}"
             final_question = humanized_response
-            print(f"[BRAIN] Using humanized response as direct question")
+            # The placeholder topic carries no meaning; compare the question itself.
+            dedupe_text = final_question
+            logger.info("Using humanized response as direct question")
         else:
-            print(f"[BRAIN] Complete fallback - skipping initiation")
+            logger.info("Complete fallback - skipping initiation")
             return
         
     except Exception as e:
-        print(f"[BRAIN] Initiation failed with error: {e}")
+        logger.error("Initiation failed with error: %s", e)
         return
 
     # --- MEMORY CHECK ---
     if state_manager.is_topic_recently_initiated(topic):
-        print(f"[BRAIN] Topic '{topic}' was initiated recently. Skipping to avoid repetition.")
+        logger.info("Topic '%s' was initiated recently. Skipping to avoid repetition.", topic)
         return
+    if dedupe_text != draft_topic:
+        # Humanizing changed the summary, so the early check didn't see this one.
+        is_duplicate, topic_embedding = await topic_index.check(dedupe_text, state_manager)
+        if is_duplicate:
+            logger.info("Topic '%s' repeats a recent one. Skipping initiation.", topic)
+            return
 
     # If the topic is new, log it before sending
-    state_manager.log_initiated_topic(topic)
-    print(f"[BRAIN] New unique topic identified: '{topic}'. Logging and preparing to send.")
+    state_manager.log_initiated_topic(topic, topic_embedding)
+    if topic_embedding:
+        topic_index.add(topic, topic_embedding)
+    logger.info("New unique topic identified: '%s'. Logging and preparing to send.", topic)
     
     # Add the initiated topic to memory
-    add_to_memory(final_question, "assistant", platform, "bot_assistant")
+    await add_to_memory(final_question, "assistant", platform, "bot_assistant")
     
     # Pick a random persona to ask the question
-    persona = persona_manager.get_random_persona()
+    channel = channel_registry.get(platform, channel_id)
+    persona = persona_manager.get_random_persona(persona_manager.get_postable_persona_names(platform, channel.personas if channel else ()))
     if not persona: 
-        print("[BRAIN] No persona available for initiation")
+        logger.info("No persona available for initiation")
         return
     
     queue = _get_sender_queue(platform, sender_queues)
     if queue:
         user_to_send = persona.get("telegram_user")
         payload = {"channel_id": channel_id, "message": final_question, "telegram_user": user_to_send}
-        await queue.put(payload)
-        print(f"[BRAIN] Queued initiation for {platform}.")
-    print(f"[BRAIN] Queued re-engagement question from {persona['persona_name']}.")
+        moderation_gate.prefetch(payload["message"])
+        await queue.put(tag_payload(payload))
+        logger.info("Queued initiation for %s.", platform)
+    logger.info("Queued re-engagement question from %s.", persona['persona_name'])
+
+def link_post_key(link: str, post_count: int) -> str:
+    """The deferred generation key of a link's next post."""
+    return f"link:{link}:{post_count}"
 
-async def handle_scheduled_link_post(link_info: dict, sender_queues: dict[str, asyncio.Queue], persona_manager: PersonaManager, db):
+
+async def build_link_prompt(link_info: dict, persona_manager: PersonaManager, db) -> tuple[str, dict, str] | None:
     """
-    Handles the entire intelligent process of posting a scheduled link.
-    Returns a dictionary for the sender_queue or None on failure.
+    Picks the persona and builds the link sharing prompt. Returns the prompt, the
+    sender payload without its message and the persona name, or None if the link
+    can't be posted.
     """
     link: str | None = link_info.get("link")
     description: str | None = link_info.get("description")
@@ -486,43 +607,48 @@ async def handle_scheduled_link_post(link_info: dict, sender_queues: dict[str, a
     
     
     if not all([link, description, platform, channel_id]):
-        print(f"[SCHEDULER] Skipping link post due to missing data (link, description, platform, or channel_id): {link_info}")
-        return
-
+        logger.warning("Skipping link post due to missing data (link, description, platform, or channel_id): %s", link_info)
+        return None
+    set_usage_channel(channel_key(platform, channel_id))
 
-    print(f"[SCHEDULER] Processing link: {link}")
+    logger.info("Processing link: %s", link)
 
     # 1. Content-Aware Persona Selection
     # We use the link's description to find the best persona
-    print("[SCHEDULER] Finding best persona for this content...")
-    description_embedding = await get_embedding(description)
+    logger.info("Finding best persona for this content...")
+    with track_stage("link_post", "embedding"):
+        description_embedding = await get_embedding(description)
     
+    channel = channel_registry.get(platform, channel_id)
+    allowed_personas = persona_manager.get_postable_persona_names(platform, channel.personas if channel else ())
     chosen_persona_name = None
     if PERSONA_EMBEDDINGS and description_embedding:
-        persona_names = list(PERSONA_EMBEDDINGS.keys())
-        persona_vectors = list(PERSONA_EMBEDDINGS.values())
+        persona_names = [name for name in PERSONA_EMBEDDINGS if not allowed_personas or name in allowed_personas] or list(PERSONA_EMBEDDINGS)
+        persona_vectors = [PERSONA_EMBEDDINGS[name] for name in persona_names]
         
         desc_vector = np.array(description_embedding).reshape(1, -1)
         scores = cosine_similarity(desc_vector, np.array(persona_vectors))
         
         best_match_index = np.argmax(scores)
         chosen_persona_name = persona_names[best_match_index]
-        print(f"[SCHEDULER] Best persona match: '{chosen_persona_name}'")
+        logger.info("Best persona match: '%s'", chosen_persona_name)
     
     if not chosen_persona_name:
-        chosen_persona = persona_manager.get_random_persona()
+        chosen_persona = persona_manager.get_random_persona(allowed_personas)
     else:
         chosen_persona = persona_manager.get_persona_by_name(chosen_persona_name)
     
     if not chosen_persona:
-        print("[SCHEDULER] ERROR: Could not select a persona. Aborting.")
+        logger.error("Could not select a persona. Aborting.")
         return None
+    set_usage_persona(chosen_persona['persona_name'])
 
     # 2. Dynamic Contextualization
-    print(f"[SCHEDULER] Fetching recent chat for context {channel_id}...")
-    chat_context = await get_last_n_messages_as_text(channel_id, 5, db)
+    logger.info("Fetching recent chat for context %s...", channel_id)
+    with track_stage("link_post", "history_fetch"):
+        chat_context = await get_last_n_messages_as_text(channel_id, 5, db)
 
-    persona_profile = f"Role: {chosen_persona.get('role', '')}. Voice: {chosen_persona.get('signature_voice', {}).get('tone', '')}."
+    persona_profile = persona_manager.get_persona_profile(chosen_persona)
 
     # 3. Build and Execute the Link Sharing Prompt
     link_sharing_prompt = f"""
@@ -550,23 +676,66 @@ Based on the persona, the link, and the recent chat context, write a short, casu
 
 YOUR CHAT MESSAGE (RAW TEXT ONLY):
 """
-    
-    crafted_message = await get_llm_response(link_sharing_prompt, max_tokens=100)
+    # The payload must contain all info the sender worker needs
+    payload = {
+        "platform": platform,
+        "channel_id": channel_id,
+        "telegram_user": chosen_persona.get("telegram_user") # This is used by telegram_sender, ignored by others
+    }
+    return link_sharing_prompt, payload, chosen_persona['persona_name']
+
+
+async def defer_link_post(link_info: dict, post_count: int, persona_manager: PersonaManager, db) -> bool:
+    """Requests a link's next post from the deferred generator, ahead of its slot."""
+    built = await build_link_prompt(link_info, persona_manager, db)
+    if built is None:
+        return False
+    link_sharing_prompt, payload, persona_name = built
+    meta = {**payload, "channel": channel_key(payload["platform"], payload["channel_id"]), "persona": persona_name}
+    return deferred_generator.request(link_post_key(link_info["link"], post_count), link_sharing_prompt,
+                                      DEFAULT_CHAT_MODEL, 100, meta)
+
+
+async def prepare_link_post(link_info: dict, persona_manager: PersonaManager, db, deferred_key: str | None = None) -> dict | None:
+    """
+    Does the expensive part of a scheduled link post (persona matching, context
+    fetch and generation) ahead of time. Returns the sender payload, or None on
+    failure. The scheduler puts it on the queue with `enqueue_link_post` once due.
+    If the post was generated in a deferred batch under `deferred_key`, that text is used.
+    """
+    if usage_ledger.exhausted():
+        logger.warning("Usage budget exhausted. Skipping link post for %s.", link_info.get("link"))
+        return None
+
+    deferred = deferred_generator.take(deferred_key) if deferred_key else None
+    if deferred is not None:
+        logger.info("Using the link post generated in a deferred batch for %s.", link_info.get("link"))
+        meta = deferred["meta"]
+        payload = {"platform": meta["platform"], "channel_id": meta["channel_id"], "telegram_user": meta.get("telegram_user")}
+        crafted_message = deferred["text"]
+    else:
+        built = await build_link_prompt(link_info, persona_manager, db)
+        if built is None:
+            return None
+        link_sharing_prompt, payload, _ = built
+        with track_stage("link_post", "generation"):
+            crafted_message = await get_llm_response(link_sharing_prompt, max_tokens=100)
 
     if "Error:" in crafted_message or not crafted_message.strip():
-        print(f"[SCHEDULER] ERROR: LLM failed to craft a message for the link.")
+        logger.error("LLM failed to craft a message for the link.")
         return None
 
-    queue = _get_sender_queue(platform, sender_queues)
-    if queue:
-        # The payload must contain all info the sender worker needs
-        payload = {
-            "platform": platform,
-            "channel_id": channel_id,
-            "message": crafted_message,
-            "telegram_user": chosen_persona.get("telegram_user") # This is used by telegram_sender, ignored by others
-        }
-        await queue.put(payload)
-        print(f"[SCHEDULER] Queued link post to '{platform}' sender for channel '{channel_id}'.")
-    else:
-        print(f"[SCHEDULER] ERROR: Could not find a sender queue for platform '{platform}'.")
\ No newline at end of file
+    # Prepared ahead of its slot, so the verdict is long cached by the time it is sent.
+    moderation_gate.prefetch(crafted_message)
+    return {**payload, "message": crafted_message}
+
+
+async def enqueue_link_post(payload: dict, sender_queues: dict[str, asyncio.Queue]) -> bool:
+    """Puts a prepared link post on its sender queue."""
+    queue = _get_sender_queue(payload["platform"], sender_queues)
+    if not queue:
+        logger.error("Could not find a sender queue for platform '%s'.", payload["platform"])
+        return False
+    await queue.put(tag_payload(payload))
+    logger.info("Queued link post to '%s' sender for channel '%s'.", payload["platform"], payload["channel_id"])
+    return True
\ No newline at end of file
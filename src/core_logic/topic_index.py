@@ -0,0 +1,125 @@
+# src/core_logic/topic_index.py
+"""
+Semantic dedupe index for initiated topics.
+
+The exact-match log in StateManager misses paraphrases ("on-chain governance
+debate" vs "whales controlling DAO votes"), and each miss costs a humanize call
+and a repetitive post. The index keeps the normalized embedding of every topic
+initiated within the retention window in one matrix, so a new topic is checked
+against all of them with a single matrix-vector product.
+
+Similarity decays with age: a past topic counts as
+`cosine * 0.5 ** (age / TOPIC_DEDUPE_HALF_LIFE_HOURS)`, so a close paraphrase of
+yesterday's topic is rejected while the same subject can come back weeks later.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+import numpy as np
+
+from config.settings import APP_CONFIG
+from src.services.metrics import Counter, Gauge
+from src.services.openai_chat import get_embedding, get_embeddings
+from src.services.state_manager import StateManager
+
+logger = logging.getLogger(__name__)
+
+TOPIC_DEDUPE_CHECKS = Counter(
+    "bot_topic_dedupe_checks_total",
+    "Initiation topic checks by outcome (unique, duplicate, bypass).",
+    ("outcome",))
+TOPIC_INDEX_ENTRIES = Gauge(
+    "bot_topic_index_entries",
+    "Initiated topics held in the semantic dedupe index.")
+
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class TopicIndex:
+    """Embeddings of recent topics. All methods run on the event loop thread."""
+    def __init__(self, similarity: float | None = None, half_life_hours: float | None = None,
+                 max_entries: int | None = None):
+        self.similarity = APP_CONFIG.get("topic_dedupe_similarity", 0.85) if similarity is None else similarity
+        half_life_hours = APP_CONFIG.get("topic_dedupe_half_life_hours", 72.0) if half_life_hours is None else half_life_hours
+        self.half_life = half_life_hours * 3600
+        self.max_entries = APP_CONFIG.get("topic_index_max_entries", 1000) if max_entries is None else max_entries
+        self._topics: list[str] = []
+        self._vectors: np.ndarray | None = None
+        self._times = np.empty(0, dtype=np.float64)
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        TOPIC_INDEX_ENTRIES.labels().set_function(lambda: len(self._topics))
+
+    async def ensure_loaded(self, state_manager: StateManager):
+        """Loads recent topics from state once, embedding those logged without a vector in one batch request."""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            entries = await asyncio.to_thread(state_manager.get_recent_initiated_topics)
+            missing = [entry for entry in entries if not entry.get("embedding")]
+            if missing:
+                embeddings = await get_embeddings([entry["topic"] for entry in missing])
+                for entry, embedding in zip(missing, embeddings):
+                    entry["embedding"] = embedding
+                    await asyncio.to_thread(state_manager.set_topic_embedding, entry["topic"], embedding)
+            for entry in sorted(entries, key=lambda e: e["initiated_at"]):
+                if entry.get("embedding"):
+                    self.add(entry["topic"], entry["embedding"], datetime.fromisoformat(entry["initiated_at"]).timestamp())
+            self._loaded = True
+            logger.info("Loaded %s recent topics into the topic index (%s backfilled).", len(self._topics), len(missing))
+
+    def add(self, topic: str, embedding, timestamp: float | None = None):
+        vector = _normalize(embedding)[np.newaxis, :]
+        if self._vectors is None or self._vectors.shape[1] != vector.shape[1]:
+            # First entry, or the embedding model changed; older vectors can't be compared.
+            self._topics, self._vectors, self._times = [], vector, np.empty(0, dtype=np.float64)
+        else:
+            self._vectors = np.vstack([self._vectors, vector])
+        self._topics.append(topic)
+        self._times = np.append(self._times, time.time() if timestamp is None else timestamp)
+        if len(self._topics) > self.max_entries:
+            drop = len(self._topics) - self.max_entries
+            self._topics, self._vectors, self._times = self._topics[drop:], self._vectors[drop:], self._times[drop:]
+
+    def find_similar(self, embedding, now: float | None = None) -> tuple[str, float] | None:
+        """The recent topic whose decayed similarity to `embedding` passes the threshold, with its score."""
+        if not self._topics:
+            return None
+        vector = _normalize(embedding)
+        if vector.shape[0] != self._vectors.shape[1]:
+            return None
+        ages = np.maximum((time.time() if now is None else now) - self._times, 0.0)
+        scores = (self._vectors @ vector) * np.power(0.5, ages / self.half_life)
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity:
+            return self._topics[best], float(scores[best])
+        return None
+
+    async def check(self, topic: str, state_manager: StateManager) -> tuple[bool, list[float]]:
+        """
+        Returns (is_duplicate, embedding) for a candidate topic. The embedding is
+        handed back so the caller can log the topic without embedding it again.
+        """
+        await self.ensure_loaded(state_manager)
+        embedding = await get_embedding(topic)
+        if not embedding:
+            TOPIC_DEDUPE_CHECKS.labels("bypass").inc()
+            return False, []
+        match = self.find_similar(embedding)
+        if match:
+            TOPIC_DEDUPE_CHECKS.labels("duplicate").inc()
+            logger.info("Topic '%s' is a near-duplicate of recent topic '%s' (score %.2f).", topic, match[0], match[1])
+            return True, embedding
+        TOPIC_DEDUPE_CHECKS.labels("unique").inc()
+        return False, embedding
+
+
+topic_index = TopicIndex()
@@ -1,14 +1,31 @@
 # src/listeners/discord_listener.py
 
+import logging
+from datetime import datetime
+from typing import AsyncIterator
 import discord
 from asyncio import Queue
 from src.core_logic.internal_message import InternalMessage
+from src.services.structured_logging import set_request_id
 
-def setup_discord_listener(client: discord.Client, brain_queue: Queue, target_channel_id: str):
+logger = logging.getLogger(__name__)
+
+
+def _to_internal(message: discord.Message) -> InternalMessage:
+    return InternalMessage(
+        platform='discord',
+        channel_id=str(message.channel.id),
+        message_id=str(message.id),
+        text=message.content,
+        sender_id=str(message.author.id)
+    )
+
+
+def setup_discord_listener(client: discord.Client, brain_queue: Queue, channel_ids: frozenset[str]):
     """
     Sets up the event handler for the Discord client.
     """
-    print("[DISCORD_LISTENER] Setting up event handler...")
+    logger.info("Setting up event handler...")
 
     @client.event
     async def on_message(message: discord.Message):
@@ -16,26 +33,37 @@ def setup_discord_listener(client: discord.Client, brain_queue: Queue, target_ch
         if message.author.bot:
             return
 
-        # 2. Ignore messages that are not from our target channel
-        if str(message.channel.id) != target_channel_id:
+        # 2. Ignore messages that are not from one of our channels
+        if str(message.channel.id) not in channel_ids:
             return
             
         # 3. Ensure the message has content
         if not message.content:
             return
 
-        print(f"[DISCORD_LISTENER] Received Discord message: '{message.content[:50]}...'")
+        set_request_id(f"discord:{message.id}")
+        logger.info("Received Discord message: '%s...'", message.content[:50])
 
         # 4. Convert the Discord message into our standardized InternalMessage
-        internal_msg = InternalMessage(
-            platform='discord',
-            channel_id=str(message.channel.id),
-            message_id=str(message.id),
-            text=message.content,
-            sender_id=str(message.author.id)
-        )
+        internal_msg = _to_internal(message)
         
         # 5. Put the standardized message onto the brain queue
         await brain_queue.put(internal_msg)
 
-    print("[DISCORD_LISTENER] Event handler registered.")
\ No newline at end of file
+    logger.info("Event handler registered.")
+
+
+async def fetch_discord_history(client: discord.Client, channel_id: str, cursor: dict | None,
+                                since: datetime, until: datetime, limit: int) -> AsyncIterator[tuple[InternalMessage, datetime]]:
+    """Messages sent in [since, until) after the `cursor` message, newest first, paged by discord.py."""
+    after_id = str(cursor["message_id"]) if cursor else ""
+    await client.wait_until_ready()
+    channel = client.get_channel(int(channel_id)) or await client.fetch_channel(int(channel_id))
+    after = discord.Object(id=int(after_id)) if after_id.isdigit() else since
+    async for message in channel.history(limit=limit, after=after, before=until, oldest_first=False):
+        if message.created_at < since:
+            break
+        # Same filter as the live handler: no bot messages, nothing without content.
+        if message.author.bot or not message.content:
+            continue
+        yield _to_internal(message), message.created_at
@@ -1,16 +1,40 @@
 # src/listeners/slack_listener.py
 
+import logging
 import asyncio
+from datetime import datetime, timezone
+from typing import AsyncIterator
 from slack_bolt.async_app import AsyncApp
+from slack_sdk.web.async_client import AsyncWebClient
 from src.core_logic.internal_message import InternalMessage
+from src.services.structured_logging import set_request_id
 from asyncio import Queue
 
-async def slack_listener_worker(app: AsyncApp, brain_queue: Queue, target_channel_id: str):
+logger = logging.getLogger(__name__)
+
+# conversations.history returns at most 200 messages per page (Slack recommends 200 or fewer).
+HISTORY_PAGE_SIZE = 200
+# Slack message ids aren't ordered, so history is paged by time from a little
+# before the stored cursor message; the caller skips messages it already has.
+CURSOR_OVERLAP_SECS = 60
+
+
+def _to_internal(event: dict, channel_id: str) -> InternalMessage:
+    return InternalMessage(
+        platform='slack',
+        channel_id=str(channel_id),
+        message_id=str(event.get("client_msg_id", event.get("ts"))),
+        text=str(event.get("text")),
+        sender_id=str(event.get("user"))
+    )
+
+
+async def slack_listener_worker(app: AsyncApp, brain_queue: Queue, channel_ids: frozenset[str]):
     """
     A dedicated worker that listens for Slack messages, converts them,
     and puts them on the brain_queue.
     """
-    print("[SLACK_LISTENER] Worker started.")
+    logger.info("Worker started.")
     
     # CORRECTED: Use the more general "message" event handler
     @app.event("message")
@@ -24,8 +48,8 @@ async def slack_listener_worker(app: AsyncApp, brain_queue: Queue, target_channe
         channel_id = event.get("channel")
         
 
-        # 1. Ignore messages that are not from our target channel
-        if channel_id != target_channel_id:
+        # 1. Ignore messages that are not from one of our channels
+        if channel_id not in channel_ids:
             return
 
         # 2. Ignore messages from bots (including ourself) to prevent loops
@@ -36,20 +60,37 @@ async def slack_listener_worker(app: AsyncApp, brain_queue: Queue, target_channe
         if not text:
             return
         
-        print(f"[SLACK_DEBUG] Message received. Event User ID: {event.get('user')}, Bot ID: {event.get('bot_id')}")
+        set_request_id(f"slack:{event.get('client_msg_id', event.get('ts'))}")
+        logger.debug("Message received. Event User ID: %s, Bot ID: %s", event.get('user'), event.get('bot_id'))
 
-        print(f"[SLACK_LISTENER] Received Slack message in target channel: '{text[:50]}...'")
+        logger.info("Received Slack message in target channel: '%s...'", text[:50])
 
         # Convert the Slack message into our standardized InternalMessage format
-        internal_msg = InternalMessage(
-            platform='slack',
-            channel_id=str(channel_id),
-            message_id=str(event.get("client_msg_id", event.get("ts"))),
-            text=str(text),
-            sender_id=str(event.get("user"))
-        )
+        internal_msg = _to_internal(event, channel_id)
         
         # Put the standardized message onto the brain queue for processing
         await brain_queue.put(internal_msg)
 
-    print("[SLACK_LISTENER] General message handler registered.")
\ No newline at end of file
+    logger.info("General message handler registered.")
+
+
+async def fetch_slack_history(client: AsyncWebClient, channel_id: str, cursor: dict | None,
+                              since: datetime, until: datetime, limit: int) -> AsyncIterator[tuple[InternalMessage, datetime]]:
+    """Messages sent in [since, until) around and after the `cursor` message, newest first, paged through conversations.history."""
+    if cursor:
+        since = max(since, datetime.fromtimestamp(cursor["ts"] - CURSOR_OVERLAP_SECS, timezone.utc))
+    page = None
+    fetched = 0
+    while fetched < limit:
+        response = await client.conversations_history(
+            channel=channel_id, oldest=f"{since.timestamp():.6f}", latest=f"{until.timestamp():.6f}",
+            limit=min(HISTORY_PAGE_SIZE, limit - fetched), cursor=page)
+        for event in response.get("messages", []):
+            fetched += 1
+            # Same filter as the live handler: no bot messages, nothing without text.
+            if event.get("bot_id") or not event.get("text"):
+                continue
+            yield _to_internal(event, channel_id), datetime.fromtimestamp(float(event["ts"]), timezone.utc)
+        page = (response.get("response_metadata") or {}).get("next_cursor")
+        if not response.get("has_more") or not page:
+            break
@@ -1,33 +1,57 @@
 # src/listeners/telegram_listener.py
 
+import logging
 import asyncio
+from datetime import datetime
+from typing import AsyncIterator
 from telethon import TelegramClient, events
 from src.core_logic.internal_message import InternalMessage
+from src.services.structured_logging import set_request_id
 from asyncio import Queue
 
-def setup_telegram_listener(client: TelegramClient, brain_queue: Queue, group_id: int):
+logger = logging.getLogger(__name__)
+
+
+def _to_internal(message) -> InternalMessage:
+    return InternalMessage(
+        platform='telegram',
+        channel_id=str(message.chat_id),
+        message_id=str(message.id),
+        text=message.text,
+        sender_id=str(getattr(message, 'sender_id', 'unknown'))
+    )
+
+
+def setup_telegram_listener(client: TelegramClient, brain_queue: Queue, channel_ids: frozenset[str]):
     """
     Sets up the event handler for the Telegram client.
     This function doesn't run the client, it just prepares it.
     """
-    print("[TELEGRAM_LISTENER] Setting up event handler...")
-    
-    @client.on(events.NewMessage(chats=[group_id]))
+    logger.info("Setting up event handler...")
+
+    @client.on(events.NewMessage(chats=[int(channel_id) for channel_id in channel_ids]))
     async def handler(event: events.NewMessage.Event):
         message = event.message
         if not message or not message.text:
             return
 
-        print(f"[TELEGRAM_LISTENER] Received Telegram message: '{message.text[:50]}...'")
+        set_request_id(f"telegram:{message.id}")
+        logger.info("Received Telegram message: '%s...'", message.text[:50])
+
+        internal_msg = _to_internal(message)
 
-        internal_msg = InternalMessage(
-            platform='telegram',
-            channel_id=str(message.chat_id),
-            message_id=str(message.id),
-            text=message.text,
-            sender_id=str(getattr(message, 'sender_id', 'unknown'))
-        )
-        
         await brain_queue.put(internal_msg)
 
-    print("[TELEGRAM_LISTENER] Event handler registered.")
\ No newline at end of file
+    logger.info("Event handler registered.")
+
+
+async def fetch_telegram_history(client: TelegramClient, channel_id: str, cursor: dict | None,
+                                 since: datetime, until: datetime, limit: int) -> AsyncIterator[tuple[InternalMessage, datetime]]:
+    """Messages sent in [since, until) after the `cursor` message, newest first, paged by Telethon."""
+    after_id = str(cursor["message_id"]) if cursor else ""
+    min_id = int(after_id) if after_id.isdigit() else 0
+    async for message in client.iter_messages(int(channel_id), limit=limit, min_id=min_id, offset_date=until):
+        if message.date < since:
+            break
+        if message.text:
+            yield _to_internal(message), message.date
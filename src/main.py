@@ -1,8 +1,9 @@
 # src/main.py
 
 import asyncio
+import logging
 import os
-import traceback
+from datetime import datetime, timezone
 from telethon import TelegramClient
 from slack_bolt.async_app import AsyncApp
 from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
@@ -11,41 +12,61 @@ import discord
 # Import configurations and managers
 from config.settings import APP_CONFIG, TELEGRAM_USERS
 from src.services.state_manager import StateManager
-from src.core_logic.llm_personas import PersonaManager
-import firebase_admin
-from firebase_admin import credentials, firestore
+from src.services.storage import open_storage
+from src.core_logic.llm_personas import PersonaManager, persona_reload_worker
+from src.core_logic.channel_registry import channel_registry
+from src.core_logic.inactivity import InactivityTracker
+from src.core_logic.internal_message import InternalMessage
 
 # Import all modular components
-from src.listeners.telegram_listener import setup_telegram_listener
-from src.listeners.slack_listener import slack_listener_worker
-from src.listeners.discord_listener import setup_discord_listener
+from src.listeners.telegram_listener import fetch_telegram_history, setup_telegram_listener
+from src.listeners.slack_listener import fetch_slack_history, slack_listener_worker
+from src.listeners.discord_listener import fetch_discord_history, setup_discord_listener
 from src.senders.telegram_sender import telegram_sender_worker
 from src.senders.slack_sender import slack_sender_worker
 from src.senders.discord_sender import discord_sender_worker
 from src.workers.brain import brain_worker
 from src.workers.scheduler import scheduler_worker
+from src.workers.deferred import deferred_generation_worker
+from src.workers.catchup import catchup_worker, load_cursors
+from src.services.journal import journal_sync_worker, open_durable_queue
+from src.services.loop_monitor import loop_monitor
+from src.services.metrics import build_metrics_app, metrics_server_worker, register_queue
+from src.services.sharding import ShardCoordinator, ShardRouter, set_coordinator, shard_worker
+from src.services.structured_logging import setup_logging, shutdown_logging
+from src.services.tracing import trace_writer_worker
+from src.services.usage import usage_worker
+
+logger = logging.getLogger(__name__)
 
 async def main():
     """
     Initializes and runs all components of the bot following the correct
     Telethon startup and execution lifecycle.
     """
-    print("[MAIN] Initializing application...")
-    brain_queue = asyncio.Queue()
-    sender_queues = {
-        "telegram_sender_queue": asyncio.Queue(),
-        "slack_sender_queue": asyncio.Queue(),
-        "discord_sender_queue": asyncio.Queue(),
-    }
+    logger.info("Initializing application...")
+    sender_queue_names = ["telegram_sender_queue", "slack_sender_queue", "discord_sender_queue"]
+    if APP_CONFIG.get("journal_enabled"):
+        # Journaled queues replay whatever was queued but unfinished when the last run stopped.
+        brain_queue = open_durable_queue("brain_queue", InternalMessage)
+        sender_queues = {name: open_durable_queue(name) for name in sender_queue_names}
+    else:
+        brain_queue = asyncio.Queue()
+        sender_queues = {name: asyncio.Queue() for name in sender_queue_names}
+    register_queue("brain_queue", brain_queue)
+    for queue_name, queue in sender_queues.items():
+        register_queue(queue_name, queue)
     
     
-    if not firebase_admin._apps:
-        cred = credentials.Certificate(APP_CONFIG['firebase_cred_path'])
-        firebase_admin.initialize_app(cred)
-    db = firestore.client()
+    db = open_storage()
     
     state_manager = StateManager(db)
     persona_manager = PersonaManager()
+
+    # With sharding, listeners hand messages to the router, which keeps only this node's channels.
+    shard_coordinator = ShardCoordinator(db.client) if APP_CONFIG.get("sharding_enabled") else None
+    set_coordinator(shard_coordinator)
+    message_router = ShardRouter(brain_queue, shard_coordinator)
     
     # --- 2. PLATFORM CLIENTS INITIALIZATION ---
 
@@ -57,8 +78,10 @@ async def main():
     if APP_CONFIG.get("ingestor_bot_user") and APP_CONFIG.get("sender_bot_users"):
         ingestor_user = APP_CONFIG['ingestor_bot_user']
         sender_users = APP_CONFIG['sender_bot_users']
-        ingestor_client = TelegramClient(os.path.join(APP_CONFIG['data_dir'], ingestor_user), int(TELEGRAM_USERS[ingestor_user]['api_id']), TELEGRAM_USERS[ingestor_user]['api_hash'])
-        sender_clients = {u: TelegramClient(os.path.join(APP_CONFIG['data_dir'], u), int(TELEGRAM_USERS[u]['api_id']), TELEGRAM_USERS[u]['api_hash']) for u in sender_users}
+        # A Telethon session file can't be shared between processes, so each node gets its own.
+        session_suffix = f".{APP_CONFIG['node_id']}" if shard_coordinator else ""
+        ingestor_client = TelegramClient(os.path.join(APP_CONFIG['data_dir'], ingestor_user + session_suffix), int(TELEGRAM_USERS[ingestor_user]['api_id']), TELEGRAM_USERS[ingestor_user]['api_hash'])
+        sender_clients = {u: TelegramClient(os.path.join(APP_CONFIG['data_dir'], u + session_suffix), int(TELEGRAM_USERS[u]['api_id']), TELEGRAM_USERS[u]['api_hash']) for u in sender_users}
         all_telegram_clients = [ingestor_client] + list(sender_clients.values())
     
     # Slack Client
@@ -84,15 +107,27 @@ async def main():
     try:
         # --- CONNECT CLIENTS (SEQUENTIALLY) ---
         if all_telegram_clients:
-            print("[MAIN] Connecting and authorizing all Telegram clients...")
+            logger.info("Connecting and authorizing all Telegram clients...")
             for client in all_telegram_clients:
                 await client.start()
                 if not await client.is_user_authorized():
                     raise Exception(f"Telegram client for session '{client.session.filename}' is not authorized.")
-            print("[MAIN] All Telegram clients connected and authorized.")
+            logger.info("All Telegram clients connected and authorized.")
         
+        # --- READ CATCH-UP CURSORS (before the brain stores any live message) ---
+        catchup_cursors = load_cursors(db) if APP_CONFIG.get("catchup_enabled") else {}
+        catchup_fetchers = {}
+        if ingestor_client:
+            catchup_fetchers["telegram"] = (fetch_telegram_history, ingestor_client)
+        if slack_web_client:
+            catchup_fetchers["slack"] = (fetch_slack_history, slack_web_client)
+        if discord_client:
+            catchup_fetchers["discord"] = (fetch_discord_history, discord_client)
+        # Messages replayed from the journal are still going to the brain; don't mark them as seen.
+        replayed_keys = {message.dedupe_key for message in getattr(brain_queue, "replayed", [])}
+
         # --- LAUNCH ALL WORKERS (CONCURRENTLY) ---
-        print("[MAIN] Launching all background workers...")
+        logger.info("Launching all background workers...")
         async with asyncio.TaskGroup() as tg:
             
             # --- START LONG-RUNNING CLIENTS ---
@@ -104,40 +139,65 @@ async def main():
                 tg.create_task(client.run_until_disconnected())
 
             # --- START LISTENERS ---
-            if ingestor_client and APP_CONFIG.get("telegram_group_id"):
-                setup_telegram_listener(ingestor_client, brain_queue, APP_CONFIG['telegram_group_id'])
-            if slack_app and APP_CONFIG.get("slack_channel_id"):
-                tg.create_task(slack_listener_worker(slack_app, brain_queue, APP_CONFIG['slack_channel_id']))
-            if discord_client and APP_CONFIG.get("discord_channel_id"):
-                setup_discord_listener(discord_client, brain_queue, APP_CONFIG['discord_channel_id'])
+            if ingestor_client and channel_registry.channel_ids("telegram"):
+                setup_telegram_listener(ingestor_client, message_router, channel_registry.channel_ids("telegram"))
+            if slack_app and channel_registry.channel_ids("slack"):
+                tg.create_task(slack_listener_worker(slack_app, message_router, channel_registry.channel_ids("slack")))
+            if discord_client and channel_registry.channel_ids("discord"):
+                setup_discord_listener(discord_client, message_router, channel_registry.channel_ids("discord"))
+            if shard_coordinator:
+                tg.create_task(shard_worker(shard_coordinator, brain_queue))
+            if APP_CONFIG.get("catchup_enabled"):
+                # The listeners are registered and nothing has run yet: whatever comes next arrives live.
+                catchup_until = datetime.now(timezone.utc)
+                tg.create_task(catchup_worker(catchup_fetchers, catchup_cursors, catchup_until, replayed_keys, state_manager, db))
                 
             # --- START CORE & SENDER WORKERS ---
-            tg.create_task(brain_worker(brain_queue, sender_queues, persona_manager, state_manager, db))
+            if APP_CONFIG.get("trace_enabled"):
+                tg.create_task(trace_writer_worker())
+            # Shared so the deferred generation worker can prepare initiations before channels go idle.
+            inactivity = InactivityTracker(state_manager)
+            tg.create_task(brain_worker(brain_queue, sender_queues, persona_manager, state_manager, db, inactivity))
+            if APP_CONFIG.get("deferred_generation_enabled"):
+                tg.create_task(deferred_generation_worker(state_manager, db, inactivity))
             tg.create_task(scheduler_worker(sender_queues, persona_manager, state_manager, db))
+            tg.create_task(persona_reload_worker(persona_manager))
+            tg.create_task(usage_worker(state_manager))
+            metrics_app = build_metrics_app()
+            if APP_CONFIG.get("loop_monitor_enabled"):
+                metrics_app.router.add_get("/debug/loop", loop_monitor.handle_report)
+                tg.create_task(loop_monitor.run())
+            tg.create_task(metrics_server_worker(metrics_app))
+            if APP_CONFIG.get("journal_enabled"):
+                tg.create_task(journal_sync_worker([brain_queue, *sender_queues.values()]))
             tg.create_task(telegram_sender_worker(sender_queues["telegram_sender_queue"], sender_clients))
             tg.create_task(slack_sender_worker(sender_queues["slack_sender_queue"], slack_web_client))
             tg.create_task(discord_sender_worker(sender_queues["discord_sender_queue"], discord_client))
 
-            print("--- Bot is fully operational on configured platforms. Press Ctrl+C to stop. ---")
+            logger.info("--- Bot is fully operational on configured platforms. Press Ctrl+C to stop. ---")
 
     except* Exception as eg:
-        print(f"--- Main task group encountered errors: ---")
+        logger.error("--- Main task group encountered errors: ---")
         for exc in eg.exceptions:
-            traceback.print_exception(type(exc), exc, exc.__traceback__)
+            logger.error("Task failed: %s", exc, exc_info=exc)
     finally:
         # --- GRACEFUL SHUTDOWN ---
-        print("[MAIN] Shutting down...")
+        logger.info("Shutting down...")
         if all_telegram_clients:
             for client in all_telegram_clients:
                 if client.is_connected():
                     await client.disconnect()
         if discord_client and discord_client.is_ready():
             await discord_client.close()
-        print("[MAIN] All clients disconnected. Shutdown complete.")
+        db.close()
+        logger.info("All clients disconnected. Shutdown complete.")
 
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
-        print("\n[MAIN] Shutdown requested by user.")
\ No newline at end of file
+        logger.info("Shutdown requested by user.")
+    finally:
+        shutdown_logging()
\ No newline at end of file
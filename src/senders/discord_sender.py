@@ -1,41 +1,52 @@
 # src/senders/discord_sender.py
 
-import asyncio
+import logging
 from asyncio import Queue
 import discord
 from config.settings import APP_CONFIG
-import random
+from src.senders.pacing import SendPacer
+from src.services.metrics import MESSAGES_TOTAL, track_stage
+from src.services.moderation import moderation_gate
+
+logger = logging.getLogger(__name__)
 
 async def discord_sender_worker(queue: Queue, client: discord.Client):
     """
-    A dedicated worker that listens on a queue and sends messages to Discord.
+    A dedicated worker that listens on a queue and sends messages to Discord,
+    each at its human-like delivery time (see src/senders/pacing.py).
     """
-    print("[DISCORD_SENDER] Worker started.")
-    while True:
-        try:
-            msg = await queue.get()
-            
-            channel_id_str = msg.get("channel_id")
-            text = msg.get("message")
-
-            if not all([channel_id_str, text]):
-                print(f"[DISCORD_SENDER] Skipping invalid message payload: {msg}")
-                queue.task_done()
-                continue
-            
-            # discord.py needs the channel ID as an integer
-            channel = client.get_channel(int(channel_id_str))
-            
-            if channel and isinstance(channel, discord.abc.Messageable):
-                await channel.send(text)
-                print(f"[DISCORD_SENDER] Message sent successfully to channel {channel_id_str}.")
-            else:
-                print(f"[DISCORD_SENDER] ERROR: Could not find a messageable channel with ID {channel_id_str}.")
+    logger.info("Worker started.")
+
+    async def deliver(msg: dict):
+        channel_id_str = msg.get("channel_id")
+        text = msg.get("message")
+
+        if not all([channel_id_str, text]):
+            logger.warning("Skipping invalid message payload: %s", msg)
+            MESSAGES_TOTAL.labels("discord_sender", "invalid").inc()
+            return
 
-            # Optional delay to prevent rate-limiting
-            await asyncio.sleep(random.uniform(1.0, 3.0)) # Discord can be sensitive to rate limits
-            queue.task_done()
+        # The final gate. The verdict was requested when the message was written, so this rarely waits.
+        with track_stage("discord_sender", "moderation"):
+            allowed = await moderation_gate.allow(text)
+        if not allowed:
+            logger.warning("Dropping a message for channel %s that failed moderation.", msg.get("channel_id"))
+            MESSAGES_TOTAL.labels("discord_sender", "flagged").inc()
+            return
+
+        # discord.py needs the channel ID as an integer
+        channel = client.get_channel(int(channel_id_str))
+
+        if channel and isinstance(channel, discord.abc.Messageable):
+            with track_stage("discord_sender", "send"):
+                await channel.send(text)
+            logger.info("Message sent successfully to channel %s.", channel_id_str)
+            MESSAGES_TOTAL.labels("discord_sender", "sent").inc()
+        else:
+            logger.error("Could not find a messageable channel with ID %s.", channel_id_str)
+            MESSAGES_TOTAL.labels("discord_sender", "no_channel").inc()
 
-        except Exception as e:
-            print(f"CRITICAL ERROR in Discord Sender Worker: {e}")
-            await asyncio.sleep(10)
\ No newline at end of file
+    # Discord rate-limits per channel, so each channel is its own lane (and keeps the Discord-specific delays).
+    pacer = SendPacer("discord_sender", APP_CONFIG['discord_min_send_delay_secs'], APP_CONFIG['discord_max_send_delay_secs'],
+                      lane=lambda msg: str(msg.get("channel_id")))
+    await pacer.run(queue, deliver)
@@ -0,0 +1,147 @@
+# src/senders/pacing.py
+"""
+Human-like send pacing that overlaps with generation.
+
+The senders used to sleep a random MIN_SEND_DELAY_SECS..MAX_SEND_DELAY_SECS
+after every send. A reply's perceived latency was generation time plus that
+delay, and the sleep held up every message queued behind it.
+
+Now each message gets a delivery time, counted from when the message it
+answers arrived (`reply_to_at`) or, for initiations and link posts, from when
+the sender took it: the time a person needs to react (around
+SEND_REACTION_SECS) plus to type the text at SEND_TYPING_CHARS_PER_SEC, with
+some jitter, clamped to the platform's min and max delay. Generation counts
+toward it, so latency becomes max(generation, delay) instead of the sum.
+
+Messages wait on a heap and are released when due, without blocking each
+other. One typist still writes one message at a time: a message can't be due
+before the previous message of its lane (a Telegram account, or a Slack or
+Discord channel) plus its own delay. The moderation gate runs at release, in
+the senders' `deliver` callback.
+
+Each release is delivered in its own task, chained after the previous
+delivery of its lane, so a slow send or moderation check only holds up its
+own lane. A delivery that fails is dropped, and its lane pauses for
+SEND_ERROR_BACKOFF_SECS before the next one.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Awaitable, Callable
+
+from config.settings import APP_CONFIG
+from src.services.journal import DurableQueue
+from src.services.metrics import MESSAGES_TOTAL, QUEUE_DEPTH, STAGE_DURATION, Histogram
+from src.services.tracing import record_span, record_wait, set_trace
+
+logger = logging.getLogger(__name__)
+
+REPLY_DELIVERY = Histogram(
+    "bot_reply_delivery_seconds",
+    "Time from the message a reply answers to the reply's release, by sender.",
+    ("sender",),
+    buckets=(1, 2, 5, 10, 15, 20, 30, 60, 120))
+
+# Multiplicative jitter on the computed delay.
+DELAY_JITTER = 0.15
+
+
+class SendPacer:
+    """Holds a sender's messages until their delivery time. One per sender worker."""
+    def __init__(self, name: str, min_delay: float, max_delay: float, lane: Callable[[dict], str],
+                 typing_cps: float | None = None, reaction_secs: float | None = None):
+        self.name = name
+        self.min_delay = min_delay
+        self.max_delay = max(max_delay, min_delay)
+        self.lane = lane
+        self.typing_cps = typing_cps or APP_CONFIG.get("send_typing_chars_per_sec", 5.0)
+        self.reaction_secs = APP_CONFIG.get("send_reaction_secs", 2.0) if reaction_secs is None else reaction_secs
+        # (due, sequence, message, journal id, held at (perf_counter))
+        self._heap: list[tuple[float, int, dict, int | None, float]] = []
+        self._sequence = itertools.count()
+        # lane -> delivery time of its last scheduled message
+        self._lane_due: dict[str, float] = {}
+        # lane -> its latest delivery task, which the next delivery of the lane waits for
+        self._lane_tasks: dict[str, asyncio.Task] = {}
+        self.error_backoff = APP_CONFIG.get("send_error_backoff_secs", 10.0)
+        QUEUE_DEPTH.labels(f"{name}_held").set_function(lambda: len(self._heap))
+
+    def delay(self, text: str) -> float:
+        """How long a person would take to react to something and type `text`."""
+        delay = random.uniform(0.5, 1.5) * self.reaction_secs + len(text) / self.typing_cps
+        delay *= random.uniform(1 - DELAY_JITTER, 1 + DELAY_JITTER)
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def delivery_time(self, msg: dict, now: float) -> float:
+        lane = self.lane(msg)
+        # A stamp from before a restart (or another host) may be ahead of our clock.
+        start = max(min(msg.get("reply_to_at") or now, now), self._lane_due.get(lane, 0.0))
+        due = start + self.delay(msg.get("message") or "")
+        # A message already overdue goes out now, and the next one of its lane is typed after it.
+        self._lane_due[lane] = max(due, now)
+        return due
+
+    def _hold(self, msg: dict, queue: asyncio.Queue):
+        set_trace(msg.get("trace_id"))
+        record_wait(f"queue.{self.name}", msg.get("queued_at"))
+        now = time.time()
+        item_id = queue.last_taken() if isinstance(queue, DurableQueue) else None
+        heapq.heappush(self._heap, (self.delivery_time(msg, now), next(self._sequence), msg, item_id, time.perf_counter()))
+        if len(self._lane_due) > len(self._heap) + 1000:
+            # Lanes with nothing scheduled any more start from scratch anyway.
+            self._lane_due = {lane: due for lane, due in self._lane_due.items() if due > now}
+
+    def _release(self, queue: asyncio.Queue, deliver: Callable[[dict], Awaitable[None]]):
+        _, _, msg, item_id, held_at = heapq.heappop(self._heap)
+        lane = self.lane(msg)
+        task = asyncio.create_task(self._deliver(self._lane_tasks.get(lane), msg, item_id, held_at, queue, deliver))
+        self._lane_tasks[lane] = task
+        task.add_done_callback(lambda done: self._forget_lane(lane, done))
+
+    def _forget_lane(self, lane: str, task: asyncio.Task):
+        if self._lane_tasks.get(lane) is task:
+            del self._lane_tasks[lane]
+
+    async def _deliver(self, previous: asyncio.Task | None, msg: dict, item_id: int | None, held_at: float,
+                       queue: asyncio.Queue, deliver: Callable[[dict], Awaitable[None]]):
+        try:
+            if previous is not None:
+                # The lane's previous message goes out first. It never raises (see below).
+                await previous
+            set_trace(msg.get("trace_id"))
+            released_at = time.perf_counter()
+            STAGE_DURATION.labels(self.name, "delay").observe(released_at - held_at)
+            record_span(f"{self.name}.delay", self.name, held_at, released_at)
+            if msg.get("reply_to_at"):
+                REPLY_DELIVERY.labels(self.name).observe(max(time.time() - msg["reply_to_at"], 0.0))
+            try:
+                await deliver(msg)
+            except Exception as e:
+                # The message is dropped, as before; it is still marked done so the journal doesn't replay it.
+                logger.critical("Unhandled error in %s: %s", self.name, e)
+                MESSAGES_TOTAL.labels(self.name, "error").inc()
+                # Back off this lane only; the others keep sending.
+                await asyncio.sleep(self.error_backoff)
+        finally:
+            if item_id is not None:
+                queue.task_done_for(item_id)
+            else:
+                queue.task_done()
+
+    async def run(self, queue: asyncio.Queue, deliver: Callable[[dict], Awaitable[None]]):
+        """Takes every message from `queue` and calls `deliver` with it once it is due. Never returns."""
+        while True:
+            while not queue.empty():
+                self._hold(queue.get_nowait(), queue)
+            if self._heap and self._heap[0][0] <= time.time():
+                self._release(queue, deliver)
+                continue
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                msg = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                continue
+            self._hold(msg, queue)
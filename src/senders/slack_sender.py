@@ -1,41 +1,51 @@
 # src/senders/slack_sender.py
 
+import logging
 import asyncio
-import random
 from slack_sdk.web.async_client import AsyncWebClient
 from config.settings import APP_CONFIG
+from src.senders.pacing import SendPacer
+from src.services.metrics import MESSAGES_TOTAL, track_stage
+from src.services.moderation import moderation_gate
+
+logger = logging.getLogger(__name__)
 
 async def slack_sender_worker(
     queue: asyncio.Queue,
     slack_client: AsyncWebClient
 ):
     """
-    A dedicated worker that listens on a queue and sends messages to Slack.
+    A dedicated worker that listens on a queue and sends messages to Slack,
+    each at its human-like delivery time (see src/senders/pacing.py).
     """
-    print("[SLACK_SENDER] Worker started.")
-    while True:
-        try:
-            msg = await queue.get()
-            
-            channel_id = msg.get("channel_id")
-            text = msg.get("message")
-
-            if not all([channel_id, text]):
-                print(f"[SLACK_SENDER] Skipping invalid message payload: {msg}")
-                queue.task_done()
-                continue
+    logger.info("Worker started.")
+
+    async def deliver(msg: dict):
+        channel_id = msg.get("channel_id")
+        text = msg.get("message")
+
+        if not all([channel_id, text]):
+            logger.warning("Skipping invalid message payload: %s", msg)
+            MESSAGES_TOTAL.labels("slack_sender", "invalid").inc()
+            return
 
+        # The final gate. The verdict was requested when the message was written, so this rarely waits.
+        with track_stage("slack_sender", "moderation"):
+            allowed = await moderation_gate.allow(text)
+        if not allowed:
+            logger.warning("Dropping a message for channel %s that failed moderation.", msg.get("channel_id"))
+            MESSAGES_TOTAL.labels("slack_sender", "flagged").inc()
+            return
+
+        with track_stage("slack_sender", "send"):
             await slack_client.chat_postMessage(
                 channel=channel_id,
                 text=text
             )
-            print(f"[SLACK_SENDER] Message sent successfully to channel {channel_id}.")
-
-            # Optional: Add a small delay if you want to rate-limit Slack messages too
-            delay = random.uniform(APP_CONFIG['min_send_delay_secs'], APP_CONFIG['max_send_delay_secs'])
-            await asyncio.sleep(delay)
-            queue.task_done()
+        logger.info("Message sent successfully to channel %s.", channel_id)
+        MESSAGES_TOTAL.labels("slack_sender", "sent").inc()
 
-        except Exception as e:
-            print(f"CRITICAL ERROR in Slack Sender Worker: {e}")
-            await asyncio.sleep(10)
\ No newline at end of file
+    # The bot posts one message at a time per channel.
+    pacer = SendPacer("slack_sender", APP_CONFIG['min_send_delay_secs'], APP_CONFIG['max_send_delay_secs'],
+                      lane=lambda msg: str(msg.get("channel_id")))
+    await pacer.run(queue, deliver)
@@ -1,43 +1,55 @@
 # src/senders/telegram_sender.py
 
+import logging
 import asyncio
-import random
 from telethon import TelegramClient
 from config.settings import APP_CONFIG
+from src.senders.pacing import SendPacer
+from src.services.metrics import MESSAGES_TOTAL, track_stage
+from src.services.moderation import moderation_gate
+
+logger = logging.getLogger(__name__)
 
 async def telegram_sender_worker(
     queue: asyncio.Queue,
     sender_clients: dict[str, TelegramClient]
 ):
     """
-    A dedicated worker that listens on a queue and sends messages to Telegram.
+    A dedicated worker that listens on a queue and sends messages to Telegram,
+    each at its human-like delivery time (see src/senders/pacing.py).
     """
-    print("[TELEGRAM_SENDER] Worker started.")
-    while True:
-        try:
-            msg = await queue.get()
-            
-            channel_id = msg.get("channel_id")
-            text = msg.get("message")
-            telegram_user = msg.get("telegram_user") # The specific bot account to use
-
-            if not all([channel_id, text, telegram_user]):
-                print(f"[TELEGRAM_SENDER] Skipping invalid message payload: {msg}")
-                queue.task_done()
-                continue
-            
-            client_to_use = sender_clients.get(telegram_user)
-            if client_to_use and client_to_use.is_connected():
-                # channel_id from our InternalMessage is a string, needs to be int for Telethon
+    logger.info("Worker started.")
+
+    async def deliver(msg: dict):
+        channel_id = msg.get("channel_id")
+        text = msg.get("message")
+        telegram_user = msg.get("telegram_user") # The specific bot account to use
+
+        if not all([channel_id, text, telegram_user]):
+            logger.warning("Skipping invalid message payload: %s", msg)
+            MESSAGES_TOTAL.labels("telegram_sender", "invalid").inc()
+            return
+
+        # The final gate. The verdict was requested when the message was written, so this rarely waits.
+        with track_stage("telegram_sender", "moderation"):
+            allowed = await moderation_gate.allow(text)
+        if not allowed:
+            logger.warning("Dropping a message for channel %s that failed moderation.", msg.get("channel_id"))
+            MESSAGES_TOTAL.labels("telegram_sender", "flagged").inc()
+            return
+
+        client_to_use = sender_clients.get(telegram_user)
+        if client_to_use and client_to_use.is_connected():
+            # channel_id from our InternalMessage is a string, needs to be int for Telethon
+            with track_stage("telegram_sender", "send"):
                 await client_to_use.send_message(int(channel_id), text)
-                print(f"[TELEGRAM_SENDER] Message sent successfully via {telegram_user}.")
-            else:
-                print(f"[TELEGRAM_SENDER] Client for user '{telegram_user}' not found or disconnected.")
-
-            delay = random.uniform(APP_CONFIG['min_send_delay_secs'], APP_CONFIG['max_send_delay_secs'])
-            await asyncio.sleep(delay)
-            queue.task_done()
-            
-        except Exception as e:
-            print(f"CRITICAL ERROR in Telegram Sender Worker: {e}")
-            await asyncio.sleep(10) # Avoid rapid-fire errors
\ No newline at end of file
+            logger.info("Message sent successfully via %s.", telegram_user)
+            MESSAGES_TOTAL.labels("telegram_sender", "sent").inc()
+        else:
+            logger.warning("Client for user '%s' not found or disconnected.", telegram_user)
+            MESSAGES_TOTAL.labels("telegram_sender", "no_client").inc()
+
+    # Each account types one message at a time.
+    pacer = SendPacer("telegram_sender", APP_CONFIG['min_send_delay_secs'], APP_CONFIG['max_send_delay_secs'],
+                      lane=lambda msg: msg.get("telegram_user") or "")
+    await pacer.run(queue, deliver)
@@ -0,0 +1,253 @@
+# src/services/deferred_generation.py
+"""
+Deferred batch generation for non-urgent content.
+
+Topic initiations and scheduled link posts are known well before they are
+sent, yet they used to be generated on the spot, competing with live replies
+for the same chat capacity and rate limits. Now their producers `request` a
+generation DEFERRED_LEAD_SECS ahead of time, and `flush` (run by
+src/workers/deferred.py) submits the requests in bulk through a backend:
+
+- "openai": the OpenAI Batch API. One JSONL file per batch, finished within
+  24h (usually minutes) at half price, under its own rate limit.
+- "local": a stand-in for tests and benchmarks that runs the requests one at a
+  time through the regular chat endpoint.
+
+Results, and the keys of batches still in flight, live in one state document,
+so a restart neither loses nor repeats a batch. When the content is due, the
+consumer `take`s its result; a result older than DEFERRED_MAX_AGE_SECS is
+dropped, and content without one is generated live, as before.
+"""
+import asyncio
+import copy
+import json
+import logging
+import os
+import time
+
+import aiohttp
+
+from config.settings import APP_CONFIG
+from src.services.metrics import Counter, Gauge, track_provider_call
+from src.services.openai_chat import API_BASE, API_KEY, get_llm_completion
+from src.services.usage import set_usage_channel, set_usage_persona, usage_ledger
+
+logger = logging.getLogger(__name__)
+
+DEFERRED_REQUESTS = Counter(
+    "bot_deferred_generations_total",
+    "Deferred generations by outcome (requested, completed, failed, used, expired, missed).",
+    ("outcome",))
+DEFERRED_PENDING = Gauge(
+    "bot_deferred_generations_pending",
+    "Deferred generations by state (queued, in_flight, ready).",
+    ("state",))
+
+# The Batch API bills half the synchronous price.
+BATCH_PRICE_FACTOR = 0.5
+BATCH_RUNNING_STATES = ("validating", "in_progress", "finalizing", "cancelling")
+
+
+class OpenAIBatchBackend:
+    """Submits chat completions through the OpenAI Batch API."""
+    name = "openai"
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {API_KEY}"}
+
+    async def submit(self, requests: dict[str, dict]) -> str:
+        lines = [json.dumps({
+            "custom_id": key, "method": "POST", "url": "/v1/chat/completions",
+            "body": {"model": request["model"], "messages": [{"role": "user", "content": request["prompt"]}],
+                     "max_tokens": request["max_tokens"]},
+        }) for key, request in requests.items()]
+        form = aiohttp.FormData()
+        form.add_field("purpose", "batch")
+        form.add_field("file", "\n".join(lines).encode("utf-8"), filename="deferred.jsonl", content_type="application/jsonl")
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            with track_provider_call("openai", "batch_submit"):
+                async with session.post(f"{API_BASE}/files", headers=self._headers(), data=form) as response:
+                    response.raise_for_status()
+                    input_file_id = (await response.json())["id"]
+                payload = {"input_file_id": input_file_id, "endpoint": "/v1/chat/completions", "completion_window": "24h"}
+                async with session.post(f"{API_BASE}/batches", headers=self._headers(), json=payload) as response:
+                    response.raise_for_status()
+                    return (await response.json())["id"]
+
+    async def poll(self, batch_id: str, requests: dict[str, dict]) -> dict[str, str | None] | None:
+        """The batch's results by key (None for a failed request), or None while it is still running."""
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            with track_provider_call("openai", "batch_poll"):
+                async with session.get(f"{API_BASE}/batches/{batch_id}", headers=self._headers()) as response:
+                    response.raise_for_status()
+                    batch = await response.json()
+                if batch.get("status") in BATCH_RUNNING_STATES:
+                    return None
+                output_file_id = batch.get("output_file_id")
+                if not output_file_id:
+                    logger.warning("Batch %s ended as '%s' without output.", batch_id, batch.get("status"))
+                    return {key: None for key in requests}
+                async with session.get(f"{API_BASE}/files/{output_file_id}/content", headers=self._headers()) as response:
+                    response.raise_for_status()
+                    output = await response.text()
+
+        results = {key: None for key in requests}
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            key = record.get("custom_id")
+            body = (record.get("response") or {}).get("body") or {}
+            if key not in results or not body.get("choices"):
+                continue
+            meta = requests[key].get("meta", {})
+            set_usage_channel(meta.get("channel", "-"))
+            set_usage_persona(meta.get("persona", "-"))
+            usage_ledger.record("openai", requests[key]["model"], body.get("usage"), price_factor=BATCH_PRICE_FACTOR)
+            results[key] = body["choices"][0]["message"]["content"].strip()
+        return results
+
+
+class LocalBatchBackend:
+    """Runs a batch one request at a time through the chat endpoint. Batches don't survive a restart."""
+    name = "local"
+
+    def __init__(self):
+        self._batches: dict[str, asyncio.Task] = {}
+
+    async def _run(self, requests: dict[str, dict]) -> dict[str, str | None]:
+        results = {}
+        for key, request in requests.items():
+            meta = request.get("meta", {})
+            set_usage_channel(meta.get("channel", "-"))
+            set_usage_persona(meta.get("persona", "-"))
+            completion = await get_llm_completion(request["prompt"], request["model"], request["max_tokens"])
+            results[key] = completion.get("text")
+        return results
+
+    async def submit(self, requests: dict[str, dict]) -> str:
+        batch_id = f"local-{os.urandom(4).hex()}"
+        self._batches[batch_id] = asyncio.create_task(self._run(requests))
+        return batch_id
+
+    async def poll(self, batch_id: str, requests: dict[str, dict]) -> dict[str, str | None] | None:
+        task = self._batches.get(batch_id)
+        if task is None:
+            # Submitted before a restart; the requests are generated live instead.
+            return {key: None for key in requests}
+        if not task.done():
+            return None
+        del self._batches[batch_id]
+        return task.result()
+
+
+BACKENDS = {"openai": OpenAIBatchBackend, "local": LocalBatchBackend}
+
+
+class DeferredGenerator:
+    """Collects non-urgent prompts and keeps their results. All methods run on the event loop thread."""
+    def __init__(self, backend=None, enabled: bool | None = None):
+        self.backend = backend or BACKENDS[APP_CONFIG.get("deferred_backend", "openai")]()
+        self.enabled = APP_CONFIG.get("deferred_generation_enabled", True) if enabled is None else enabled
+        self.max_batch = APP_CONFIG.get("deferred_max_batch", 50)
+        self.max_age = APP_CONFIG.get("deferred_max_age_secs", 7200)
+        self._queued: dict[str, dict] = {}
+        # batch id -> {"requests": {key: request without the prompt}, "submitted_at"}
+        self._batches: dict[str, dict] = {}
+        # key -> {"text", "meta", "created_at"}
+        self._results: dict[str, dict] = {}
+        self._dirty = False
+        # Requests are only taken while src/workers/deferred.py runs to submit them.
+        self.active = False
+        DEFERRED_PENDING.labels("queued").set_function(lambda: len(self._queued))
+        DEFERRED_PENDING.labels("in_flight").set_function(lambda: sum(len(b["requests"]) for b in self._batches.values()))
+        DEFERRED_PENDING.labels("ready").set_function(lambda: len(self._results))
+
+    def load(self, state: dict):
+        self._batches = state.get("batches", {})
+        self._results = state.get("results", {})
+
+    def snapshot(self) -> dict:
+        """A copy of the state to persist; it is serialized in a worker thread while the loop keeps changing ours."""
+        return copy.deepcopy({"batches": self._batches, "results": self._results})
+
+    def known(self, key: str) -> bool:
+        """Whether `key` is queued, in flight or has a result waiting."""
+        return key in self._queued or key in self._results or any(key in b["requests"] for b in self._batches.values())
+
+    def request(self, key: str, prompt: str, model: str, max_tokens: int, meta: dict | None = None) -> bool:
+        """Queues a generation for the next batch. Returns False if deferral is off or `key` is already known."""
+        if not (self.enabled and self.active) or self.known(key):
+            return False
+        self._queued[key] = {"prompt": prompt, "model": usage_ledger.choose_model(model), "max_tokens": max_tokens,
+                             "meta": meta or {}}
+        DEFERRED_REQUESTS.labels("requested").inc()
+        return True
+
+    def take(self, key: str) -> dict | None:
+        """The finished result for `key` ({"text", "meta"}), removing it, or None to generate live."""
+        result = self._results.pop(key, None)
+        if result is None:
+            if self.enabled and self.active:
+                DEFERRED_REQUESTS.labels("missed").inc()
+            return None
+        self._dirty = True
+        if time.time() - result["created_at"] > self.max_age:
+            DEFERRED_REQUESTS.labels("expired").inc()
+            return None
+        DEFERRED_REQUESTS.labels("used").inc()
+        return result
+
+    async def flush(self) -> bool:
+        """Submits queued requests, collects finished batches and drops stale results. Returns whether state changed."""
+        while self._queued:
+            keys = list(self._queued)[:self.max_batch]
+            requests = {key: self._queued[key] for key in keys}
+            try:
+                batch_id = await self.backend.submit(requests)
+            except Exception as e:
+                logger.error("Could not submit a batch of %s deferred generations: %s", len(requests), e)
+                break
+            for key in keys:
+                del self._queued[key]
+            # The prompts aren't needed any more; the document only keeps what the results need.
+            self._batches[batch_id] = {
+                "requests": {key: {k: v for k, v in request.items() if k != "prompt"} for key, request in requests.items()},
+                "submitted_at": time.time(),
+            }
+            self._dirty = True
+            logger.info("Submitted %s deferred generations as batch %s (%s backend).", len(requests), batch_id, self.backend.name)
+
+        for batch_id, batch in list(self._batches.items()):
+            try:
+                results = await self.backend.poll(batch_id, batch["requests"])
+            except Exception as e:
+                logger.error("Could not poll batch %s: %s", batch_id, e)
+                continue
+            if results is None:
+                continue
+            del self._batches[batch_id]
+            self._dirty = True
+            now = time.time()
+            for key, text in results.items():
+                if text:
+                    self._results[key] = {"text": text, "meta": batch["requests"][key].get("meta", {}), "created_at": now}
+                    DEFERRED_REQUESTS.labels("completed").inc()
+                else:
+                    DEFERRED_REQUESTS.labels("failed").inc()
+            logger.info("Batch %s finished after %.0fs: %s of %s generations succeeded.", batch_id, now - batch["submitted_at"],
+                        sum(1 for text in results.values() if text), len(results))
+
+        now = time.time()
+        for key in [key for key, result in self._results.items() if now - result["created_at"] > self.max_age]:
+            del self._results[key]
+            DEFERRED_REQUESTS.labels("expired").inc()
+            self._dirty = True
+
+        dirty, self._dirty = self._dirty, False
+        return dirty
+
+
+deferred_generator = DeferredGenerator()
@@ -1,63 +1,56 @@
 # src/services/fetch_db.py
 
+import logging
 import asyncio
-from google.cloud.firestore import Query
 from datetime import datetime, timezone
 from src.core_logic.internal_message import InternalMessage
+from src.services.storage import StorageBackend
 
-def save_message_to_db(collection_name: str, message: InternalMessage, db):
-    """Saves our standardized InternalMessage object to a Firestore collection."""
-    if not message or not message.text:
-        return
-    
-    collection_ref = db.collection(f"conversation_ai_{collection_name}")
-    doc_ref = collection_ref.document(message.message_id)
-    
-    doc_data = {
+logger = logging.getLogger(__name__)
+
+
+def _to_doc(message: InternalMessage, date: datetime) -> dict:
+    return {
         "message_id": message.message_id,
         "text": message.text,
         "sender_id": message.sender_id,
         "platform": message.platform,
-        "date": datetime.now(timezone.utc)
+        "date": date
     }
-    doc_ref.set(doc_data)
-    print(f"[DB] Saved message ID {message.message_id} to Firestore collection for channel {collection_name}.")
 
 
-async def get_last_n_messages_as_text(group_id: str, n: int, db) -> str:
+def save_message_to_db(collection_name: str, message: InternalMessage, db: StorageBackend):
+    """
+    Saves our standardized InternalMessage object to the channel's history in
+    the storage backend.
+    """
+    if not message or not message.text:
+        return
+
+    db.save_message(collection_name, _to_doc(message, datetime.now(timezone.utc)))
+    logger.debug("Saved message ID %s to %s storage for channel %s.", message.message_id, db.name, collection_name)
+
+
+def save_messages_to_db(collection_name: str, messages: list[tuple[InternalMessage, datetime]], db: StorageBackend):
+    """Saves many (message, sent at) pairs to the channel's history with batched writes."""
+    docs = [_to_doc(message, date) for message, date in messages if message and message.text]
+    db.save_messages(collection_name, docs)
+    logger.debug("Saved %s messages to %s storage for channel %s.", len(docs), db.name, collection_name)
+
+
+async def get_last_n_messages_as_text(group_id: str, n: int, db: StorageBackend) -> str:
     """Fetches the last N messages and formats them into a simple text block."""
-    collection_ref = db.collection(f"conversation_ai_{group_id}")
-    query = collection_ref.order_by("date", direction=Query.DESCENDING).limit(n)
-    
-    def _get_docs_sync(q):
-        # Convert to dictionary immediately
-        return [doc.to_dict() for doc in q.stream()]
-        
-    docs = await asyncio.to_thread(_get_docs_sync, query)
-    
+    docs = await asyncio.to_thread(db.latest_messages, group_id, n, "last_n_messages")
+
     if not docs:
         return "No recent messages."
-        
+
     docs.reverse()
-    # Now we are iterating over a list of dictionaries, so .get() is safe
     formatted_history = [f"User {doc.get('sender_id', 'User')}: {doc.get('text', '')}" for doc in docs]
     return "\n".join(formatted_history)
 
 
-async def get_last_100_message_texts(collection_name: str, db) -> list[str]:
-    """Fetches the text of the last 100 messages from a collection."""
-    collection_ref = db.collection(f"conversation_ai_{collection_name}")
-    query = collection_ref.order_by("date", direction=Query.DESCENDING).limit(100)
-    
-    def _get_docs_sync(q):
-        # --- THIS IS THE FIX ---
-        # The list comprehension now correctly converts each doc to a dictionary first
-        results = []
-        for doc in q.stream():
-            doc_dict = doc.to_dict()
-            if doc_dict and 'text' in doc_dict:
-                results.append(doc_dict.get('text', ''))
-        return results
-
-    docs = await asyncio.to_thread(_get_docs_sync, query)
-    return docs
\ No newline at end of file
+async def get_last_100_message_texts(collection_name: str, db: StorageBackend) -> list[str]:
+    """Fetches the text of the last 100 messages from a collection, newest first."""
+    docs = await asyncio.to_thread(db.latest_messages, collection_name, 100, "last_100_messages")
+    return [doc.get('text', '') for doc in docs if doc.get('text')]
@@ -1,18 +1,23 @@
 # src/services/grok_chat.py
+import logging
 import aiohttp
 import os
 from config.settings import APP_CONFIG
+from src.services.metrics import track_provider_call
+from src.services.usage import usage_ledger
+
+logger = logging.getLogger(__name__)
 
 # Load the API key and define the URL
 GROK_API_KEY = APP_CONFIG.get("xai_api_key")
-GROK_API_URL = "https://api.x.ai/v1/chat/completions"
+GROK_API_URL = f"{APP_CONFIG.get('xai_api_base', 'https://api.x.ai/v1').rstrip('/')}/chat/completions"
 
 async def get_grok_response(content: str, model: str = "grok-3-latest") -> str:
     """
     Gets a response from the Grok API using optional live search.
     """
     if not GROK_API_KEY or GROK_API_KEY == "YOUR_GROK_API_KEY_HERE":
-        print("[GROK] API key not configured in .env file.")
+        logger.warning("API key not configured in .env file.")
         return "Error: Grok API key is not configured."
 
     headers = {
@@ -44,17 +49,21 @@ async def get_grok_response(content: str, model: str = "grok-3-latest") -> str:
     timeout = aiohttp.ClientTimeout(total=90)
     async with aiohttp.ClientSession() as session:
         try:
-            print(f"[GROK] Sending request to model '{model}' with auto search...")
-            async with session.post(GROK_API_URL, headers=headers, json=payload, timeout=timeout) as response:
-                response.raise_for_status()
-                result = await response.json()
+            logger.debug("Sending request to model '%s' with auto search...", model)
+            with track_provider_call("grok", "chat") as call:
+                async with session.post(GROK_API_URL, headers=headers, json=payload, timeout=timeout) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                    # Live search sources are billed too (usage.num_sources_used).
+                    usage_ledger.record("grok", model, result.get("usage"))
 
-                if 'choices' in result and len(result['choices']) > 0:
-                    return result['choices'][0]['message']['content']
-                else:
-                    print(f"Error: 'choices' key not found in Grok response. Full response: {result}")
-                    return "Error: Received an invalid response from the data service."
+                    if 'choices' in result and len(result['choices']) > 0:
+                        return result['choices'][0]['message']['content']
+                    else:
+                        call.fail("invalid_response")
+                        logger.error("'choices' key not found in Grok response. Full response: %s", result)
+                        return "Error: Received an invalid response from the data service."
 
         except Exception as e:
-            print(f"CRITICAL ERROR calling Grok API: {e}")
+            logger.error("Error calling Grok API: %s", e)
             return f"Error: Could not get a response from the data service. Details: {e}"
@@ -0,0 +1,244 @@
+# src/services/journal.py
+"""
+Durable on-disk journal behind the brain and sender queues.
+
+Each queue has a directory of append-only segment files (000001.log, ...) of
+JSON lines: {"p": id, "d": item} when an item is put and {"a": id} once its
+consumer calls task_done(). Appends go to the OS page cache, so they survive a
+process crash and cost a few microseconds; a background worker fsyncs every
+JOURNAL_FSYNC_INTERVAL_SECS to survive power loss too.
+
+Segments roll over at JOURNAL_SEGMENT_BYTES. The oldest segments are deleted
+as soon as every item they hold is acknowledged; deleting only from the front
+keeps acks from outliving the puts they cancel. If a long-lived item pins the
+front while more than JOURNAL_MAX_SEGMENTS pile up, its few live items are
+copied forward into the current segment and the old one is dropped.
+
+On startup DurableQueue replays the unacknowledged items in put order before
+accepting new ones. Acknowledgement is FIFO: every queue here has exactly one
+consumer, which finishes items in the order it takes them. The senders, which
+hold items until their delivery time, acknowledge them by id instead
+(`last_taken` / `task_done_for`).
+"""
+import asyncio
+import dataclasses
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+from config.settings import APP_CONFIG
+from src.services.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_REPLAYED = Counter(
+    "bot_journal_replayed_total",
+    "Unacknowledged queue items replayed from the journal at startup.",
+    ("queue",))
+
+
+class SegmentJournal:
+    """Append-only put/ack log split into segment files. Safe to sync from a worker thread."""
+    def __init__(self, directory: str, segment_bytes: int | None = None, max_segments: int | None = None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes or APP_CONFIG.get("journal_segment_bytes", 4 * 1024 * 1024)
+        self.max_segments = max_segments or APP_CONFIG.get("journal_max_segments", 8)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._live: dict[int, dict[int, str]] = {}  # segment -> {item id: encoded item}
+        self._segment_of: dict[int, int] = {}       # item id -> segment
+        self._next_id = 1
+        self._dirty = False
+        self._file = None
+        self._current = 0
+
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:06d}.log")
+
+    def _segments(self) -> list[int]:
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith(".log") and name[:-4].isdigit())
+
+    def replay(self) -> list[tuple[int, str]]:
+        """Loads the journal and returns the unacknowledged (id, encoded item) pairs in put order."""
+        segments = self._segments()
+        for segment in segments:
+            self._live.setdefault(segment, {})
+            with open(self._path(segment), 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn write from a crash; everything before it is intact.
+                        continue
+                    if "p" in record:
+                        item_id = record["p"]
+                        previous = self._segment_of.get(item_id)
+                        if previous is not None:
+                            # Copied forward by compaction before the old segment was removed.
+                            self._live[previous].pop(item_id, None)
+                        self._live[segment][item_id] = record["d"]
+                        self._segment_of[item_id] = segment
+                        self._next_id = max(self._next_id, item_id + 1)
+                    elif "a" in record:
+                        self._forget(record["a"])
+        self._current = (segments[-1] + 1) if segments else 1
+        self._open_segment()
+        self._compact()
+        return sorted(((item_id, data) for live in self._live.values() for item_id, data in live.items()), key=lambda pair: pair[0])
+
+    def _open_segment(self):
+        if self._file:
+            self._file.close()
+        self._file = open(self._path(self._current), 'a', encoding='utf-8')
+        self._live.setdefault(self._current, {})
+
+    def _forget(self, item_id: int):
+        segment = self._segment_of.pop(item_id, None)
+        if segment is not None:
+            self._live[segment].pop(item_id, None)
+
+    def _write(self, record: dict):
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+        self._dirty = True
+        if self._file.tell() >= self.segment_bytes:
+            self._current += 1
+            self._open_segment()
+            self._compact()
+
+    def append(self, data: str) -> int:
+        with self._lock:
+            item_id = self._next_id
+            self._next_id += 1
+            self._live[self._current][item_id] = data
+            self._segment_of[item_id] = self._current
+            self._write({"p": item_id, "d": data})
+            return item_id
+
+    def ack(self, item_id: int):
+        with self._lock:
+            self._forget(item_id)
+            self._write({"a": item_id})
+            self._compact()
+
+    def _compact(self):
+        """Drops fully acknowledged segments from the front, copying pinned items forward if too many pile up."""
+        while len(self._live) > 1:
+            oldest = min(self._live)
+            if oldest == self._current:
+                break
+            pinned = self._live[oldest]
+            if pinned and (len(self._live) <= self.max_segments
+                           or sum(len(data) for data in pinned.values()) > self.segment_bytes // 4):
+                # Still in use, or mostly live (a real backlog) and not worth copying.
+                break
+            for item_id, data in list(pinned.items()):
+                self._live[self._current][item_id] = data
+                self._segment_of[item_id] = self._current
+                self._file.write(json.dumps({"p": item_id, "d": data}, separators=(",", ":")) + "\n")
+            if pinned:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            del self._live[oldest]
+            os.remove(self._path(oldest))
+
+    def sync(self):
+        """fsyncs the current segment if anything was written since the last sync."""
+        with self._lock:
+            if self._dirty and self._file:
+                os.fsync(self._file.fileno())
+                self._dirty = False
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+class DurableQueue(asyncio.Queue):
+    """
+    asyncio.Queue whose items are journaled until task_done(). Items must be
+    JSON-serializable dicts, or instances of the dataclass `item_type`.
+    """
+    def __init__(self, name: str, journal: SegmentJournal, item_type: type | None = None):
+        super().__init__()
+        self.name = name
+        self.journal = journal
+        self.item_type = item_type
+        # Items recovered from the last run, in queue order.
+        self.replayed = []
+        for item_id, data in journal.replay():
+            item = self._decode(data)
+            self.replayed.append(item)
+            self._ids.append(item_id)
+            super()._put(item)
+            self._unfinished_tasks += 1
+        if self.replayed:
+            self._finished.clear()
+            JOURNAL_REPLAYED.labels(name).inc(len(self.replayed))
+            logger.info("Replayed %s unacknowledged items into %s.", len(self.replayed), name)
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self._ids: deque[int] = deque()       # journal ids of queued items, in queue order
+        self._in_flight: deque[int] = deque()  # journal ids taken by the consumer but not yet done
+
+    def _encode(self, item) -> str:
+        return json.dumps(dataclasses.asdict(item) if self.item_type else item)
+
+    def _decode(self, data: str):
+        value = json.loads(data)
+        return self.item_type(**value) if self.item_type else value
+
+    def _put(self, item):
+        self._ids.append(self.journal.append(self._encode(item)))
+        super()._put(item)
+
+    def _get(self):
+        self._in_flight.append(self._ids.popleft())
+        return super()._get()
+
+    def last_taken(self) -> int | None:
+        """Journal id of the item the consumer took last, to finish it out of order with `task_done_for`."""
+        return self._in_flight[-1] if self._in_flight else None
+
+    def task_done(self):
+        super().task_done()
+        if self._in_flight:
+            self.journal.ack(self._in_flight.popleft())
+
+    def task_done_for(self, item_id: int):
+        """task_done() for a specific item taken earlier, whatever the order."""
+        super().task_done()
+        if item_id in self._in_flight:
+            self._in_flight.remove(item_id)
+            self.journal.ack(item_id)
+
+
+def open_durable_queue(name: str, item_type: type | None = None) -> DurableQueue:
+    """A DurableQueue journaled under data/journal/<name> (per node when sharding)."""
+    directory = os.path.join(APP_CONFIG['data_dir'], "journal", name)
+    if APP_CONFIG.get("sharding_enabled"):
+        directory = os.path.join(APP_CONFIG['data_dir'], "journal", APP_CONFIG['node_id'], name)
+    return DurableQueue(name, SegmentJournal(directory), item_type)
+
+
+async def journal_sync_worker(queues: list[DurableQueue]):
+    """fsyncs every journal periodically, off the event loop."""
+    logger.info("Worker started.")
+    interval = APP_CONFIG.get("journal_fsync_interval_secs", 1.0)
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            for queue in queues:
+                try:
+                    await asyncio.to_thread(queue.journal.sync)
+                except OSError as e:
+                    logger.error("Failed to sync journal of %s: %s", queue.name, e)
+    finally:
+        for queue in queues:
+            queue.journal.close()
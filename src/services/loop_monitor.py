@@ -0,0 +1,185 @@
+# src/services/loop_monitor.py
+"""
+Event-loop lag monitor and blocking-call detector.
+
+Anything synchronous on the event loop (a Firestore call, a mem0 request, a
+large print) stalls every coroutine, including the Telethon, Slack socket mode
+and Discord connections. Two cheap probes catch it:
+
+- A heartbeat coroutine sleeps LOOP_MONITOR_INTERVAL_MS at a time and records
+  how late it wakes up into bot_event_loop_lag_seconds.
+- A watchdog thread checks the heartbeat. Once it is more than
+  LOOP_BLOCK_THRESHOLD_MS overdue, the loop is stuck in one callback, and the
+  thread samples the loop thread's stack with sys._current_frames, again every
+  threshold while the stall lasts.
+
+When the loop comes back, the stall is charged to the sampled call sites: the
+innermost frame in this project (who made the blocking call) and the innermost
+frame overall (what blocked). The worst offenders are logged every
+LOOP_MONITOR_REPORT_INTERVAL_SECS and served as JSON at /debug/loop on the
+metrics endpoint. Between stalls the cost is one short sleep on the loop and
+one thread wake-up per interval.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from aiohttp import web
+
+from config.settings import APP_CONFIG
+from src.services.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+LOOP_LAG = Histogram(
+    "bot_event_loop_lag_seconds",
+    "How late the loop monitor's heartbeat woke up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+LOOP_STALLS = Counter(
+    "bot_event_loop_stalls_total",
+    "Heartbeats delayed by more than LOOP_BLOCK_THRESHOLD_MS, by whether a stack was sampled.",
+    ("sampled",))
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Stalls that end before the watchdog samples them.
+UNSAMPLED_SITE = ("(not sampled)", "(not sampled)")
+
+
+def _describe(frame: traceback.FrameSummary) -> str:
+    path = frame.filename
+    if path.startswith(PROJECT_ROOT + os.sep):
+        path = os.path.relpath(path, PROJECT_ROOT)
+    return f"{path}:{frame.lineno} in {frame.name}"
+
+
+def _call_site(stack: traceback.StackSummary) -> tuple[str, str]:
+    """(innermost project frame, innermost frame) of a stack, outermost frame first."""
+    leaf = _describe(stack[-1]) if stack else "?"
+    for frame in reversed(stack):
+        if frame.filename.startswith(PROJECT_ROOT + os.sep) and frame.filename != __file__:
+            return _describe(frame), leaf
+    return leaf, leaf
+
+
+class _Offender:
+    __slots__ = ("stalls", "blocked", "worst", "stack")
+
+    def __init__(self, stack: list[str]):
+        self.stalls = 0
+        self.blocked = 0.0
+        self.worst = 0.0
+        self.stack = stack
+
+
+class LoopMonitor:
+    """Measures loop lag and attributes stalls to call sites. Start it with `run` on the loop to watch."""
+    def __init__(self, interval_ms: float | None = None, threshold_ms: float | None = None, top_n: int | None = None):
+        self.interval = (interval_ms or APP_CONFIG.get("loop_monitor_interval_ms", 50)) / 1000
+        self.threshold = (threshold_ms or APP_CONFIG.get("loop_block_threshold_ms", 100)) / 1000
+        self.top_n = top_n or APP_CONFIG.get("loop_monitor_top_n", 10)
+        self._lock = threading.Lock()
+        # Written by the loop, read by the watchdog: when the heartbeat is due back.
+        self._deadline = float("inf")
+        self._samples: list[tuple[tuple[str, str], list[str]]] = []
+        self._offenders: dict[tuple[str, str], _Offender] = {}
+        self._loop_thread_id: int | None = None
+        self._stop = threading.Event()
+        self.max_lag = 0.0
+
+    # --- Watchdog thread ---
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            overdue = time.monotonic() - self._deadline
+            if overdue < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            del frame
+            with self._lock:
+                self._samples.append((_call_site(stack), [_describe(f) for f in stack[-12:]]))
+            # Sample a long stall again once per threshold, not on every wake-up.
+            self._stop.wait(self.threshold / 2)
+
+    # --- Heartbeat ---
+    def _record_stall(self, lag: float):
+        with self._lock:
+            samples, self._samples = self._samples, []
+        LOOP_STALLS.labels("yes" if samples else "no").inc()
+        if not samples:
+            samples = [(UNSAMPLED_SITE, [])]
+        # Each sample stands for an equal share of the stall.
+        shares: dict[tuple[str, str], float] = {}
+        stacks = {}
+        for site, stack in samples:
+            shares[site] = shares.get(site, 0.0) + lag / len(samples)
+            stacks.setdefault(site, stack)
+        for site, share in shares.items():
+            offender = self._offenders.get(site)
+            if offender is None:
+                offender = self._offenders[site] = _Offender(stacks[site])
+            offender.stalls += 1
+            offender.blocked += share
+            offender.worst = max(offender.worst, share)
+        logger.warning("Event loop blocked for %.0fms at %s (leaf: %s).", lag * 1000, samples[0][0][0], samples[0][0][1])
+
+    async def run(self):
+        logger.info("Worker started.")
+        self._loop_thread_id = threading.get_ident()
+        watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        report_interval = APP_CONFIG.get("loop_monitor_report_interval_secs", 300)
+        next_report = time.monotonic() + report_interval
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                self._deadline = expected
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = max(0.0, now - expected)
+                LOOP_LAG.labels().observe(lag)
+                self.max_lag = max(self.max_lag, lag)
+                if lag >= self.threshold:
+                    self._record_stall(lag)
+                elif self._samples:
+                    # A sample raced with a heartbeat that was only just late.
+                    with self._lock:
+                        self._samples.clear()
+                if report_interval and now >= next_report:
+                    next_report = now + report_interval
+                    self.log_report()
+        finally:
+            self._stop.set()
+            self._deadline = float("inf")
+
+    # --- Reports ---
+    def report(self) -> dict:
+        """The worst offenders by total blocked time."""
+        ranked = sorted(self._offenders.items(), key=lambda item: item[1].blocked, reverse=True)[:self.top_n]
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "offenders": [
+                {"site": site, "leaf": leaf, "stalls": offender.stalls, "blocked_ms": round(offender.blocked * 1000, 1),
+                 "worst_ms": round(offender.worst * 1000, 1), "stack": offender.stack}
+                for (site, leaf), offender in ranked
+            ],
+        }
+
+    def log_report(self):
+        offenders = self.report()["offenders"]
+        if not offenders:
+            return
+        lines = [f"  {o['blocked_ms']:>9.0f}ms  {o['stalls']:>5}x  {o['site']} (leaf: {o['leaf']})" for o in offenders]
+        logger.warning("Top event loop blockers since startup (total, stalls, call site):\n%s", "\n".join(lines))
+
+    async def handle_report(self, request: web.Request) -> web.Response:
+        return web.json_response(self.report())
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,290 @@
+# src/services/metrics.py
+"""
+A small in-process metrics registry with Prometheus text exposition.
+
+Recording is a dict lookup plus a couple of additions, so it is cheap enough
+for the hot path. No locks are taken: almost all recording happens on the event
+loop thread, and the few samples taken inside `asyncio.to_thread` helpers can at
+worst lose an increment under contention, which is acceptable for monitoring.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+from aiohttp import web
+
+from config.settings import APP_CONFIG
+from src.services.tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets (seconds) that cover local work up to 90s provider timeouts.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 90.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        """Returns the child series for these label values, creating it on first use."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {self.value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class _GaugeChild:
+    __slots__ = ("value", "callback")
+
+    def __init__(self):
+        self.value = 0.0
+        self.callback = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, callback: Callable[[], float]):
+        """Reads the value lazily at scrape time instead of on every change."""
+        self.callback = callback
+
+    def render(self, name, labelnames, values):
+        value = self.value
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                value = float("nan")
+        return [f"{name}{_format_labels(labelnames, values)} {value}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: tuple):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.upper_bounds, self.counts):
+            cumulative += bucket_count
+            bucket_labels = _format_labels(labelnames, values, 'le="%s"' % bound)
+            lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+        inf_labels = _format_labels(labelnames, values, 'le="+Inf"')
+        series_labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_bucket{inf_labels} {self.count}")
+        lines.append(f"{name}_sum{series_labels} {self.sum}")
+        lines.append(f"{name}_count{series_labels} {self.count}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+class _Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered.")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> _Metric | None:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = _Registry()
+
+# --- Shared pipeline metrics ---
+STAGE_DURATION = Histogram(
+    "bot_stage_duration_seconds",
+    "Time spent in each pipeline stage.",
+    ("component", "stage"))
+MESSAGES_TOTAL = Counter(
+    "bot_messages_total",
+    "Messages handled per component, by outcome.",
+    ("component", "outcome"))
+PROVIDER_REQUESTS = Counter(
+    "bot_provider_requests_total",
+    "Calls to external providers (OpenAI, Grok, mem0, Firestore), by outcome.",
+    ("provider", "operation", "outcome"))
+PROVIDER_DURATION = Histogram(
+    "bot_provider_request_duration_seconds",
+    "Latency of calls to external providers.",
+    ("provider", "operation"))
+QUEUE_DEPTH = Gauge(
+    "bot_queue_depth",
+    "Number of items currently waiting in an internal queue.",
+    ("queue",))
+
+
+_current_stage: contextvars.ContextVar[str] = contextvars.ContextVar("stage", default="-")
+
+
+def current_stage() -> str:
+    """The innermost `track_stage` block of the current task, as "component.stage"."""
+    return _current_stage.get()
+
+
+@contextmanager
+def track_stage(component: str, stage: str):
+    """Times the enclosed block into bot_stage_duration_seconds{component, stage} and the current trace."""
+    child = STAGE_DURATION.labels(component, stage)
+    token = _current_stage.set(f"{component}.{stage}")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _current_stage.reset(token)
+        child.observe(end - start)
+        record_span(f"{component}.{stage}", component, start, end)
+
+
+class _ProviderCall:
+    __slots__ = ("outcome",)
+
+    def __init__(self):
+        self.outcome = "ok"
+
+    def fail(self, outcome: str = "error"):
+        """Marks a call that returned normally (e.g. an unusable payload) as failed."""
+        self.outcome = outcome
+
+
+@contextmanager
+def track_provider_call(provider: str, operation: str):
+    """
+    Times a provider call and counts it by outcome into bot_provider_requests_total.
+    Exceptions are counted as 'error' and re-raised.
+    """
+    call = _ProviderCall()
+    start = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call.outcome = "error"
+        raise
+    finally:
+        end = time.perf_counter()
+        PROVIDER_DURATION.labels(provider, operation).observe(end - start)
+        record_span(f"{provider}.{operation}", "provider", start, end, {"outcome": call.outcome})
+        PROVIDER_REQUESTS.labels(provider, operation, call.outcome).inc()
+
+
+def register_queue(name: str, queue: asyncio.Queue):
+    """Exposes the queue's size as bot_queue_depth{queue=name}, read at scrape time."""
+    QUEUE_DEPTH.labels(name).set_function(queue.qsize)
+
+
+# --- Export endpoint ---
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Prometheus-Format": "0.0.4"})
+
+
+def build_metrics_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    return app
+
+
+async def metrics_server_worker(app: web.Application | None = None):
+    """Serves /metrics in Prometheus text format on METRICS_HOST:METRICS_PORT."""
+    port = APP_CONFIG.get("metrics_port", 0)
+    if not port:
+        logger.info("Export endpoint disabled (METRICS_PORT=0).")
+        return
+    host = APP_CONFIG.get("metrics_host", "127.0.0.1")
+    runner = web.AppRunner(app or build_metrics_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logger.info("Serving Prometheus metrics on http://%s:%s/metrics", host, port)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,130 @@
+# src/services/moderation.py
+"""
+Moderation gate for outbound messages.
+
+Checking each reply right before sending would add a moderation round trip to
+every message. Instead, texts are submitted as early as they exist: the draft
+when humanizing starts, and the final text as soon as it is written. The only
+wait is at the final send, and by then the verdict is usually in.
+
+Texts submitted within MODERATION_BATCH_WINDOW_MS of each other go out in one
+request (up to MODERATION_MAX_BATCH). Verdicts are cached by content hash in an
+LRU of MODERATION_CACHE_SIZE entries, so repeated texts (retries, replays,
+fallbacks to the draft) are free. If the API fails, the text is allowed, as
+before, and the verdict isn't cached.
+"""
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+from config.settings import APP_CONFIG
+from src.services.metrics import Counter, Histogram
+from src.services.openai_chat import get_moderation_flags
+from src.services.tracing import set_trace
+
+logger = logging.getLogger(__name__)
+
+MODERATION_CHECKS = Counter(
+    "bot_moderation_checks_total",
+    "Outbound text checks by outcome (clean, flagged, error, cached).",
+    ("outcome",))
+MODERATION_BATCH_SIZE = Histogram(
+    "bot_moderation_batch_size",
+    "Texts sent per moderation request.",
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ModerationGate:
+    """Batched, cached moderation verdicts. All methods run on the event loop thread."""
+    def __init__(self, batch_window_ms: float | None = None, max_batch: int | None = None,
+                 cache_size: int | None = None, enabled: bool | None = None):
+        self.batch_window = (APP_CONFIG.get("moderation_batch_window_ms", 20) if batch_window_ms is None else batch_window_ms) / 1000
+        self.max_batch = max_batch or APP_CONFIG.get("moderation_max_batch", 32)
+        self.cache_size = cache_size or APP_CONFIG.get("moderation_cache_size", 2048)
+        self.enabled = APP_CONFIG.get("moderation_enabled", True) if enabled is None else enabled
+        self._verdicts: OrderedDict[str, bool] = OrderedDict()
+        # digest -> future of a verdict that is queued or in flight
+        self._pending: dict[str, asyncio.Future] = {}
+        self._batch: list[tuple[str, str]] = []
+        self._flush_handle: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def _cached(self, digest: str) -> bool | None:
+        verdict = self._verdicts.get(digest)
+        if verdict is not None:
+            self._verdicts.move_to_end(digest)
+        return verdict
+
+    def _submit(self, text: str) -> asyncio.Future:
+        digest = _digest(text)
+        future = self._pending.get(digest)
+        if future is not None:
+            return future
+        future = asyncio.get_running_loop().create_future()
+        verdict = self._cached(digest)
+        if verdict is not None:
+            MODERATION_CHECKS.labels("cached").inc()
+            future.set_result(verdict)
+            return future
+        self._pending[digest] = future
+        self._batch.append((digest, text))
+        if len(self._batch) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.create_task(self._check(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _check(self, batch: list[tuple[str, str]]):
+        # One request serves many messages; don't charge it to the trace that happened to flush it.
+        set_trace(None)
+        MODERATION_BATCH_SIZE.labels().observe(len(batch))
+        flags = None
+        try:
+            flags = await get_moderation_flags([text for _, text in batch])
+        finally:
+            if flags is None or len(flags) != len(batch):
+                # Fail open, as is_content_offensive always has; ask again next time.
+                MODERATION_CHECKS.labels("error").inc(len(batch))
+                flags = [False] * len(batch)
+            else:
+                for (digest, _), flagged in zip(batch, flags):
+                    self._verdicts[digest] = flagged
+                    MODERATION_CHECKS.labels("flagged" if flagged else "clean").inc()
+                while len(self._verdicts) > self.cache_size:
+                    self._verdicts.popitem(last=False)
+            for (digest, _), flagged in zip(batch, flags):
+                future = self._pending.pop(digest, None)
+                if future and not future.done():
+                    future.set_result(flagged)
+
+    def prefetch(self, text: str):
+        """Starts checking `text` in the background so a later `allow` finds the verdict ready."""
+        if self.enabled and text and text.strip():
+            self._submit(text)
+
+    async def allow(self, text: str) -> bool:
+        """Whether `text` may be sent. Waits for its verdict, which prefetch has usually produced already."""
+        if not self.enabled or not text or not text.strip():
+            return True
+        flagged = await asyncio.shield(self._submit(text))
+        if flagged:
+            logger.warning("Moderation flagged an outbound message: '%s...'", text[:50])
+        return not flagged
+
+
+moderation_gate = ModerationGate()
@@ -1,28 +1,61 @@
+import logging
+import math
 import aiohttp
 from config.settings import APP_CONFIG
+from src.services.metrics import track_provider_call
+from src.services.usage import usage_ledger
+
+logger = logging.getLogger(__name__)
 
 API_KEY = APP_CONFIG.get("openai_api_key")
-CHAT_API_URL = "https://api.openai.com/v1/chat/completions"
-MODERATION_API_URL = "https://api.openai.com/v1/moderations"
+API_BASE = APP_CONFIG.get("openai_api_base", "https://api.openai.com/v1").rstrip("/")
+CHAT_API_URL = f"{API_BASE}/chat/completions"
+EMBEDDING_API_URL = f"{API_BASE}/embeddings"
+MODERATION_API_URL = f"{API_BASE}/moderations"
+DEFAULT_CHAT_MODEL = "gpt-4"
+
+async def get_llm_response(content: str, model: str = DEFAULT_CHAT_MODEL, max_tokens: int = 300) -> str:
+    completion = await get_llm_completion(content, model, max_tokens)
+    if "error" in completion:
+        return completion["error"]
+    return completion["text"]
 
-async def get_llm_response(content: str, model: str = "gpt-4", max_tokens: int = 300) -> str:
+async def get_llm_completion(content: str, model: str = DEFAULT_CHAT_MODEL, max_tokens: int = 300, logprobs: bool = False) -> dict:
+    """
+    Like get_llm_response, with the details callers may route on: returns
+    {"text", "model", "finish_reason", "confidence"} or {"error"} on failure.
+    With `logprobs`, confidence is the probability of the first generated token.
+    """
     if not API_KEY:
-        return "Error: OpenAI API key is not configured."
+        return {"error": "Error: OpenAI API key is not configured."}
 
+    # Near the usage budget, expensive models give way to ECONOMY_MODEL.
+    model = usage_ledger.choose_model(model)
     headers = {"Authorization": f"Bearer {API_KEY}"}
     payload = {"model": model, "messages": [{"role": "user", "content": content}], "max_tokens": max_tokens}
+    if logprobs:
+        payload["logprobs"] = True
     
     
     timeout = aiohttp.ClientTimeout(total=90) 
     async with aiohttp.ClientSession() as session:
         try:
-            async with session.post(CHAT_API_URL, headers=headers, json=payload, timeout=timeout) as response:
-                response.raise_for_status()
-                result = await response.json()
-                return result['choices'][0]['message']['content'].strip()
+            with track_provider_call("openai", "chat"):
+                async with session.post(CHAT_API_URL, headers=headers, json=payload, timeout=timeout) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                    usage_ledger.record("openai", model, result.get("usage"))
+                    choice = result['choices'][0]
+                    tokens = ((choice.get("logprobs") or {}).get("content") or [])
+                    return {
+                        "text": choice['message']['content'].strip(),
+                        "model": model,
+                        "finish_reason": choice.get("finish_reason"),
+                        "confidence": math.exp(tokens[0]["logprob"]) if tokens else None,
+                    }
         except Exception as e:
-            print(f"Error calling OpenAI Chat API: {e}")
-            return f"Error: Could not get a response from the language model. Details: {e}"
+            logger.error("Error calling OpenAI Chat API: %s", e)
+            return {"error": f"Error: Could not get a response from the language model. Details: {e}"}
         
 async def get_embedding(text: str, model="text-embedding-3-small") -> list[float]:
     """Gets a numerical embedding for a given text string."""
@@ -37,12 +70,35 @@ async def get_embedding(text: str, model="text-embedding-3-small") -> list[float
     
     async with aiohttp.ClientSession() as session:
         try:
-            async with session.post("https://api.openai.com/v1/embeddings", headers=headers, json=payload, timeout= timeout) as response:
-                response.raise_for_status()
-                result = await response.json()
-                return result["data"][0]["embedding"]
+            with track_provider_call("openai", "embedding"):
+                async with session.post(EMBEDDING_API_URL, headers=headers, json=payload, timeout= timeout) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                    usage_ledger.record("openai", model, result.get("usage"))
+                    return result["data"][0]["embedding"]
+        except Exception as e:
+            logger.error("Error calling OpenAI Embedding API: %s", e)
+            return []
+
+async def get_embeddings(texts: list[str], model="text-embedding-3-small") -> list[list[float]]:
+    """Embeds several texts in one request. Returns one embedding per text, or [] on failure."""
+    if not API_KEY or not texts:
+        return []
+
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    payload = {"input": texts, "model": model}
+
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession() as session:
+        try:
+            with track_provider_call("openai", "embedding_batch"):
+                async with session.post(EMBEDDING_API_URL, headers=headers, json=payload, timeout=timeout) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                    usage_ledger.record("openai", model, result.get("usage"))
+                    return [item["embedding"] for item in sorted(result["data"], key=lambda item: item["index"])]
         except Exception as e:
-            print(f"Error calling OpenAI Embedding API: {e}")
+            logger.error("Error calling OpenAI Embedding API for %s texts: %s", len(texts), e)
             return []
 
 async def is_content_offensive(text_to_check: str) -> bool:
@@ -55,10 +111,31 @@ async def is_content_offensive(text_to_check: str) -> bool:
     timeout = aiohttp.ClientTimeout(total=10) 
     async with aiohttp.ClientSession() as session:
         try:
-            async with session.post(MODERATION_API_URL, headers=headers, json=payload, timeout=timeout) as response:
-                response.raise_for_status()
-                result = await response.json()
-                return result["results"][0]["flagged"]
+            with track_provider_call("openai", "moderation"):
+                async with session.post(MODERATION_API_URL, headers=headers, json=payload, timeout=timeout) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                    return result["results"][0]["flagged"]
+        except Exception as e:
+            logger.warning("Moderation API call failed: %s. Assuming content is safe.", e)
+            return False
+
+async def get_moderation_flags(texts: list[str]) -> list[bool] | None:
+    """Moderates several texts in one request. Returns one flag per text, or None on failure."""
+    if not API_KEY or not texts:
+        return None
+
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    payload = {"input": texts}
+
+    timeout = aiohttp.ClientTimeout(total=10)
+    async with aiohttp.ClientSession() as session:
+        try:
+            with track_provider_call("openai", "moderation_batch"):
+                async with session.post(MODERATION_API_URL, headers=headers, json=payload, timeout=timeout) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+                    return [bool(item["flagged"]) for item in result["results"]]
         except Exception as e:
-            print(f"Warning: Moderation API call failed: {e}. Assuming content is safe.")
-            return False
\ No newline at end of file
+            logger.warning("Moderation API call failed for %s texts: %s", len(texts), e)
+            return None
@@ -0,0 +1,323 @@
+# src/services/sharding.py
+"""
+Channel sharding across several bot processes ("nodes").
+
+Each configured channel has a lease document in Firestore naming the node that
+owns it and when the lease expires. Every node heartbeats, renews its leases
+and claims free or expired ones up to its fair share (channels / live nodes),
+releasing extras when new nodes join. A node that stops renewing loses its
+channels once the lease TTL passes, and the next node to rebalance, or to see
+a message for the channel, takes them over.
+
+Listeners put messages into a ShardRouter instead of brain_queue. Telegram and
+Discord deliver every message to every connected node, so non-owners simply
+drop them. Slack Socket Mode delivers each event to only one connection, so
+non-owners forward it over HTTP to the owner's shard endpoint.
+"""
+import asyncio
+import dataclasses
+import logging
+import math
+import threading
+import time
+
+import aiohttp
+from aiohttp import web
+from firebase_admin import firestore
+
+from config.settings import APP_CONFIG
+from src.core_logic.channel_registry import channel_key, channel_registry
+from src.core_logic.internal_message import InternalMessage
+from src.services.metrics import MESSAGES_TOTAL, Gauge, track_provider_call
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = "bot_shard_leases"
+NODES_COLLECTION = "bot_shard_nodes"
+# Platforms whose client on every node receives every message.
+BROADCAST_PLATFORMS = {"telegram", "discord"}
+
+SHARD_OWNED_CHANNELS = Gauge(
+    "bot_shard_owned_channels",
+    "Channels whose lease is currently held by this node.")
+SHARD_LIVE_NODES = Gauge(
+    "bot_shard_live_nodes",
+    "Nodes with a fresh heartbeat at the last rebalance.")
+
+
+def configured_channels() -> list[str]:
+    """Lease keys for the channels this deployment serves."""
+    return [channel.key for channel in channel_registry.all()]
+
+
+class ShardCoordinator:
+    """
+    Holds this node's view of the lease table. Firestore calls are synchronous;
+    `rebalance` and `claim` are meant to run in a worker thread. They are
+    serialized with each other, and `owned` / `leases` are only touched under
+    a lock, since the event loop reads them meanwhile.
+    """
+    def __init__(self, db, node_id: str | None = None, channels: list[str] | None = None, lease_ttl: float | None = None):
+        self.db = db
+        self.node_id = node_id or APP_CONFIG["node_id"]
+        self.channels = configured_channels() if channels is None else channels
+        self.lease_ttl = APP_CONFIG.get("shard_lease_ttl_secs", 30) if lease_ttl is None else lease_ttl
+        self.address = ""
+        # key -> expiry of the lease we hold; key -> last lease document seen.
+        self.owned: dict[str, float] = {}
+        self.leases: dict[str, dict] = {}
+        # Guards `owned` and `leases`; held only for dict operations, never across a Firestore call.
+        self._lock = threading.Lock()
+        # Serializes claim, rebalance and shutdown, so one can't overwrite the lease updates of another.
+        self._table_lock = threading.Lock()
+        SHARD_OWNED_CHANNELS.labels().set_function(lambda: sum(1 for key in self.owned_keys() if self.owns_key(key)))
+
+    # --- Ownership queries (event loop) ---
+    def owned_keys(self) -> list[str]:
+        """The keys of the leases we hold, including any that lapsed since the last renewal."""
+        with self._lock:
+            return list(self.owned)
+
+    def owns_key(self, key: str) -> bool:
+        # A lease we failed to renew stops counting as ours at its expiry, even before another node claims it.
+        with self._lock:
+            expires_at = self.owned.get(key, 0)
+        return expires_at > time.time()
+
+    def owns(self, platform: str, channel_id) -> bool:
+        return self.owns_key(channel_key(platform, channel_id))
+
+    def live_owner(self, key: str) -> dict | None:
+        """The lease of another node that currently holds `key`, if any."""
+        with self._lock:
+            lease = self.leases.get(key)
+        if lease and lease.get("owner") and lease["owner"] != self.node_id and lease.get("expires_at", 0) > time.time():
+            return lease
+        return None
+
+    # --- Lease table (worker thread) ---
+    def _acquire(self, key: str, reclaim_released: bool = True) -> dict:
+        """
+        Takes or renews the lease for `key` unless another node holds a live one.
+        Returns the lease document as it stands after the attempt.
+        """
+        ref = self.db.collection(LEASES_COLLECTION).document(key)
+        now = time.time()
+
+        @firestore.transactional
+        def acquire_in_transaction(transaction):
+            snapshot = ref.get(transaction=transaction)
+            lease = snapshot.to_dict() if snapshot.exists else {}
+            held_elsewhere = lease.get("owner") not in (None, self.node_id) and lease.get("expires_at", 0) > now
+            released_by_us = lease.get("owner") is None and lease.get("released_by") == self.node_id
+            if held_elsewhere or (released_by_us and not reclaim_released):
+                return lease
+            renewed = {
+                "owner": self.node_id,
+                "address": self.address,
+                "expires_at": now + self.lease_ttl,
+                # Bumped on every change of owner so stale holders can be told apart.
+                "epoch": lease.get("epoch", 0) + (0 if lease.get("owner") == self.node_id else 1),
+            }
+            transaction.set(ref, renewed)
+            return renewed
+
+        with track_provider_call("firestore", "lease_acquire"):
+            lease = acquire_in_transaction(self.db.transaction())
+        with self._lock:
+            self.leases[key] = lease
+            if lease.get("owner") == self.node_id:
+                acquired = key not in self.owned
+                self.owned[key] = lease["expires_at"]
+                lost = False
+            else:
+                acquired, lost = False, self.owned.pop(key, None) is not None
+        if acquired:
+            logger.info("Acquired lease for %s (epoch %s).", key, lease.get("epoch"))
+        elif lost:
+            logger.warning("Lost lease for %s to node %s.", key, lease.get("owner"))
+        return lease
+
+    def _release(self, key: str):
+        with self._lock:
+            self.owned.pop(key, None)
+        lease = {"owner": None, "released_by": self.node_id, "expires_at": 0}
+        try:
+            with track_provider_call("firestore", "lease_release"):
+                self.db.collection(LEASES_COLLECTION).document(key).set(lease)
+            with self._lock:
+                self.leases[key] = lease
+            logger.info("Released lease for %s.", key)
+        except Exception as e:
+            logger.error("Could not release lease for %s: %s", key, e)
+
+    def claim(self, key: str) -> dict:
+        """On-demand takeover of a channel that has no live owner. Won't take back a channel we just handed off."""
+        with self._table_lock:
+            return self._acquire(key, reclaim_released=False)
+
+    def rebalance(self):
+        """Heartbeats, renews held leases, then claims or releases channels to match this node's fair share."""
+        with self._table_lock:
+            self._rebalance()
+
+    def _rebalance(self):
+        now = time.time()
+        nodes = self.db.collection(NODES_COLLECTION)
+        nodes.document(self.node_id).set({"address": self.address, "expires_at": now + self.lease_ttl})
+        live_nodes = 0
+        for snapshot in nodes.stream():
+            if snapshot.to_dict().get("expires_at", 0) > now:
+                live_nodes += 1
+            elif snapshot.id != self.node_id:
+                nodes.document(snapshot.id).delete()
+        live_nodes = max(1, live_nodes)
+        SHARD_LIVE_NODES.labels().set(live_nodes)
+        target = math.ceil(len(self.channels) / live_nodes)
+
+        leases = {snapshot.id: snapshot.to_dict() for snapshot in self.db.collection(LEASES_COLLECTION).stream()}
+        with self._lock:
+            self.leases = leases
+        for key in self.owned_keys():
+            self._acquire(key)
+        owned = self.owned_keys()
+        for key in sorted(owned, reverse=True)[:max(0, len(owned) - target)]:
+            self._release(key)
+        for key in self.channels:
+            owned = self.owned_keys()
+            if len(owned) >= target:
+                break
+            lease = leases.get(key, {})
+            if key not in owned and (not lease.get("owner") or lease.get("expires_at", 0) <= now):
+                self._acquire(key)
+
+    def shutdown(self):
+        with self._table_lock:
+            for key in self.owned_keys():
+                self._release(key)
+        try:
+            self.db.collection(NODES_COLLECTION).document(self.node_id).delete()
+        except Exception as e:
+            logger.error("Could not remove node heartbeat: %s", e)
+
+
+_coordinator: ShardCoordinator | None = None
+
+
+def set_coordinator(coordinator: ShardCoordinator | None):
+    global _coordinator
+    _coordinator = coordinator
+
+
+def owns_channel(platform: str, channel_id) -> bool:
+    """Whether this node should act on the channel. Always True when sharding is off."""
+    return _coordinator is None or _coordinator.owns(platform, channel_id)
+
+
+class ShardRouter:
+    """
+    Queue-like front of brain_queue handed to the listeners. Messages for channels
+    this node owns go to the local brain; the rest are dropped or forwarded.
+    Without a coordinator (sharding disabled) everything goes to the local brain.
+    """
+    def __init__(self, brain_queue: asyncio.Queue, coordinator: ShardCoordinator | None):
+        self.brain_queue = brain_queue
+        self.coordinator = coordinator
+
+    async def put(self, message: InternalMessage):
+        coordinator = self.coordinator
+        if coordinator is None or coordinator.owns(message.platform, message.channel_id):
+            await self.brain_queue.put(message)
+            return
+
+        key = channel_key(message.platform, message.channel_id)
+        owner = coordinator.live_owner(key)
+        if owner is None:
+            try:
+                lease = await asyncio.to_thread(coordinator.claim, key)
+            except Exception as e:
+                logger.error("Lease claim for %s failed: %s. Handling message locally.", key, e)
+                MESSAGES_TOTAL.labels("shard_router", "local").inc()
+                await self.brain_queue.put(message)
+                return
+            if lease.get("owner") == coordinator.node_id:
+                MESSAGES_TOTAL.labels("shard_router", "claimed").inc()
+                await self.brain_queue.put(message)
+                return
+            if not lease.get("owner"):
+                # We just handed this channel off. Other nodes see broadcast messages and will
+                # claim it themselves; a Slack event reached only us, so handle it here.
+                if message.platform in BROADCAST_PLATFORMS:
+                    MESSAGES_TOTAL.labels("shard_router", "foreign").inc()
+                else:
+                    MESSAGES_TOTAL.labels("shard_router", "local").inc()
+                    await self.brain_queue.put(message)
+                return
+            owner = lease
+
+        if message.platform in BROADCAST_PLATFORMS:
+            # The owner's own client received this message too.
+            MESSAGES_TOTAL.labels("shard_router", "foreign").inc()
+            return
+
+        if await self._forward(owner.get("address"), message):
+            MESSAGES_TOTAL.labels("shard_router", "forwarded").inc()
+        else:
+            # Better a reply from the wrong node than none; per-message claims keep it from being handled twice.
+            MESSAGES_TOTAL.labels("shard_router", "forward_failed").inc()
+            await self.brain_queue.put(message)
+
+    async def _forward(self, address: str | None, message: InternalMessage) -> bool:
+        if not address:
+            return False
+        timeout = aiohttp.ClientTimeout(total=5)
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                async with session.post(f"{address}/shard/messages", json=dataclasses.asdict(message)) as response:
+                    response.raise_for_status()
+            return True
+        except Exception as e:
+            logger.warning("Could not forward message %s to %s: %s", message.message_id, address, e)
+            return False
+
+
+def build_shard_app(brain_queue: asyncio.Queue) -> web.Application:
+    async def receive(request: web.Request) -> web.Response:
+        message = InternalMessage(**await request.json())
+        # received_at is on the sending node's perf_counter; received_time (wall clock) and the trace id carry over.
+        message.received_at = time.perf_counter()
+        await brain_queue.put(message)
+        MESSAGES_TOTAL.labels("shard_router", "received").inc()
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_post("/shard/messages", receive)
+    return app
+
+
+async def shard_worker(coordinator: ShardCoordinator, brain_queue: asyncio.Queue):
+    """
+    Serves the forwarding endpoint on SHARD_HOST:SHARD_PORT (0 picks a free port)
+    and rebalances leases every SHARD_RENEW_INTERVAL_SECS.
+    """
+    host = APP_CONFIG.get("shard_host", "127.0.0.1")
+    runner = web.AppRunner(build_shard_app(brain_queue), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, APP_CONFIG.get("shard_port", 0))
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    coordinator.address = f"http://{host}:{port}"
+    logger.info("Node '%s' serving shard endpoint on %s for %s channels.", coordinator.node_id, coordinator.address, len(coordinator.channels))
+
+    interval = APP_CONFIG.get("shard_renew_interval_secs", 10)
+    try:
+        while True:
+            try:
+                await asyncio.to_thread(coordinator.rebalance)
+                logger.debug("Owned channels: %s", sorted(key for key in coordinator.owned_keys() if coordinator.owns_key(key)))
+            except Exception as e:
+                logger.error("Lease rebalance failed: %s", e)
+            await asyncio.sleep(interval)
+    finally:
+        await asyncio.to_thread(coordinator.shutdown)
+        await runner.cleanup()
@@ -1,88 +1,150 @@
 # src/services/state_manager.py
-import json
-import os
+import hashlib
+import logging
 import time
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 from config.settings import APP_CONFIG
-# This class no longer needs 'os' or 'json' because it doesn't touch local files.
+from src.services.metrics import track_provider_call
+from src.services.storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+STATE_COLLECTION = "bot_state_prod"
+CORE_DOC = "core"
+DEFERRED_DOC = "deferred"
+PROCESSED_COLLECTION = f"{STATE_COLLECTION}/processed/messages"
+LINKS_COLLECTION = f"{STATE_COLLECTION}/links/entries"
+TOPICS_COLLECTION = f"{STATE_COLLECTION}/topics/entries"
+CHANNELS_COLLECTION = f"{STATE_COLLECTION}/channels/entries"
+SUMMARIES_COLLECTION = f"{STATE_COLLECTION}/summaries/entries"
+LEGACY_STATE_DOC = "singleton_state"
+# Documents created here carry `expire_at` for a Firestore TTL policy (SQLite prunes them on startup).
+PROCESSED_RETENTION = timedelta(days=7)
+TOPIC_RETENTION = timedelta(days=30)
+
+
+def _hash_key(value: str) -> str:
+    """Document id for free-form keys (URLs, topics) that may contain '/' or exceed id limits."""
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()
+
+
+def _legacy_message_key(message_id) -> str | None:
+    """
+    The dedupe key of a bare message id from the legacy processed log, or None
+    if its channel can't be told. The legacy bot served one channel per
+    platform (TELEGRAM_GROUP_ID, SLACK_CHANNEL_ID, DISCORD_CHANNEL_ID), and the
+    ids differ in shape: Slack's are "1718000000.123456" timestamps, Discord's
+    64-bit snowflakes and Telegram's small per-chat counters.
+    """
+    message_id = str(message_id)
+    if "." in message_id:
+        platform, channel_id = "slack", APP_CONFIG.get("slack_channel_id")
+    elif message_id.isdigit() and int(message_id) >= 2 ** 32:
+        platform, channel_id = "discord", APP_CONFIG.get("discord_channel_id")
+    elif message_id.isdigit():
+        platform, channel_id = "telegram", APP_CONFIG.get("telegram_group_id")
+    else:
+        return None
+    return f"{platform}:{channel_id}:{message_id}" if channel_id else None
+
 
 class StateManager:
     """
-    Manages all persistent state for the application using a single document
-    in Google Firestore.
+    Manages all persistent state for the application on a StorageBackend
+    (Firestore by default, or embedded SQLite).
+
+    State is split so that unrelated updates never touch the same document:
+
+        bot_state_prod/core                         core timers and global persona stickiness
+        bot_state_prod/deferred                     deferred generation batches and results
+        bot_state_prod/processed/messages/{key}     dedupe log, one document per platform:channel:message
+        bot_state_prod/links/entries/{sha1(url)}    link scheduler state
+        bot_state_prod/topics/entries/{sha1(topic)} initiated topics
+        bot_state_prod/channels/entries/{key}       per-channel activity and persona stickiness
+        bot_state_prod/summaries/entries/{key}      rolling per-channel summaries
+
+    Writes are merges of the fields that changed (or server-side increments),
+    so the brain and the scheduler no longer overwrite each other's changes.
     """
-    def __init__(self, db):
+    def __init__(self, storage: StorageBackend):
         """
-        Initializes the StateManager with a Firestore database client.
+        Initializes the StateManager with a storage backend.
 
         Args:
-            db: An initialized Firestore client instance.
-        """
-        if db is None:
-            raise ValueError("Firestore database client 'db' is required.")
-        
-        # This is a reference to the specific document that will hold all our state.
-        self.state_doc_ref = db.collection("bot_state_prod").document("singleton_state")
-        print("[STATE_MANAGER] Initialized with Firestore.")
-
-    def _get_default_state(self) -> dict:
-        """
-        Returns the default structure for the state document. This is used
-        if the document doesn't exist in Firestore yet.
+            storage: An opened StorageBackend (see src.services.storage.open_storage).
         """
+        if storage is None:
+            raise ValueError("A storage backend is required.")
+
+        self.storage = storage
+        self._provider = storage.name
+        self._migrate_legacy_state()
+        logger.info("Initialized with %s storage.", storage.name)
+
+    def _get_default_core_state(self) -> dict:
         return {
-            "processed_log": {},
-            "initiated_topics": {},
-            "link_scheduler_state": {},
-            "bot_core_state": {
-                "last_activity_time": time.time(),
-                "last_persona_info": {"name": None, "timestamp": 0},
-                "global_last_link_post_time": 0
-            }
+            "last_activity_time": time.time(),
+            "last_persona_info": {"name": None, "timestamp": 0},
+            "global_last_link_post_time": 0
         }
 
-    def _load_state(self) -> dict:
-        """
-        Fetches the entire state document from Firestore.
-        If the document doesn't exist, it creates it with a default structure.
-        """
+    def _migrate_legacy_state(self):
+        """One-time copy of the old single state document into the split layout. The old document is left in place."""
         try:
-            doc = self.state_doc_ref.get()
-            if doc.exists:
-                # If the document exists, return its data.
-                return doc.to_dict()
-            else:
-                # If it's the very first run, create the document with default values.
-                print("[STATE_MANAGER] State document not found. Creating with default values.")
-                default_state = self._get_default_state()
-                self.state_doc_ref.set(default_state)
-                return default_state
+            if self.storage.get(STATE_COLLECTION, CORE_DOC) is not None:
+                return
+            state = self.storage.get(STATE_COLLECTION, LEGACY_STATE_DOC)
+            if state is None:
+                self.storage.set(STATE_COLLECTION, CORE_DOC, self._get_default_core_state())
+                return
+            writes = [(STATE_COLLECTION, CORE_DOC, {**self._get_default_core_state(), **state.get("bot_core_state", {}), "migrated_from": LEGACY_STATE_DOC})]
+            now = datetime.now(timezone.utc)
+            for link, link_state in state.get("link_scheduler_state", {}).items():
+                writes.append((LINKS_COLLECTION, _hash_key(link), {"link": link, **link_state}))
+            for topic, initiated_at in state.get("initiated_topics", {}).items():
+                writes.append((TOPICS_COLLECTION, _hash_key(topic.lower()), {"topic": topic, "initiated_at": initiated_at, "expire_at": now + TOPIC_RETENTION}))
+            skipped = 0
+            for message_id, processed_at in state.get("processed_log", {}).items():
+                message_key = _legacy_message_key(message_id)
+                if message_key is None:
+                    skipped += 1
+                    continue
+                writes.append((PROCESSED_COLLECTION, message_key, {"processed_at": processed_at, "expire_at": now + PROCESSED_RETENTION}))
+            if skipped:
+                logger.warning("Skipped %s legacy processed message ids whose channel is unknown.", skipped)
+            for key, channel_state in state.get("channel_state", {}).items():
+                writes.append((CHANNELS_COLLECTION, key, channel_state))
+            # The core document goes last so an interrupted migration is retried.
+            writes.append(writes.pop(0))
+            self.storage.set_many(writes)
+            logger.info("Migrated legacy state document into %s split documents.", len(writes))
         except Exception as e:
-            print(f"CRITICAL ERROR loading state from Firestore: {e}")
-            # Fallback to a temporary in-memory state if Firestore is unreachable.
-            return self._get_default_state()
+            logger.critical("Error migrating legacy state: %s", e)
 
-    def _save_state(self, state: dict):
-        """Saves the entire state dictionary back to the Firestore document."""
+    # --- Methods for Core Bot State ---
+    def load_bot_state(self) -> dict:
+        """Loads the core timers and global persona stickiness."""
         try:
-            # The 'set' command overwrites the document with the new state.
-            self.state_doc_ref.set(state)
+            with track_provider_call(self._provider, "state_read"):
+                doc = self.storage.get(STATE_COLLECTION, CORE_DOC)
+            if doc is not None:
+                return {**self._get_default_core_state(), **doc}
         except Exception as e:
-            print(f"CRITICAL ERROR saving state to Firestore: {e}")
+            logger.critical("Error loading core state: %s", e)
+        return self._get_default_core_state()
 
-    # --- Methods for Core Bot State ---
-    def load_bot_state(self) -> dict:
-        """Loads just the core bot state portion of the document."""
-        full_state = self._load_state()
-        # Safely get the nested dictionary, providing a default if it's missing.
-        return full_state.get("bot_core_state", self._get_default_state()["bot_core_state"])
+    def update_bot_state(self, **fields):
+        """Writes only the given core fields, leaving concurrent changes to the others intact."""
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.update(STATE_COLLECTION, CORE_DOC, fields)
+        except Exception as e:
+            logger.critical("Error saving core state: %s", e)
 
     def save_bot_state(self, bot_core_state: dict):
-        """Saves just the core bot state portion of the document."""
-        full_state = self._load_state()
-        full_state["bot_core_state"] = bot_core_state
-        self._save_state(full_state)
+        """Merges a full core state dict. Prefer `update_bot_state` with just the changed fields."""
+        self.update_bot_state(**bot_core_state)
 
     # --- Methods for Link Scheduler State ---
     def get_link_state(self, link: str) -> dict:
@@ -90,74 +152,186 @@ class StateManager:
         Gets the state for a specific link (last post time and count).
         Returns a default structure if the link has no state yet.
         """
-        full_state = self._load_state()
-        return full_state.get("link_scheduler_state", {}).get(link, {"last_post_time": 0, "post_count": 0})
+        default = {"last_post_time": 0, "post_count": 0}
+        try:
+            with track_provider_call(self._provider, "state_read"):
+                doc = self.storage.get(LINKS_COLLECTION, _hash_key(link))
+            return {**default, **doc} if doc is not None else default
+        except Exception as e:
+            logger.critical("Error loading link state: %s", e)
+            return default
 
     def update_link_state(self, link: str):
         """
         Updates the state for a link after it has been posted.
-        Increments the post count and sets the last post time.
+        Increments the post count server-side and sets the last post time.
         """
-        full_state = self._load_state()
-        if "link_scheduler_state" not in full_state:
-            full_state["link_scheduler_state"] = {}
-        
-        # Get current state for the link or create a new one
-        link_data = full_state["link_scheduler_state"].get(link, {"last_post_time": 0, "post_count": 0})
-        
-        # Update the values
-        link_data["last_post_time"] = time.time()
-        link_data["post_count"] += 1
-        
-        # Save it back
-        full_state["link_scheduler_state"][link] = link_data
-        self._save_state(full_state)
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.update(LINKS_COLLECTION, _hash_key(link),
+                                    {"link": link, "last_post_time": time.time()}, increments={"post_count": 1})
+        except Exception as e:
+            logger.critical("Error saving link state: %s", e)
+
+    # --- Methods for Per-Channel State ---
+    def get_all_channel_states(self) -> dict:
+        try:
+            with track_provider_call(self._provider, "state_read"):
+                return self.storage.get_all(CHANNELS_COLLECTION)
+        except Exception as e:
+            logger.critical("Error loading channel states: %s", e)
+            return {}
+
+    def get_channel_state(self, channel_key: str) -> dict:
+        try:
+            with track_provider_call(self._provider, "state_read"):
+                return self.storage.get(CHANNELS_COLLECTION, channel_key) or {}
+        except Exception as e:
+            logger.critical("Error loading channel state: %s", e)
+            return {}
+
+    def record_channel_activity(self, channel_key: str, timestamp: float | None = None):
+        """Stamps the channel's last activity."""
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.update(CHANNELS_COLLECTION, channel_key, {"last_activity_time": timestamp or time.time()})
+        except Exception as e:
+            logger.critical("Error saving channel activity: %s", e)
+
+    def get_channel_summary(self, channel_key: str) -> dict:
+        try:
+            with track_provider_call(self._provider, "state_read"):
+                return self.storage.get(SUMMARIES_COLLECTION, channel_key) or {}
+        except Exception as e:
+            logger.critical("Error loading channel summary: %s", e)
+            return {}
+
+    def save_channel_summary(self, channel_key: str, summary: dict):
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.set(SUMMARIES_COLLECTION, channel_key, summary)
+        except Exception as e:
+            logger.critical("Error saving channel summary: %s", e)
+
+    def get_deferred_generations(self) -> dict:
+        try:
+            with track_provider_call(self._provider, "state_read"):
+                return self.storage.get(STATE_COLLECTION, DEFERRED_DOC) or {}
+        except Exception as e:
+            logger.critical("Error loading deferred generations: %s", e)
+            return {}
+
+    def save_deferred_generations(self, deferred: dict):
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.set(STATE_COLLECTION, DEFERRED_DOC, deferred)
+        except Exception as e:
+            logger.critical("Error saving deferred generations: %s", e)
 
     # --- Methods for Persona Stickiness ---
-    def get_last_persona_info(self) -> dict:
-        bot_core_state = self.load_bot_state()
-        return bot_core_state.get("last_persona_info", {"name": None, "timestamp": 0})
+    def get_last_persona_info(self, channel_key: str | None = None) -> dict:
+        default = {"name": None, "timestamp": 0}
+        if channel_key:
+            return self.get_channel_state(channel_key).get("last_persona_info", default)
+        return self.load_bot_state().get("last_persona_info", default)
 
-    def update_last_persona_info(self, persona_name: str):
-        bot_core_state = self.load_bot_state()
-        bot_core_state["last_persona_info"] = {"name": persona_name, "timestamp": time.time()}
-        self.save_bot_state(bot_core_state)
+    def update_last_persona_info(self, persona_name: str, channel_key: str | None = None):
+        info = {"name": persona_name, "timestamp": time.time()}
+        if not channel_key:
+            self.update_bot_state(last_persona_info=info)
+            return
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.update(CHANNELS_COLLECTION, channel_key, {"last_persona_info": info})
+        except Exception as e:
+            logger.critical("Error saving persona stickiness: %s", e)
 
     # --- Methods for Message and Topic Logs ---
-    def has_processed(self, message_id: str) -> bool:
-        full_state = self._load_state()
-        return str(message_id) in full_state.get("processed_log", {})
-
-    def log_processed(self, message_id: str):
-        full_state = self._load_state()
-        if "processed_log" not in full_state:
-            full_state["processed_log"] = {}
-        
-        log = full_state["processed_log"]
-        log[str(message_id)] = datetime.now(timezone.utc).isoformat()
-        
-        # Prune the log if it gets too big
-        if len(log) > 500:
-            # Sort by timestamp and keep the most recent 400
-            sorted_items = sorted(log.items(), key=lambda item: item[1], reverse=True)
-            full_state["processed_log"] = dict(sorted_items[:400])
-        
-        self._save_state(full_state)
-
-    def log_initiated_topic(self, topic: str):
-        full_state = self._load_state()
-        if "initiated_topics" not in full_state:
-            full_state["initiated_topics"] = {}
-            
-        topics = full_state["initiated_topics"]
-        topics[topic] = datetime.now(timezone.utc).isoformat()
-        
-        if len(topics) > 50:
-            sorted_items = sorted(topics.items(), key=lambda item: item[1], reverse=True)
-            full_state["initiated_topics"] = dict(sorted_items[:40])
-            
-        self._save_state(full_state)
+    def has_processed(self, message_key: str) -> bool:
+        try:
+            with track_provider_call(self._provider, "state_read"):
+                return self.storage.get(PROCESSED_COLLECTION, str(message_key)) is not None
+        except Exception as e:
+            logger.critical("Error reading dedupe log: %s", e)
+            return False
+
+    def log_processed(self, message_key: str):
+        now = datetime.now(timezone.utc)
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.set(PROCESSED_COLLECTION, str(message_key), {"processed_at": now.isoformat(), "expire_at": now + PROCESSED_RETENTION})
+        except Exception as e:
+            logger.critical("Error writing dedupe log: %s", e)
+
+    def log_processed_many(self, message_keys: list[str]):
+        """Marks many messages as processed in batched writes, by their dedupe keys."""
+        now = datetime.now(timezone.utc)
+        data = {"processed_at": now.isoformat(), "expire_at": now + PROCESSED_RETENTION}
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.set_many([(PROCESSED_COLLECTION, str(message_key), data) for message_key in message_keys])
+        except Exception as e:
+            logger.critical("Error writing dedupe log: %s", e)
+
+    def claim_message(self, message_key: str) -> bool:
+        """
+        Atomically marks a message as taken and returns False if it was already
+        claimed, by this node or another one. Document creation is the only
+        check-and-set here that is safe across processes.
+        """
+        now = datetime.now(timezone.utc)
+        try:
+            with track_provider_call(self._provider, "message_claim"):
+                return self.storage.create(PROCESSED_COLLECTION, message_key, {
+                    "node_id": APP_CONFIG.get("node_id"),
+                    "processed_at": now.isoformat(),
+                    "expire_at": now + PROCESSED_RETENTION,
+                })
+        except Exception as e:
+            logger.error("Error claiming message %s: %s", message_key, e)
+            # Prefer a possible duplicate reply over silently dropping the message.
+            return True
+
+    def log_initiated_topic(self, topic: str, embedding: list[float] | None = None):
+        now = datetime.now(timezone.utc)
+        data = {"topic": topic, "initiated_at": now.isoformat(), "expire_at": now + TOPIC_RETENTION}
+        if embedding:
+            data["embedding"] = embedding
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.set(TOPICS_COLLECTION, _hash_key(topic.lower()), data)
+        except Exception as e:
+            logger.critical("Error logging initiated topic: %s", e)
+
+    def get_recent_initiated_topics(self) -> list[dict]:
+        """Initiated topics still within the retention window, with their embeddings where known."""
+        cutoff = datetime.now(timezone.utc) - TOPIC_RETENTION
+        try:
+            with track_provider_call(self._provider, "state_read"):
+                docs = self.storage.get_all(TOPICS_COLLECTION)
+            return [doc for doc in docs.values()
+                    if doc.get("topic") and datetime.fromisoformat(doc.get("initiated_at")) > cutoff]
+        except Exception as e:
+            logger.critical("Error loading initiated topics: %s", e)
+            return []
+
+    def set_topic_embedding(self, topic: str, embedding: list[float]):
+        """Backfills the embedding of a topic logged without one."""
+        try:
+            with track_provider_call(self._provider, "state_write"):
+                self.storage.update(TOPICS_COLLECTION, _hash_key(topic.lower()), {"embedding": embedding})
+        except Exception as e:
+            logger.critical("Error saving topic embedding: %s", e)
 
     def is_topic_recently_initiated(self, topic: str) -> bool:
-        full_state = self._load_state()
-        return topic.lower() in (t.lower() for t in full_state.get("initiated_topics", {}).keys())
\ No newline at end of file
+        try:
+            with track_provider_call(self._provider, "state_read"):
+                doc = self.storage.get(TOPICS_COLLECTION, _hash_key(topic.lower()))
+            if doc is None:
+                return False
+            # TTL deletion is lazy (and optional), so check the age here as well.
+            initiated_at = datetime.fromisoformat(doc.get("initiated_at"))
+            return datetime.now(timezone.utc) - initiated_at < TOPIC_RETENTION
+        except Exception as e:
+            logger.critical("Error reading initiated topics: %s", e)
+            return False
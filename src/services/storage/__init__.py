@@ -0,0 +1,34 @@
+# src/services/storage/__init__.py
+"""
+Storage backends for bot state and chat history.
+
+STORAGE_BACKEND selects the implementation:
+    firestore  Google Firestore (default; required for sharding)
+    sqlite     embedded SQLite file at SQLITE_PATH, for single-node deployments
+"""
+import logging
+
+from config.settings import APP_CONFIG
+from src.services.storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+def open_storage(kind: str | None = None) -> StorageBackend:
+    """Creates the configured backend. Implementations are imported lazily so each only needs its own client library."""
+    kind = kind or APP_CONFIG.get("storage_backend", "firestore")
+    if kind == "sqlite":
+        from src.services.storage.sqlite_backend import SQLiteStorage
+        return SQLiteStorage()
+    if kind == "firestore":
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+        from src.services.storage.firestore_backend import FirestoreStorage
+        if not firebase_admin._apps:
+            cred = credentials.Certificate(APP_CONFIG['firebase_cred_path'])
+            firebase_admin.initialize_app(cred)
+        return FirestoreStorage(firestore.client())
+    raise ValueError(f"Unknown storage backend '{kind}'")
+
+
+__all__ = ["StorageBackend", "open_storage"]
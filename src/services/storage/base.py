@@ -0,0 +1,63 @@
+# src/services/storage/base.py
+from abc import ABC, abstractmethod
+
+
+class StorageBackend(ABC):
+    """
+    Persistence used by StateManager and fetch_db.
+
+    Documents are small dicts addressed by a collection path (segments joined
+    with '/', e.g. "bot_state_prod/links/entries") and a document id. Chat
+    history is stored per channel and read back newest first as entries of
+    {"message_id", "text", "sender_id", "platform", "ts"}.
+
+    Methods are synchronous and may block; async callers offload them with
+    asyncio.to_thread where the latency matters.
+    """
+    # Provider label for the bot_provider_* metrics.
+    name = "storage"
+
+    # --- Documents ---
+    @abstractmethod
+    def get(self, collection: str, doc_id: str) -> dict | None:
+        """The document's data, or None if it doesn't exist."""
+
+    @abstractmethod
+    def set(self, collection: str, doc_id: str, data: dict):
+        """Creates or replaces the document."""
+
+    @abstractmethod
+    def update(self, collection: str, doc_id: str, fields: dict, increments: dict | None = None):
+        """
+        Merges top-level `fields` into the document (creating it if needed) and
+        adds `increments` to numeric fields atomically, leaving other fields intact.
+        """
+
+    @abstractmethod
+    def create(self, collection: str, doc_id: str, data: dict) -> bool:
+        """Creates the document only if it doesn't exist yet. Returns False if it did."""
+
+    @abstractmethod
+    def get_all(self, collection: str) -> dict[str, dict]:
+        """Every document of the collection, keyed by id."""
+
+    @abstractmethod
+    def set_many(self, writes: list[tuple[str, str, dict]]):
+        """Writes (collection, doc_id, data) tuples with as few round trips as possible."""
+
+    # --- Chat history ---
+    @abstractmethod
+    def save_message(self, channel_id: str, doc: dict):
+        """Stores one message ({"message_id", "text", "sender_id", "platform", "date"})."""
+
+    def save_messages(self, channel_id: str, docs: list[dict]):
+        """Stores many messages at once, e.g. when catching up after downtime."""
+        for doc in docs:
+            self.save_message(channel_id, doc)
+
+    @abstractmethod
+    def latest_messages(self, channel_id: str, n: int, operation: str = "history_read") -> list[dict]:
+        """The latest `n` messages of a channel, newest first."""
+
+    def close(self):
+        """Flushes pending writes and releases resources."""
@@ -0,0 +1,336 @@
+# src/services/storage/firestore_backend.py
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud.firestore import ArrayUnion, Increment, Query
+
+from config.settings import APP_CONFIG
+from src.services.metrics import track_provider_call
+from src.services.storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Besides one document per message in `conversation_ai_{channel}`, each channel
+# keeps aggregate documents in `conversation_history_{channel}`:
+#   - "tail": the latest HISTORY_TAIL_SIZE messages, rewritten from the
+#     writer's in-memory copy every HISTORY_TAIL_FLUSH_MESSAGES messages or
+#     HISTORY_TAIL_FLUSH_SECS, whichever comes first;
+#   - "YYYYMMDDHH": the messages of that UTC hour, appended with ArrayUnion.
+#     A bucket that reaches HISTORY_BUCKET_MAX_MESSAGES messages or
+#     HISTORY_BUCKET_MAX_BYTES rolls over to "YYYYMMDDHH-1", "-2", ..., and the
+#     hour's first document records the number of parts in `parts`.
+# Recent history is then one document read (or none, from the writer's cache)
+# instead of one billed read per message returned.
+TAIL_DOC_ID = "tail"
+MAX_BUCKET_READS = 2
+# Firestore caps a batch at 500 writes.
+MAX_BATCH_WRITES = 500
+
+
+def _bucket_id(moment: datetime, part: int = 0) -> str:
+    hour = moment.strftime("%Y%m%d%H")
+    return f"{hour}-{part}" if part else hour
+
+
+def _entry_size(entry: dict) -> int:
+    # Close enough to Firestore's own accounting to stay well clear of its 1 MiB document limit.
+    return len(json.dumps(entry)) + 16
+
+
+def _to_entry(doc: dict) -> dict:
+    date = doc.get("date")
+    return {
+        "message_id": doc.get("message_id"),
+        "text": doc.get("text", ""),
+        "sender_id": doc.get("sender_id"),
+        "platform": doc.get("platform"),
+        "ts": date.timestamp() if isinstance(date, datetime) else float(date or 0),
+    }
+
+
+class FirestoreStorage(StorageBackend):
+    """StorageBackend on a (synchronous) Firestore client."""
+    name = "firestore"
+
+    def __init__(self, client):
+        self.client = client
+        # channel -> (latest messages, monotonic time of the last sync with Firestore)
+        self._tails: dict[str, tuple[deque, float]] = {}
+        # channel -> (messages not in its tail document yet, monotonic time of the first of them)
+        self._tail_pending: dict[str, tuple[int, float]] = {}
+        # channel -> [hour id, part, messages, bytes] of the bucket it currently appends to
+        self._buckets: dict[str, list] = {}
+        self._tails_lock = threading.Lock()
+        self._flush_timer: threading.Timer | None = None
+        self.tail_flush_messages = APP_CONFIG.get("history_tail_flush_messages", 20)
+        self.tail_flush_secs = APP_CONFIG.get("history_tail_flush_secs", 30)
+
+    def _ref(self, collection: str, doc_id: str):
+        return self.client.collection(collection).document(doc_id)
+
+    # --- Documents ---
+    def get(self, collection: str, doc_id: str) -> dict | None:
+        snapshot = self._ref(collection, doc_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    def set(self, collection: str, doc_id: str, data: dict):
+        self._ref(collection, doc_id).set(data)
+
+    def update(self, collection: str, doc_id: str, fields: dict, increments: dict | None = None):
+        data = dict(fields)
+        for field, amount in (increments or {}).items():
+            data[field] = Increment(amount)
+        self._ref(collection, doc_id).set(data, merge=True)
+
+    def create(self, collection: str, doc_id: str, data: dict) -> bool:
+        try:
+            self._ref(collection, doc_id).create(data)
+            return True
+        except AlreadyExists:
+            return False
+
+    def get_all(self, collection: str) -> dict[str, dict]:
+        return {snapshot.id: snapshot.to_dict() for snapshot in self.client.collection(collection).stream()}
+
+    def set_many(self, writes: list[tuple[str, str, dict]]):
+        for start in range(0, len(writes), MAX_BATCH_WRITES):
+            batch = self.client.batch()
+            for collection, doc_id, data in writes[start:start + MAX_BATCH_WRITES]:
+                batch.set(self._ref(collection, doc_id), data)
+            batch.commit()
+
+    # --- Chat history ---
+    def _history_collection(self, channel_id: str):
+        return self.client.collection(f"conversation_history_{channel_id}")
+
+    def _query_latest_messages(self, channel_id: str, n: int, operation: str) -> list[dict]:
+        """The original per-message query, newest first. Used to seed the tail and as a fallback."""
+        query = self.client.collection(f"conversation_ai_{channel_id}").order_by("date", direction=Query.DESCENDING).limit(n)
+        with track_provider_call("firestore", operation):
+            return [_to_entry(doc.to_dict()) for doc in query.stream() if doc.to_dict()]
+
+    def _cached_tail(self, channel_id: str) -> deque | None:
+        cached = self._tails.get(channel_id)
+        # A tail with unflushed messages is newer than its document, however old.
+        if cached and (channel_id in self._tail_pending
+                       or time.monotonic() - cached[1] < APP_CONFIG.get("history_cache_ttl_secs", 300)):
+            return cached[0]
+        return None
+
+    def _tail_for_write(self, channel_id: str) -> deque:
+        """
+        The in-memory tail of a channel, loaded from its tail document on first use.
+        A channel without one is seeded once from the per-message collection.
+        """
+        tail = self._cached_tail(channel_id)
+        if tail is not None:
+            return tail
+        size = APP_CONFIG.get("history_tail_size", 120)
+        with track_provider_call("firestore", "history_tail_read"):
+            snapshot = self._history_collection(channel_id).document(TAIL_DOC_ID).get()
+        if snapshot.exists:
+            entries = snapshot.to_dict().get("messages", [])
+        else:
+            entries = list(reversed(self._query_latest_messages(channel_id, size, "history_seed")))
+            logger.info("Seeded history tail for channel %s with %s messages.", channel_id, len(entries))
+        tail = deque(entries, maxlen=size)
+        self._tails[channel_id] = (tail, time.monotonic())
+        return tail
+
+    def _bucket_for_write(self, channel_id: str, start: datetime, entry: dict) -> tuple[str, int | None]:
+        """
+        The bucket document `entry` goes to, and the hour's new part count if
+        this starts a new part. The fill of an hour's last part is read back
+        once per process (one or two reads), then tracked here.
+        """
+        hour = _bucket_id(start)
+        state = self._buckets.get(channel_id)
+        if state is None or state[0] != hour:
+            history = self._history_collection(channel_id)
+            with track_provider_call("firestore", "history_bucket_read"):
+                snapshot = history.document(hour).get()
+            data = snapshot.to_dict() if snapshot.exists else {}
+            part = max(data.get("parts", 1), 1) - 1
+            if part:
+                with track_provider_call("firestore", "history_bucket_read"):
+                    snapshot = history.document(_bucket_id(start, part)).get()
+                data = snapshot.to_dict() if snapshot.exists else {}
+            messages = data.get("messages", [])
+            state = [hour, part, len(messages), sum(_entry_size(e) for e in messages)]
+            self._buckets[channel_id] = state
+
+        size = _entry_size(entry)
+        parts = None
+        if state[2] and (state[2] >= APP_CONFIG.get("history_bucket_max_messages", 2000)
+                         or state[3] + size > APP_CONFIG.get("history_bucket_max_bytes", 512 * 1024)):
+            state[1:] = [state[1] + 1, 0, 0]
+            parts = state[1] + 1
+        state[2] += 1
+        state[3] += size
+        return _bucket_id(start, state[1]), parts
+
+    def _bucket_writes(self, channel_id: str, docs: list[dict]) -> list[tuple]:
+        """(ref, data, merge) writes that append `docs` to their hourly buckets, rolling over full ones."""
+        history = self._history_collection(channel_id)
+        buckets: dict[str, tuple[datetime, list[dict]]] = {}
+        part_counts: dict[str, int] = {}
+        for doc in sorted(docs, key=lambda d: d["date"]):
+            start = doc["date"].replace(minute=0, second=0, microsecond=0)
+            entry = _to_entry(doc)
+            bucket_id, parts = self._bucket_for_write(channel_id, start, entry)
+            buckets.setdefault(bucket_id, (start, []))[1].append(entry)
+            if parts:
+                part_counts[_bucket_id(start)] = parts
+        writes = [(history.document(bucket_id), {"start": start, "messages": ArrayUnion(entries)}, True)
+                  for bucket_id, (start, entries) in buckets.items()]
+        writes += [(history.document(hour), {"parts": parts}, True) for hour, parts in part_counts.items()]
+        return writes
+
+    def _schedule_tail_flush(self):
+        """Must be called with the tails lock held."""
+        if self._flush_timer is None and self.tail_flush_secs > 0:
+            self._flush_timer = threading.Timer(self.tail_flush_secs, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """Writes the tail document of every channel with messages not in it yet."""
+        with self._tails_lock:
+            self._flush_timer = None
+            channels = [channel_id for channel_id in self._tail_pending if channel_id in self._tails]
+            now = datetime.now(timezone.utc)
+            try:
+                for offset in range(0, len(channels), MAX_BATCH_WRITES):
+                    batch = self.client.batch()
+                    for channel_id in channels[offset:offset + MAX_BATCH_WRITES]:
+                        batch.set(self._history_collection(channel_id).document(TAIL_DOC_ID),
+                                  {"messages": list(self._tails[channel_id][0]), "updated_at": now})
+                    with track_provider_call("firestore", "history_tail_flush"):
+                        batch.commit()
+                    for channel_id in channels[offset:offset + MAX_BATCH_WRITES]:
+                        self._tail_pending.pop(channel_id, None)
+                        self._tails[channel_id] = (self._tails[channel_id][0], time.monotonic())
+            except Exception as e:
+                logger.error("Error flushing history tails: %s", e)
+                self._schedule_tail_flush()
+
+    def close(self):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+        self.flush()
+
+    def save_message(self, channel_id: str, doc: dict):
+        """
+        Writes the message document and appends to the hourly bucket in one
+        batched commit, with the tail when enough messages or time piled up.
+        """
+        now = doc["date"]
+        entry = _to_entry(doc)
+        history = self._history_collection(channel_id)
+
+        with self._tails_lock:
+            # Appended to a copy: a full deque drops its oldest entry, which a failed commit couldn't give back.
+            cached = self._tail_for_write(channel_id)
+            tail = deque(cached, maxlen=cached.maxlen)
+            tail.append(entry)
+            synced_at = self._tails[channel_id][1]
+            pending, since = self._tail_pending.get(channel_id, (0, time.monotonic()))
+            write_tail = pending + 1 >= self.tail_flush_messages or time.monotonic() - since >= self.tail_flush_secs
+            batch = self.client.batch()
+            batch.set(self.client.collection(f"conversation_ai_{channel_id}").document(doc["message_id"]), doc)
+            try:
+                for ref, data, merge in self._bucket_writes(channel_id, [doc]):
+                    batch.set(ref, data, merge=merge)
+                if write_tail:
+                    batch.set(history.document(TAIL_DOC_ID), {"messages": list(tail), "updated_at": now})
+                with track_provider_call("firestore", "save_message"):
+                    batch.commit()
+            except Exception:
+                # Our bucket fill is off now; read it back next time. The cached tail is untouched.
+                self._buckets.pop(channel_id, None)
+                raise
+            if write_tail:
+                self._tail_pending.pop(channel_id, None)
+                self._tails[channel_id] = (tail, time.monotonic())
+            else:
+                self._tails[channel_id] = (tail, synced_at)
+                self._tail_pending[channel_id] = (pending + 1, since)
+                self._schedule_tail_flush()
+
+    def save_messages(self, channel_id: str, docs: list[dict]):
+        """
+        Bulk version of save_message: the message documents, one ArrayUnion per
+        hourly bucket and a single tail rewrite, in batches of MAX_BATCH_WRITES.
+        """
+        if not docs:
+            return
+        messages = self.client.collection(f"conversation_ai_{channel_id}")
+        history = self._history_collection(channel_id)
+
+        with self._tails_lock:
+            tail = self._tail_for_write(channel_id)
+            # Older messages may land behind newer ones already in the tail; keep it in time order.
+            merged = {entry["message_id"]: entry for entry in [*tail, *(_to_entry(doc) for doc in docs)]}
+            tail = deque(sorted(merged.values(), key=lambda e: e.get("ts", 0)), maxlen=tail.maxlen)
+            writes = [(messages.document(doc["message_id"]), doc, False) for doc in docs]
+            writes += self._bucket_writes(channel_id, docs)
+            writes.append((history.document(TAIL_DOC_ID), {"messages": list(tail), "updated_at": datetime.now(timezone.utc)}, False))
+            try:
+                for offset in range(0, len(writes), MAX_BATCH_WRITES):
+                    batch = self.client.batch()
+                    for ref, data, merge in writes[offset:offset + MAX_BATCH_WRITES]:
+                        batch.set(ref, data, merge=merge)
+                    with track_provider_call("firestore", "save_messages"):
+                        batch.commit()
+                self._tail_pending.pop(channel_id, None)
+                self._tails[channel_id] = (tail, time.monotonic())
+            except Exception:
+                self._buckets.pop(channel_id, None)
+                if channel_id not in self._tail_pending:
+                    # Otherwise the cached tail (without `docs`) holds the only copy of the unflushed messages.
+                    self._tails.pop(channel_id, None)
+                raise
+
+    def latest_messages(self, channel_id: str, n: int, operation: str = "history_read") -> list[dict]:
+        """Reads from the writer's cache, then the tail document, then hourly buckets, using as few document reads as possible."""
+        tail_size = APP_CONFIG.get("history_tail_size", 120)
+        if n <= tail_size:
+            # The tail is seeded from the full history, so a short tail means a short history.
+            with self._tails_lock:
+                tail = self._cached_tail(channel_id)
+                if tail is not None:
+                    return list(tail)[-n:][::-1]
+
+        history = self._history_collection(channel_id)
+        with track_provider_call("firestore", f"{operation}_tail"):
+            snapshot = history.document(TAIL_DOC_ID).get()
+        if snapshot.exists:
+            if n <= tail_size:
+                return snapshot.to_dict().get("messages", [])[-n:][::-1]
+
+            # Further back than the tail reaches: walk back through the hourly buckets.
+            collected = []
+            moment = datetime.now(timezone.utc)
+            for _ in range(MAX_BUCKET_READS):
+                with track_provider_call("firestore", f"{operation}_bucket"):
+                    bucket = history.document(_bucket_id(moment)).get()
+                first = bucket.to_dict() if bucket.exists else {}
+                # An hour's later parts hold its newer messages; read them newest first.
+                for part in range(first.get("parts", 1) - 1, 0, -1):
+                    if len(collected) >= n:
+                        break
+                    with track_provider_call("firestore", f"{operation}_bucket"):
+                        later = history.document(_bucket_id(moment, part)).get()
+                    if later.exists:
+                        collected = sorted(later.to_dict().get("messages", []), key=lambda e: e.get("ts", 0)) + collected
+                collected = sorted(first.get("messages", []), key=lambda e: e.get("ts", 0)) + collected
+                if len(collected) >= n:
+                    return collected[-n:][::-1]
+                moment -= timedelta(hours=1)
+
+        return self._query_latest_messages(channel_id, n, operation)
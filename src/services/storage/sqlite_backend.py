@@ -0,0 +1,208 @@
+# src/services/storage/sqlite_backend.py
+"""
+Embedded SQLite storage for single-node deployments, benchmarks and tests.
+
+Everything lives in one database file opened in WAL mode, so state checks and
+history reads are local B-tree lookups instead of network round trips. One
+connection is shared by the event loop and worker threads behind a lock.
+
+Writes are group-committed: they join an open transaction that is committed
+once `sqlite_batch_size` writes are pending or `sqlite_commit_interval_ms`
+after the first of them, whichever comes first. Reads on the same connection
+see uncommitted writes, so batching never shows stale data within the process;
+a crash loses at most one commit interval of writes.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+from config.settings import APP_CONFIG
+from src.services.metrics import track_provider_call
+from src.services.storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    collection TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (collection, doc_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS messages (
+    channel_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    sender_id TEXT,
+    platform TEXT,
+    date REAL NOT NULL,
+    PRIMARY KEY (channel_id, message_id)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_channel_date ON messages (channel_id, date);
+"""
+
+
+def _encode(data: dict) -> str:
+    # Datetimes (e.g. `expire_at`) are stored as ISO strings, which sort chronologically.
+    return json.dumps(data, default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value))
+
+
+class SQLiteStorage(StorageBackend):
+    """StorageBackend on an embedded SQLite database file (or ":memory:")."""
+    name = "sqlite"
+
+    def __init__(self, path: str | None = None, batch_size: int | None = None, commit_interval_ms: float | None = None):
+        self.path = path or APP_CONFIG["sqlite_path"]
+        self.batch_size = batch_size or APP_CONFIG.get("sqlite_batch_size", 100)
+        interval_ms = APP_CONFIG.get("sqlite_commit_interval_ms", 50) if commit_interval_ms is None else commit_interval_ms
+        self.commit_interval = interval_ms / 1000
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        # Autocommit mode: transactions are opened and committed explicitly below.
+        self._conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._pending = 0
+        self._flush_timer: threading.Timer | None = None
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA temp_store=MEMORY")
+            self._conn.executescript(SCHEMA)
+        self._prune_expired()
+        logger.info("Opened SQLite storage at %s.", self.path)
+
+    # --- Write batching ---
+    def _begin_write(self):
+        """Must be called with the lock held before every write."""
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN")
+            if self.commit_interval > 0:
+                self._flush_timer = threading.Timer(self.commit_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _end_write(self, count: int = 1):
+        self._pending += count
+        if self._pending >= self.batch_size or self.commit_interval <= 0:
+            self._commit()
+
+    def _commit(self):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        self._pending = 0
+        if self._conn.in_transaction:
+            self._conn.execute("COMMIT")
+
+    def flush(self):
+        """Commits the pending batch, if any."""
+        try:
+            with self._lock:
+                self._commit()
+        except sqlite3.Error as e:
+            logger.critical("Error committing SQLite batch: %s", e)
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+    def _prune_expired(self):
+        """SQLite has no TTL policy; drop documents whose `expire_at` has passed."""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM documents WHERE json_extract(data, '$.expire_at') < ?",
+                (datetime.now(timezone.utc).isoformat(),)).rowcount
+        if deleted:
+            logger.info("Pruned %s expired documents.", deleted)
+
+    # --- Documents ---
+    def _get(self, collection: str, doc_id: str) -> dict | None:
+        row = self._conn.execute(
+            "SELECT data FROM documents WHERE collection = ? AND doc_id = ?", (collection, doc_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, collection: str, doc_id: str, data: dict):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO documents (collection, doc_id, data) VALUES (?, ?, ?)",
+            (collection, doc_id, _encode(data)))
+
+    def get(self, collection: str, doc_id: str) -> dict | None:
+        with self._lock:
+            return self._get(collection, doc_id)
+
+    def set(self, collection: str, doc_id: str, data: dict):
+        with self._lock:
+            self._begin_write()
+            self._put(collection, doc_id, data)
+            self._end_write()
+
+    def update(self, collection: str, doc_id: str, fields: dict, increments: dict | None = None):
+        with self._lock:
+            self._begin_write()
+            data = self._get(collection, doc_id) or {}
+            data.update(fields)
+            for field, amount in (increments or {}).items():
+                data[field] = data.get(field, 0) + amount
+            self._put(collection, doc_id, data)
+            self._end_write()
+
+    def create(self, collection: str, doc_id: str, data: dict) -> bool:
+        with self._lock:
+            self._begin_write()
+            created = self._conn.execute(
+                "INSERT OR IGNORE INTO documents (collection, doc_id, data) VALUES (?, ?, ?)",
+                (collection, doc_id, _encode(data))).rowcount == 1
+            self._end_write()
+            return created
+
+    def get_all(self, collection: str) -> dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, data FROM documents WHERE collection = ?", (collection,)).fetchall()
+        return {doc_id: json.loads(data) for doc_id, data in rows}
+
+    def set_many(self, writes: list[tuple[str, str, dict]]):
+        with self._lock:
+            self._begin_write()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (collection, doc_id, data) VALUES (?, ?, ?)",
+                [(collection, doc_id, _encode(data)) for collection, doc_id, data in writes])
+            self._end_write(len(writes))
+
+    # --- Chat history ---
+    @staticmethod
+    def _message_row(channel_id: str, doc: dict) -> tuple:
+        date = doc["date"]
+        return (channel_id, doc["message_id"], doc["text"], doc.get("sender_id"), doc.get("platform"),
+                date.timestamp() if isinstance(date, datetime) else float(date or time.time()))
+
+    def save_message(self, channel_id: str, doc: dict):
+        with track_provider_call("sqlite", "save_message"), self._lock:
+            self._begin_write()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO messages (channel_id, message_id, text, sender_id, platform, date) VALUES (?, ?, ?, ?, ?, ?)",
+                self._message_row(channel_id, doc))
+            self._end_write()
+
+    def save_messages(self, channel_id: str, docs: list[dict]):
+        with track_provider_call("sqlite", "save_messages"), self._lock:
+            self._begin_write()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages (channel_id, message_id, text, sender_id, platform, date) VALUES (?, ?, ?, ?, ?, ?)",
+                [self._message_row(channel_id, doc) for doc in docs])
+            self._end_write(len(docs))
+
+    def latest_messages(self, channel_id: str, n: int, operation: str = "history_read") -> list[dict]:
+        with track_provider_call("sqlite", operation), self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id, text, sender_id, platform, date FROM messages "
+                "WHERE channel_id = ? ORDER BY date DESC LIMIT ?", (channel_id, n)).fetchall()
+        return [
+            {"message_id": message_id, "text": text, "sender_id": sender_id, "platform": platform, "ts": date}
+            for message_id, text, sender_id, platform, date in rows
+        ]
@@ -0,0 +1,152 @@
+# src/services/structured_logging.py
+"""
+Non-blocking, structured logging for the whole bot.
+
+Every record is pushed onto an in-memory queue by a QueueHandler and written to
+stdout by a QueueListener thread, so the event loop never waits on terminal or
+pipe I/O. Records carry the id of the message (or job) being processed, which
+is stored in a context variable and therefore follows the work across awaits
+and into tasks spawned from it.
+"""
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+from config.settings import APP_CONFIG
+
+_request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+_listener: logging.handlers.QueueListener | None = None
+
+
+# --- Request ids ---
+def get_request_id() -> str:
+    return _request_id.get()
+
+
+def set_request_id(request_id: str) -> contextvars.Token:
+    """Tags all following log records in the current task with `request_id`."""
+    return _request_id.set(str(request_id))
+
+
+@contextmanager
+def request_id_scope(request_id: str):
+    token = _request_id.set(str(request_id))
+    try:
+        yield
+    finally:
+        _request_id.reset(token)
+
+
+# --- Payload helpers ---
+def truncate(value, limit: int | None = None) -> str:
+    """Shortens large payloads to `limit` characters (LOG_MAX_PAYLOAD_CHARS by default)."""
+    text = value if isinstance(value, str) else str(value)
+    limit = APP_CONFIG.get("log_max_payload_chars", 300) if limit is None else limit
+    if limit and len(text) > limit:
+        return f"{text[:limit]}...(+{len(text) - limit} chars)"
+    return text
+
+
+def log_payload(logger: logging.Logger, label: str, payload):
+    """
+    Dumps a prompt, memory context or message history. Dumps are opt-in
+    (LOG_PROMPTS=1), emitted at DEBUG, sampled by LOG_PAYLOAD_SAMPLE_RATE and
+    truncated, so by default this costs a single boolean check.
+    """
+    if not APP_CONFIG.get("log_prompts") or not logger.isEnabledFor(logging.DEBUG):
+        return
+    sample_rate = APP_CONFIG.get("log_payload_sample_rate", 1.0)
+    if sample_rate < 1.0 and random.random() > sample_rate:
+        return
+    logger.debug("%s: %s", label, truncate(payload))
+
+
+# --- Formatting ---
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """Renders records as `key=value` text or as one JSON object per line."""
+    def __init__(self, fmt: str = "text"):
+        super().__init__()
+        self.json_output = fmt == "json"
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = truncate(record.getMessage(), APP_CONFIG.get("log_max_message_chars", 2000))
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z"
+        request_id = getattr(record, "request_id", "-")
+        if self.json_output:
+            entry = {
+                "ts": timestamp,
+                "level": record.levelname,
+                "logger": record.name,
+                "request_id": request_id,
+                "msg": message,
+            }
+            if record.exc_text:
+                entry["exc"] = record.exc_text
+            return json.dumps(entry, ensure_ascii=False)
+
+        line = f"{timestamp} {record.levelname:<7} {record.name} req={request_id} {message}"
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Stamps the request id in the caller's context and enqueues the record.
+    Only %-interpolation runs in the caller (so later mutation of the arguments
+    cannot change the message); line formatting and I/O run on the listener thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            # Tracebacks hold live frames; render them now and drop the references.
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Installs the queue-based handler on the root logger. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(StructuredFormatter(APP_CONFIG.get("log_format", "text")))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(APP_CONFIG.get("log_level", "INFO"))
+    # Third-party clients are chatty at INFO; keep them at WARNING unless debugging.
+    for noisy in ("telethon", "discord", "slack_bolt", "slack_sdk", "aiohttp.access", "httpx", "urllib3"):
+        logging.getLogger(noisy).setLevel(max(root.level, logging.WARNING))
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,162 @@
+# src/services/tracing.py
+"""
+Per-message lifecycle traces.
+
+Every InternalMessage gets a trace id and the monotonic time it was received.
+The brain and the senders make that id the current trace (a context variable,
+like the log request id), and reply payloads carry it to the senders together
+with the time they were queued. Inside a trace, every `track_stage` block and
+provider call becomes a span, as do the waits in the brain and sender queues,
+so triage, memory, persona matching, generation, humanizing, queueing, the
+send delay and delivery of one message line up on one timeline.
+
+Spans are written in the Chrome trace event format (a JSON array of complete
+"X" events) to TRACE_DIR/trace-<node id>.json, which chrome://tracing and
+Perfetto open as is. Each trace gets its own track, named after its request
+id. Recording a span is a list append; trace_writer_worker appends the buffered
+events to the file every TRACE_FLUSH_INTERVAL_SECS. TRACE_SAMPLE_RATE traces a
+share of the messages, and the file is rotated at TRACE_MAX_FILE_MB, keeping
+one previous file.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from itertools import count
+
+from config.settings import APP_CONFIG
+from src.services.structured_logging import get_request_id
+
+logger = logging.getLogger(__name__)
+
+# Tracks named in the current file, kept for this many traces.
+MAX_NAMED_TRACKS = 10000
+
+# (trace id, whether spans are recorded for it)
+_trace: contextvars.ContextVar[tuple[str, bool] | None] = contextvars.ContextVar("trace", default=None)
+_events: list[dict] = []
+_tracks: OrderedDict[str, int] = OrderedDict()
+_track_ids = count(1)
+_pid = os.getpid()
+# Set while trace_writer_worker runs; without a writer nothing is buffered.
+_recording = False
+
+
+def new_trace_id() -> str:
+    return os.urandom(8).hex()
+
+
+def _sampled(trace_id: str) -> bool:
+    rate = APP_CONFIG.get("trace_sample_rate", 1.0)
+    if rate >= 1:
+        return True
+    try:
+        # Decided by the id, so every stage of a trace agrees without sharing state.
+        return int(trace_id[:8], 16) < rate * 0x100000000
+    except ValueError:
+        return False
+
+
+def set_trace(trace_id: str | None) -> contextvars.Token:
+    """Makes `trace_id` the current trace of this task; following spans belong to it."""
+    if not trace_id:
+        return _trace.set(None)
+    return _trace.set((trace_id, _recording and _sampled(trace_id)))
+
+
+def current_trace_id() -> str | None:
+    current = _trace.get()
+    return current[0] if current else None
+
+
+def _track(trace_id: str) -> int:
+    track = _tracks.get(trace_id)
+    if track is None:
+        track = _tracks[trace_id] = next(_track_ids)
+        _events.append({"name": "thread_name", "ph": "M", "pid": _pid, "tid": track,
+                        "args": {"name": f"{get_request_id()} {trace_id}"}})
+        if len(_tracks) > MAX_NAMED_TRACKS:
+            _tracks.popitem(last=False)
+    return track
+
+
+def record_span(name: str, category: str, start: float, end: float, args: dict | None = None):
+    """Records [start, end] (time.perf_counter values) as a span of the current trace, if it is recorded."""
+    current = _trace.get()
+    if not current or not current[1]:
+        return
+    trace_id = current[0]
+    _events.append({"name": name, "cat": category, "ph": "X", "pid": _pid, "tid": _track(trace_id),
+                    "ts": round(start * 1e6), "dur": round((end - start) * 1e6),
+                    "args": {"trace_id": trace_id, **args} if args else {"trace_id": trace_id}})
+
+
+def record_wait(name: str, since: float | None):
+    """Records the time since `since` (e.g. when an item was queued) as a span of the current trace."""
+    if not since:
+        return
+    now = time.perf_counter()
+    # A stamp from another host can't be compared with our clock.
+    if 0 <= now - since:
+        record_span(name, "queue", since, now)
+
+
+def tag_payload(payload: dict) -> dict:
+    """Adds the current trace id and the queueing time to a sender payload."""
+    trace_id = current_trace_id()
+    if trace_id:
+        payload["trace_id"] = trace_id
+        payload["queued_at"] = time.perf_counter()
+    return payload
+
+
+# --- Writer ---
+def _write(events: list[dict], path: str, max_bytes: int) -> bool:
+    """Appends `events` to the trace file. Returns whether the file was rotated first."""
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    rotated = size >= max_bytes
+    if rotated:
+        os.replace(path, path[:-len(".json")] + ".prev.json")
+        size = 0
+    with open(path, 'a', encoding='utf-8') as f:
+        if not size:
+            f.write("[\n")
+        # Viewers accept the array without its closing bracket, so it can grow by appends.
+        f.write("".join(json.dumps(event, separators=(",", ":")) + ",\n" for event in events))
+    return rotated
+
+
+async def trace_writer_worker():
+    """Appends recorded spans to the trace file every TRACE_FLUSH_INTERVAL_SECS."""
+    global _recording, _events
+    logger.info("Worker started.")
+    directory = APP_CONFIG.get("trace_dir") or os.path.join(APP_CONFIG.get("data_dir", "data"), "traces")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"trace-{APP_CONFIG.get('node_id', 'local')}.json")
+    max_bytes = APP_CONFIG.get("trace_max_file_mb", 50) * 1024 * 1024
+    interval = APP_CONFIG.get("trace_flush_interval_secs", 1.0)
+    logger.info("Writing message traces to %s", path)
+    _recording = True
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            if not _events:
+                continue
+            events, _events = _events, []
+            try:
+                if await asyncio.to_thread(_write, events, path, max_bytes):
+                    # Track names live in the old file now.
+                    _tracks.clear()
+            except OSError as e:
+                logger.error("Could not write %s trace events: %s", len(events), e)
+    finally:
+        _recording = False
+        if _events:
+            events, _events = _events, []
+            try:
+                _write(events, path, max_bytes)
+            except OSError as e:
+                logger.error("Could not write %s trace events: %s", len(events), e)
@@ -0,0 +1,207 @@
+# src/services/usage.py
+"""
+Token and cost accounting with budget enforcement.
+
+The provider clients hand the `usage` block of every OpenAI and Grok response
+to `usage_ledger.record`, which prices it and adds it to:
+
+- bot_llm_tokens_total{provider, model, stage, kind} and
+  bot_llm_cost_usd_total{provider, model, stage, persona, channel}. The stage is
+  the innermost `track_stage` block around the call; the persona and channel
+  are set by the pipeline with `set_usage_channel` / `set_usage_persona`.
+- the spend of the current hour and UTC day, checked against
+  USAGE_HOURLY_BUDGET_USD and USAGE_DAILY_BUDGET_USD (0 = no budget).
+
+Once either window has used USAGE_ECONOMY_AT of its budget the pipeline runs in
+economy mode: OpenAI chat calls use ECONOMY_MODEL when it is cheaper, replies
+are sent without the humanizing pass, and channel summary updates wait. When a
+budget is exhausted, incoming messages are stored but not answered, and
+initiations and link posts are skipped, until the window rolls over.
+
+Prices are USD per million tokens (prompt, completion), matched by the longest
+model name prefix; USAGE_PRICES (JSON, same shape) overrides or extends them.
+Spend is saved in the core bot state so a restart doesn't reset the budgets.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+
+from config.settings import APP_CONFIG
+from src.services.metrics import Counter, Gauge, current_stage
+
+logger = logging.getLogger(__name__)
+
+LLM_TOKENS = Counter(
+    "bot_llm_tokens_total",
+    "Provider tokens used, by stage and kind (prompt, completion).",
+    ("provider", "model", "stage", "kind"))
+LLM_COST = Counter(
+    "bot_llm_cost_usd_total",
+    "Estimated provider spend in USD.",
+    ("provider", "model", "stage", "persona", "channel"))
+LLM_SPEND = Gauge(
+    "bot_llm_spend_usd",
+    "Estimated spend in the current budget window (hour, day).",
+    ("window",))
+BUDGET_LEVEL = Gauge(
+    "bot_budget_level",
+    "0 = normal, 1 = economy mode, 2 = budget exhausted.")
+
+# USD per million (prompt, completion) tokens.
+MODEL_PRICES = {
+    "gpt-4": (30.0, 60.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1-nano": (0.1, 0.4),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "grok-3": (3.0, 15.0),
+    "grok-3-mini": (0.3, 0.5),
+    "grok-4": (3.0, 15.0),
+}
+# Grok live search is billed per source used.
+SEARCH_SOURCE_PRICE = 0.025
+
+NORMAL, ECONOMY, EXHAUSTED = 0, 1, 2
+LEVEL_NAMES = ("normal", "economy", "exhausted")
+
+# (channel, persona) the current task's spend is charged to
+_labels: contextvars.ContextVar[tuple[str, str]] = contextvars.ContextVar("usage_labels", default=("-", "-"))
+
+
+def set_usage_channel(channel: str):
+    """Charges the current task's spend to `channel` (and no persona, until one is chosen)."""
+    _labels.set((channel, "-"))
+
+
+def set_usage_persona(persona: str):
+    _labels.set((_labels.get()[0], persona))
+
+
+class UsageLedger:
+    """Prices provider usage and tracks spend per budget window. All methods run on the event loop thread."""
+    def __init__(self, hourly_budget: float | None = None, daily_budget: float | None = None,
+                 economy_at: float | None = None, prices: dict | None = None):
+        self.hourly_budget = APP_CONFIG.get("usage_hourly_budget_usd", 0.0) if hourly_budget is None else hourly_budget
+        self.daily_budget = APP_CONFIG.get("usage_daily_budget_usd", 0.0) if daily_budget is None else daily_budget
+        self.economy_at = APP_CONFIG.get("usage_economy_at", 0.8) if economy_at is None else economy_at
+        self.prices = {**MODEL_PRICES, **(APP_CONFIG.get("usage_prices", {}) if prices is None else prices)}
+        self._hour, self._hour_spent = 0, 0.0
+        self._day, self._day_spent = 0, 0.0
+        self._level = NORMAL
+        self._unpriced: set[str] = set()
+        LLM_SPEND.labels("hour").set_function(lambda: self.spent()[0])
+        LLM_SPEND.labels("day").set_function(lambda: self.spent()[1])
+        BUDGET_LEVEL.labels().set_function(self.level)
+
+    def price(self, model: str) -> tuple[float, float] | None:
+        matches = [name for name in self.prices if model == name or model.startswith(name + "-")]
+        return self.prices[max(matches, key=len)] if matches else None
+
+    def _roll(self, now: float):
+        hour, day = int(now // 3600), int(now // 86400)
+        if hour != self._hour:
+            self._hour, self._hour_spent = hour, 0.0
+        if day != self._day:
+            self._day, self._day_spent = day, 0.0
+
+    def spent(self, now: float | None = None) -> tuple[float, float]:
+        """Spend so far in the current hour and UTC day."""
+        self._roll(time.time() if now is None else now)
+        return self._hour_spent, self._day_spent
+
+    def level(self, now: float | None = None) -> int:
+        hour_spent, day_spent = self.spent(now)
+        used = max(hour_spent / self.hourly_budget if self.hourly_budget else 0.0,
+                   day_spent / self.daily_budget if self.daily_budget else 0.0)
+        level = EXHAUSTED if used >= 1.0 else ECONOMY if used >= self.economy_at else NORMAL
+        if level != self._level:
+            log = logger.warning if level > self._level else logger.info
+            log("Usage budget level is now '%s' (hour $%.2f, day $%.2f).", LEVEL_NAMES[level], hour_spent, day_spent)
+            self._level = level
+        return level
+
+    def economy(self) -> bool:
+        return self.level() >= ECONOMY
+
+    def exhausted(self) -> bool:
+        return self.level() >= EXHAUSTED
+
+    def choose_model(self, model: str) -> str:
+        """The model to call instead of `model` at the current budget level."""
+        economy_model = APP_CONFIG.get("economy_model", "gpt-4o-mini")
+        if model == economy_model or not self.economy():
+            return model
+        price, economy_price = self.price(model), self.price(economy_model)
+        if price and economy_price and sum(economy_price) < sum(price):
+            return economy_model
+        return model
+
+    def record(self, provider: str, model: str, usage: dict | None, price_factor: float = 1.0) -> float:
+        """
+        Prices one response's `usage` block and charges it to the current stage, persona and channel.
+        `price_factor` scales the token price (e.g. 0.5 for Batch API results).
+        """
+        if not usage:
+            return 0.0
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        sources = usage.get("num_sources_used") or 0
+        stage = current_stage()
+        LLM_TOKENS.labels(provider, model, stage, "prompt").inc(prompt_tokens)
+        if completion_tokens:
+            LLM_TOKENS.labels(provider, model, stage, "completion").inc(completion_tokens)
+
+        price = self.price(model)
+        if price is None:
+            if model not in self._unpriced:
+                self._unpriced.add(model)
+                logger.warning("No price known for model '%s'; its usage counts as free. Set USAGE_PRICES.", model)
+            price = (0.0, 0.0)
+        cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000 * price_factor + sources * SEARCH_SOURCE_PRICE
+        channel, persona = _labels.get()
+        LLM_COST.labels(provider, model, stage, persona, channel).inc(cost)
+        self._roll(time.time())
+        self._hour_spent += cost
+        self._day_spent += cost
+        return cost
+
+    # --- Persistence ---
+    def snapshot(self) -> dict:
+        self._roll(time.time())
+        return {"hour": self._hour, "hour_spent": self._hour_spent, "day": self._day, "day_spent": self._day_spent}
+
+    def restore(self, snapshot: dict):
+        self._roll(time.time())
+        if snapshot.get("hour") == self._hour:
+            self._hour_spent += snapshot.get("hour_spent", 0.0)
+        if snapshot.get("day") == self._day:
+            self._day_spent += snapshot.get("day_spent", 0.0)
+
+
+usage_ledger = UsageLedger()
+
+
+async def usage_worker(state_manager):
+    """Restores the budget windows' spend on startup and saves it every USAGE_PERSIST_INTERVAL_SECS."""
+    logger.info("Worker started.")
+    state = await asyncio.to_thread(state_manager.load_bot_state)
+    usage_ledger.restore(state.get("usage_ledger") or {})
+    hour_spent, day_spent = usage_ledger.spent()
+    logger.info("Spend so far: $%.2f this hour, $%.2f today.", hour_spent, day_spent)
+    interval = APP_CONFIG.get("usage_persist_interval_secs", 60)
+    last_saved = None
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            snapshot = usage_ledger.snapshot()
+            if snapshot != last_saved:
+                await asyncio.to_thread(state_manager.update_bot_state, usage_ledger=snapshot)
+                last_saved = snapshot
+    finally:
+        state_manager.update_bot_state(usage_ledger=usage_ledger.snapshot())
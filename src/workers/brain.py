@@ -1,4 +1,5 @@
 # src/workers/brain.py
+import logging
 import asyncio
 import time
 import random
@@ -8,41 +9,84 @@ from src.services.state_manager import StateManager
 from src.core_logic.llm_personas import PersonaManager
 from src.core_logic.response_logic import handle_reaction, handle_initiation, handle_realtime_query
 from src.services.fetch_db import save_message_to_db
-from src.services.openai_chat import get_llm_response
+from src.services.openai_chat import get_llm_completion
 from src.core_logic.internal_message import InternalMessage
+from src.core_logic.channel_registry import channel_key, channel_registry
+from src.core_logic.channel_summary import channel_summarizer
+from src.core_logic.inactivity import InactivityTracker
+from src.services.metrics import MESSAGES_TOTAL, STAGE_DURATION, track_stage
+from src.services.sharding import owns_channel
+from src.services.structured_logging import set_request_id
+from src.services.tracing import new_trace_id, record_span, record_wait, set_trace
+from src.services.usage import set_usage_channel, usage_ledger
 
-async def brain_worker(brain_queue: Queue, sender_queues: dict[str, Queue], persona_manager: PersonaManager, state_manager: StateManager, db):    
+logger = logging.getLogger(__name__)
+
+async def brain_worker(brain_queue: Queue, sender_queues: dict[str, Queue], persona_manager: PersonaManager, state_manager: StateManager, db,
+                       inactivity: InactivityTracker | None = None):
     """
     The central processing worker. It consumes from a single brain_queue and
-    routes responses to the appropriate sender_queues.
+    routes responses to the appropriate sender_queues. `inactivity` may be
+    shared with the deferred generation worker, which prepares initiations.
     """
-    print("[BRAIN] Worker started.")
-    bot_state = state_manager.load_bot_state()
+    logger.info("Worker started.")
+    # Last activity per "platform:channel_id", for per-channel inactivity initiation.
+    inactivity = inactivity or InactivityTracker(state_manager)
     
     while True:
+        message = None
         try:
-            # 1. Get a standardized message from the single brain queue
-            message: InternalMessage = await asyncio.wait_for(brain_queue.get(), timeout=1.0)
+            # 1. Get a standardized message from the single brain queue, waiting no longer than the next idle deadline
+            inactivity.persist()
+            if not brain_queue.empty():
+                # Waiting messages come before due initiations: with a channel already due the timeout is 0,
+                # and wait_for then times out even when the queue holds messages.
+                message: InternalMessage = brain_queue.get_nowait()
+            else:
+                message: InternalMessage = await asyncio.wait_for(brain_queue.get(), timeout=inactivity.seconds_until_next())
+            message_started = time.perf_counter()
+            set_request_id(f"{message.platform}:{message.message_id}")
+            set_trace(message.trace_id)
+            # Not received_at: a message replayed from the journal carries the previous process's perf_counter.
+            record_wait("queue.brain", message_started - (time.time() - message.received_time))
+            set_usage_channel(channel_key(message.platform, message.channel_id))
 
             # 2. Check if the message has already been processed
-            if state_manager.has_processed(message.message_id):
-                print(f"[BRAIN] Message ID {message.message_id} already processed. Skipping.")
+            with track_stage("brain", "dedupe_check"):
+                if APP_CONFIG.get("sharding_enabled"):
+                    # Several nodes may see the message (or a forwarded copy); only the first claim wins.
+                    already_processed = not state_manager.claim_message(message.dedupe_key)
+                else:
+                    already_processed = state_manager.has_processed(message.dedupe_key)
+            if already_processed:
+                logger.info("Message ID %s already processed. Skipping.", message.message_id)
+                MESSAGES_TOTAL.labels("brain", "duplicate").inc()
                 brain_queue.task_done()
                 continue
             
             # 3. Save the new message to the database
-            save_message_to_db(message.channel_id, message, db)
+            with track_stage("brain", "save_message"):
+                save_message_to_db(message.channel_id, message, db)
+            channel_summarizer.note_message(message, state_manager)
 
             # 4. Check if the message is from a known bot to prevent loops
             # add Slack Bot's User ID to KNOWN_BOT_IDS in .env
             known_bot_ids_str = [str(bid) for bid in APP_CONFIG.get('known_bot_ids', [])]
             if message.sender_id in known_bot_ids_str:
-                print(f"[BRAIN] Ignoring message from known bot ID: {message.sender_id}")
-                state_manager.log_processed(message.message_id)
+                logger.info("Ignoring message from known bot ID: %s", message.sender_id)
+                state_manager.log_processed(message.dedupe_key)
+                MESSAGES_TOTAL.labels("brain", "known_bot").inc()
+                brain_queue.task_done()
+                continue
+            if usage_ledger.exhausted():
+                # Stored and summarized like any message, but not worth a paid reply until the budget window rolls over.
+                logger.info("Usage budget exhausted. Not replying to message %s.", message.message_id)
+                state_manager.log_processed(message.dedupe_key)
+                MESSAGES_TOTAL.labels("brain", "over_budget").inc()
                 brain_queue.task_done()
                 continue
             # --- STAGE 1: TRIAGE ---
-            print(f"[BRAIN] Triage: Analyzing message ID {message.message_id}...")
+            logger.info("Triage: Analyzing message ID %s...", message.message_id)
             triage_prompt = f"""Prompt Structure:
 ROLE: "You are a hyper-efficient routing agent. Your only job is to classify an incoming user message into one of two categories: REALTIME_FACTS or PERSONA_OPINION."
 CATEGORY DEFINITIONS:
@@ -62,63 +106,102 @@ THE DECISION RULE: "If the user is asking for an objective, verifiable fact that
 THE TASK: "Classify the following user message. Respond with ONLY the single word REALTIME_FACTS or PERSONA_OPINION and nothing else."
 USER MESSAGE: {message.text}"
 """
-            decision = await get_llm_response(triage_prompt, model=APP_CONFIG['triage_model'], max_tokens=5)
-            print(f"[BRAIN] Triage decision: '{decision}' for message from {message.platform}")
+            with track_stage("brain", "triage"):
+                triage = await get_llm_completion(triage_prompt, model=APP_CONFIG['triage_model'], max_tokens=5, logprobs=True)
+            decision = triage.get("text") or triage.get("error", "")
+            # How sure triage was of its first token; the model cascade starts unsure messages on a stronger model.
+            triage_confidence = triage.get("confidence")
+            logger.info("Triage decision: '%s' for message from %s (confidence %s)", decision, message.platform,
+                        f"{triage_confidence:.2f}" if triage_confidence is not None else "n/a")
 
             if "REALTIME_FACTS" in decision:
-                print(f"[BRAIN] Routing to handle_realtime_query for message {message.message_id}.")
-                await handle_realtime_query(message, sender_queues, persona_manager, db) 
+                logger.info("Routing to handle_realtime_query for message %s.", message.message_id)
+                outcome = "realtime"
+                with track_stage("brain", "realtime_query"):
+                    await handle_realtime_query(message, sender_queues, persona_manager, db)
             else:
-                response_rate = APP_CONFIG.get("random_response_rate", 1.0)
+                channel = channel_registry.get(message.platform, message.channel_id)
+                response_rate = channel.response_rate if channel else APP_CONFIG.get("random_response_rate", 1.0)
                 if random.random() > response_rate:
-                    print(f"[BRAIN] Probability gate: Skipped reply for message {message.message_id} (roll > {response_rate}).")
+                    outcome = "skipped"
+                    logger.info("Probability gate: Skipped reply for message %s (roll > %s).", message.message_id, response_rate)
                     # We do NOT call task_done() or log_processed() here.
                     # We simply do nothing and let the code proceed to the finalization step below.
                 else:
                     # If we pass the gate, we proceed with generating a reaction.
-                    print(f"[BRAIN] Probability gate: Proceeding with reply for message {message.message_id} (roll <= {response_rate}).")
+                    logger.info("Probability gate: Proceeding with reply for message %s (roll <= %s).", message.message_id, response_rate)
                     
                     # CORRECT: Pass the 'sender_queues' dictionary
-                    await handle_reaction(message, sender_queues, persona_manager, state_manager, db)
+                    outcome = "reaction"
+                    with track_stage("brain", "reaction"):
+                        await handle_reaction(message, sender_queues, persona_manager, state_manager, db, triage_confidence)
 
             # --- 7. Finalize processing for this message (runs for every message) ---
             # This ensures every message is marked as processed and we don't get stuck.
             
-            print(f"[BRAIN] Finalizing processing for message {message.message_id}.")
-            
-            # Log the message ID to prevent reprocessing
-            state_manager.log_processed(message.message_id)
+            logger.info("Finalizing processing for message %s.", message.message_id)
             
-            # Update the bot's last activity time
-            bot_state["last_activity_time"] = time.time()
-            state_manager.save_bot_state(bot_state)
+            with track_stage("brain", "finalize"):
+                # Log the message to prevent reprocessing
+                state_manager.log_processed(message.dedupe_key)
+                
+                # Update the channel's last activity time (persisted lazily)
+                inactivity.touch(channel_key(message.platform, message.channel_id))
             
-            # Signal to the queue that this item is finished
+            MESSAGES_TOTAL.labels("brain", outcome).inc()
+            message_finished = time.perf_counter()
+            STAGE_DURATION.labels("brain", "total").observe(message_finished - message_started)
+            record_span("brain.total", "brain", message_started, message_finished, {"outcome": outcome})
+            # Signal to the queue that this item is finished (and can leave the journal)
             brain_queue.task_done()
 
 
         except asyncio.TimeoutError:
+            if message is not None:
+                # A timeout while handling the message, not an idle wait.
+                logger.error("Timed out while handling message %s.", message.message_id)
+                MESSAGES_TOTAL.labels("brain", "error").inc()
+                brain_queue.task_done()
+                continue
             now = time.time()
-            last_activity = bot_state.get('last_activity_time', 0)
-            inactivity_period_hours = (now - last_activity) / 3600
+            channel = inactivity.pop_due(now)
+            if channel is None:
+                continue
+            if not owns_channel(channel.platform, channel.channel_id):
+                # Check again once leases may have moved.
+                inactivity.defer(channel.key, APP_CONFIG.get("shard_renew_interval_secs", 10), now)
+                continue
 
-            if inactivity_period_hours > APP_CONFIG['min_initiate_hours']:
-                print(f"[BRAIN] Inactivity of {inactivity_period_hours:.2f} hours detected. Initiating topic.")
-                
-                # Defaulting to initiate in Telegram, but this could be made smarter
-                telegram_channel_id = str(APP_CONFIG['telegram_group_id'])
+            last_activity = inactivity.last_activity(channel.key) or 0
+            logger.info("Inactivity of %.2f hours detected in %s. Initiating topic.", (now - last_activity) / 3600, channel.key)
+            MESSAGES_TOTAL.labels("brain", "initiation").inc()
+            set_request_id(f"initiation:{channel.key}:{int(now)}")
+            set_trace(new_trace_id())
+            set_usage_channel(channel.key)
+            with track_stage("brain", "initiation"):
                 await handle_initiation(
-                    'telegram', 
-                    telegram_channel_id, 
-                    sender_queues, 
-                    persona_manager, 
-                    state_manager, 
+                    channel.platform,
+                    channel.channel_id,
+                    sender_queues,
+                    persona_manager,
+                    state_manager,
                     db
                 )
-                
-                bot_state["last_activity_time"] = now
-                state_manager.save_bot_state(bot_state)
+
+            # Start the channel's idle clock again. At most one initiation per pass: the next quiet channel
+            # fires on the next wait, after any messages that arrived meanwhile.
+            inactivity.touch(channel.key)
+            inactivity.persist(force=True)
+            state_manager.update_bot_state(last_activity_time=time.time())
+
+        except asyncio.CancelledError:
+            inactivity.persist(force=True)
+            raise
 
         except Exception as e:
-            print(f"CRITICAL ERROR in Brain Worker: {e}")
+            logger.critical("Unhandled error in brain worker: %s", e)
+            MESSAGES_TOTAL.labels("brain", "error").inc()
+            if message is not None:
+                # Not logged as processed, but done: a retry would most likely fail the same way.
+                brain_queue.task_done()
             await asyncio.sleep(10)
\ No newline at end of file
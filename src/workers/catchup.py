@@ -0,0 +1,102 @@
+# src/workers/catchup.py
+"""
+Catch-up ingestion after downtime.
+
+The listeners only see messages that arrive while the bot is connected, so
+anything sent during a restart never reached the history or the channel
+summaries. On startup this worker pages through each channel's platform
+history from its cursor (the newest message already stored) up to the moment
+the listeners came up. It writes the messages to the history with batched
+writes and marks them as processed, so they never trigger a reply, even if a
+platform redelivers one later.
+
+Cursors are read before the brain starts storing live messages; otherwise the
+first live message would hide the gap. Telegram and Discord page from the
+cursor's message id. Slack ids aren't ordered, so Slack pages from its time
+minus a small overlap; messages already stored are skipped.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from config.settings import APP_CONFIG
+from src.core_logic.channel_registry import ChannelConfig, channel_registry
+from src.core_logic.channel_summary import channel_summarizer
+from src.services.fetch_db import save_messages_to_db
+from src.services.metrics import Counter
+from src.services.sharding import owns_channel
+from src.services.state_manager import StateManager
+from src.services.storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+CATCHUP_MESSAGES = Counter(
+    "bot_catchup_messages_total",
+    "Messages ingested from platform history after downtime.",
+    ("platform",))
+
+
+def load_cursors(db: StorageBackend) -> dict[str, list[dict]]:
+    """The newest stored messages of every configured channel (newest first), the first being its cursor."""
+    cursors = {}
+    for channel in channel_registry.all():
+        try:
+            cursors[channel.key] = db.latest_messages(channel.channel_id, APP_CONFIG.get("history_tail_size", 120), "catchup_cursor")
+        except Exception as e:
+            logger.error("Could not read the catch-up cursor of %s: %s", channel.key, e)
+            cursors[channel.key] = []
+    return cursors
+
+
+async def _catch_up_channel(channel: ChannelConfig, fetch: Callable, client, stored: list[dict], until: datetime,
+                            skip_keys: set[str], state_manager: StateManager, db: StorageBackend) -> int:
+    since = until - timedelta(hours=APP_CONFIG.get("catchup_max_age_hours", 24))
+    cursor = stored[0] if stored else None
+    known = {str(entry["message_id"]) for entry in stored}
+
+    started = time.perf_counter()
+    missed = []
+    async for message, sent_at in fetch(client, channel.channel_id, cursor, since, until, APP_CONFIG.get("catchup_max_messages", 500)):
+        if message.message_id not in known and message.dedupe_key not in skip_keys:
+            missed.append((message, sent_at))
+    missed.reverse()
+
+    batch_size = APP_CONFIG.get("catchup_batch_size", 100)
+    for start in range(0, len(missed), batch_size):
+        batch = missed[start:start + batch_size]
+        await asyncio.to_thread(save_messages_to_db, channel.channel_id, batch, db)
+        await asyncio.to_thread(state_manager.log_processed_many, [message.dedupe_key for message, _ in batch])
+        for message, sent_at in batch:
+            channel_summarizer.note_message(message, state_manager, sent_at.timestamp())
+        CATCHUP_MESSAGES.labels(channel.platform).inc(len(batch))
+        done = start + len(batch)
+        logger.info("Caught up %s/%s messages in %s (%.1f msg/s).", done, len(missed), channel.key, done / max(time.perf_counter() - started, 1e-6))
+    return len(missed)
+
+
+async def catchup_worker(fetchers: dict[str, tuple[Callable, object]], cursors: dict[str, list[dict]], until: datetime,
+                         skip_keys: set[str], state_manager: StateManager, db: StorageBackend):
+    """
+    Ingests what each channel missed while the bot was down, one channel at a time.
+    `fetchers` maps a platform to its history fetcher and client; `skip_keys` are
+    the dedupe keys of messages already queued for the brain (e.g. replayed from the journal).
+    """
+    logger.info("Worker started.")
+    if APP_CONFIG.get("sharding_enabled"):
+        # Let the first lease rebalance settle which channels are ours.
+        await asyncio.sleep(APP_CONFIG.get("shard_renew_interval_secs", 10))
+
+    started = time.perf_counter()
+    total = 0
+    for channel in channel_registry.all():
+        if channel.platform not in fetchers or not owns_channel(channel.platform, channel.channel_id):
+            continue
+        fetch, client = fetchers[channel.platform]
+        try:
+            total += await _catch_up_channel(channel, fetch, client, cursors.get(channel.key, []), until, skip_keys, state_manager, db)
+        except Exception as e:
+            logger.error("Catch-up failed for %s: %s", channel.key, e)
+    elapsed = time.perf_counter() - started
+    logger.info("Catch-up finished: %s missed messages ingested in %.1fs (%.1f msg/s).", total, elapsed, total / max(elapsed, 1e-6))
@@ -0,0 +1,66 @@
+# src/workers/deferred.py
+"""
+Deferred generation worker.
+
+Every DEFERRED_SUBMIT_INTERVAL_SECS it requests the initiation of each channel
+whose idle deadline is less than DEFERRED_LEAD_SECS away (the scheduler does
+the same for link posts), then has the deferred generator submit what was
+requested and collect finished batches. The generator's state is saved after
+every change, so batches in flight survive a restart.
+
+Initiations are requested early only for channels that are already idle for a
+while; a channel that wakes up again just leaves an unused result behind,
+which expires after DEFERRED_MAX_AGE_SECS.
+"""
+import asyncio
+import logging
+import time
+
+from config.settings import APP_CONFIG
+from src.core_logic.inactivity import InactivityTracker
+from src.core_logic.response_logic import defer_initiation, initiation_key
+from src.services.deferred_generation import deferred_generator
+from src.services.metrics import track_stage
+from src.services.sharding import owns_channel
+from src.services.state_manager import StateManager
+from src.services.structured_logging import set_request_id
+from src.services.usage import set_usage_channel, usage_ledger
+
+logger = logging.getLogger(__name__)
+
+
+async def _request_initiations(inactivity: InactivityTracker, lead_secs: float, state_manager: StateManager, db):
+    for channel in inactivity.due_within(lead_secs, time.time()):
+        key = initiation_key(channel.platform, channel.channel_id)
+        if deferred_generator.known(key) or not owns_channel(channel.platform, channel.channel_id):
+            continue
+        set_request_id(f"deferred:{key}")
+        set_usage_channel(channel.key)
+        with track_stage("deferred", "initiation_prompt"):
+            if await defer_initiation(channel.platform, channel.channel_id, state_manager, db):
+                logger.info("Requested a deferred initiation for %s.", channel.key)
+
+
+async def deferred_generation_worker(state_manager: StateManager, db, inactivity: InactivityTracker | None = None):
+    """Submits and collects deferred generation batches. Without `inactivity`, only link posts are deferred."""
+    logger.info("Worker started.")
+    deferred_generator.load(await asyncio.to_thread(state_manager.get_deferred_generations))
+    deferred_generator.active = True
+    interval = APP_CONFIG.get("deferred_submit_interval_secs", 60)
+    lead_secs = APP_CONFIG.get("deferred_lead_secs", 1800)
+    try:
+        while True:
+            try:
+                if inactivity is not None and not usage_ledger.exhausted():
+                    await _request_initiations(inactivity, lead_secs, state_manager, db)
+                with track_stage("deferred", "batch"):
+                    changed = await deferred_generator.flush()
+                if changed:
+                    await asyncio.to_thread(state_manager.save_deferred_generations, deferred_generator.snapshot())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Error in deferred generation worker: %s", e)
+            await asyncio.sleep(interval)
+    finally:
+        deferred_generator.active = False
@@ -1,109 +1,236 @@
 # src/workers/scheduler.py
+import logging
 import asyncio
 import time
 import json
 import os
 import random
-from collections import deque
 from asyncio import Queue
 
 
 from config.settings import APP_CONFIG
 from src.services.state_manager import StateManager
 from src.core_logic.llm_personas import PersonaManager
-from src.core_logic.response_logic import handle_scheduled_link_post
+from src.core_logic.response_logic import defer_link_post, enqueue_link_post, link_post_key, prepare_link_post
+from src.services.deferred_generation import deferred_generator
+from src.services.metrics import MESSAGES_TOTAL, QUEUE_DEPTH, STAGE_DURATION, Histogram, track_stage
+from src.services.sharding import owns_channel
+from src.services.structured_logging import set_request_id
+from src.services.tracing import current_trace_id, new_trace_id, set_trace
+
+logger = logging.getLogger(__name__)
 
 LINKS_SCHEDULE_PATH = os.path.join('config', 'links.json')
+SCHEDULE_RELOAD_SECS = 60
+MIN_SLEEP_SECS = 1.0
+
+LINK_POST_DELAY = Histogram(
+    "bot_link_post_delay_seconds",
+    "How late a link post was queued relative to its planned slot.",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120))
+
+
+def _load_schedule() -> list[dict] | None:
+    try:
+        with open(LINKS_SCHEDULE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        logger.error("Could not load or parse links.json: %s. Retrying next cycle.", e)
+        return None
+
+
+def _due_time(link_info: dict, link_state: dict, jitters: dict[str, float]) -> float | None:
+    """When the link is next due to be posted, or None if its strategy is exhausted."""
+    link = link_info["link"]
+    strategy = link_info["posting_strategy"]
+    interval_secs = link_info["time_interval"] * 60
+    last_posted = link_state.get("last_post_time", 0)
+    post_count = link_state.get("post_count", 0)
+
+    # --- Advanced Strategy Logic ---
+    if strategy == "once":
+        return 0.0 if post_count == 0 else None
+    if isinstance(strategy, int):
+        if post_count >= strategy:
+            return None
+        return 0.0 if post_count == 0 else last_posted + interval_secs
+    if strategy == "recurrent":
+        # Apply "jitter" to the interval to make posts less predictable. It is drawn
+        # once per post so the due time (and the preparation ahead of it) stays put.
+        if link not in jitters:
+            jitter = interval_secs * 0.10
+            jitters[link] = interval_secs + random.uniform(-jitter, jitter)
+        return last_posted + jitters[link]
+    return None
+
+
+def _defer_pending(deferred: dict[str, tuple[asyncio.Task, str]], link: str, post_count: int) -> bool:
+    """Whether the link's next post still has to be requested from the deferred generator."""
+    return deferred_generator.active and (link not in deferred or deferred[link][1] != link_post_key(link, post_count))
+
+
+async def _defer(link_info: dict, post_count: int, persona_manager: PersonaManager, db):
+    set_request_id(f"link:{link_info.get('link')}")
+    try:
+        with track_stage("scheduler", "link_defer"):
+            if await defer_link_post(link_info, post_count, persona_manager, db):
+                logger.info("Requested a deferred post for link '%s'.", link_info["link"])
+    except Exception as e:
+        logger.error("Could not request a deferred post for link '%s': %s", link_info.get("link"), e)
+
+
+async def _prepare(link_info: dict, persona_manager: PersonaManager, db, post_count: int) -> tuple[dict | None, float]:
+    set_request_id(f"link:{link_info.get('link')}")
+    set_trace(new_trace_id())
+    with track_stage("scheduler", "link_prepare"):
+        payload = await prepare_link_post(link_info, persona_manager, db, deferred_key=link_post_key(link_info["link"], post_count))
+    if payload:
+        # The post continues this trace when its slot comes.
+        payload["trace_id"] = current_trace_id()
+    return payload, time.time()
+
 
 async def scheduler_worker(sender_queues: dict[str, Queue], persona_manager: PersonaManager, state_manager: StateManager, db):
-    """A background worker that checks a schedule and posts links based on advanced strategies."""
-    print("[SCHEDULER] Worker started.")
-    pending_links = deque()
-    LINKS_SCHEDULE_PATH = os.path.join('config', 'links.json')
+    """
+    A background worker that posts links from links.json based on their strategies.
 
-    while True:
-        # Check the schedule at regular intervals (e.g., every 60 seconds)
-        await asyncio.sleep(60)
-
-        # 1. Dynamically reload the schedule from the JSON file each cycle
-        try:
-            with open(LINKS_SCHEDULE_PATH, 'r', encoding='utf-8') as f:
-                schedule = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"[SCHEDULER] ERROR: Could not load or parse links.json: {e}. Retrying next cycle.")
-            continue
+    It keeps a plan of upcoming posts: each due link gets a slot no earlier
+    than its due time and at least the global cooldown after the previous post.
+    A post is prepared (persona, context, generation) LINK_PREPARE_LEAD_SECS
+    before its slot, and at the slot it is only revalidated and queued. The
+    worker sleeps until the next slot or preparation instead of polling.
+
+    With deferred generation, the post's text is requested for the next batch
+    DEFERRED_LEAD_SECS before its slot, and preparation uses it if it is ready.
+    """
+    logger.info("Worker started.")
+    pending_links: list[dict] = []
+    QUEUE_DEPTH.labels("scheduler_pending_links").set_function(lambda: len(pending_links))
+    lead_secs = APP_CONFIG.get("link_prepare_lead_secs", 120)
+    max_age_secs = APP_CONFIG.get("link_prepared_max_age_secs", 900)
+    cooldown_seconds = APP_CONFIG.get("link_post_cooldown_mins", 15) * 60
+    defer_secs = APP_CONFIG.get("deferred_lead_secs", 1800) if deferred_generator.enabled else 0
 
-        print(f"[SCHEDULER] Checking schedule with {len(schedule)} links...")
+    schedule: list[dict] = []
+    link_states: dict[str, dict] = {}
+    jitters: dict[str, float] = {}
+    # link -> (preparation task, post_count when it started)
+    prepared: dict[str, tuple[asyncio.Task, int]] = {}
+    # link -> (deferral request task, its deferred generation key)
+    deferred: dict[str, tuple[asyncio.Task, str]] = {}
+    # link -> earliest retry after an unexpected error
+    retry_after: dict[str, float] = {}
+    last_global_post = state_manager.load_bot_state().get("global_last_link_post_time", 0)
+    schedule_loaded_at = 0.0
+
+    while True:
         now = time.time()
 
-        # 2. Check each link in the schedule to see if it's due
+        # 1. Dynamically reload the schedule (and link states) from the JSON file every minute
+        if now - schedule_loaded_at >= SCHEDULE_RELOAD_SECS:
+            loaded = _load_schedule()
+            schedule_loaded_at = now
+            if loaded is not None:
+                # Skip links missing essential info, or (with sharding) whose target channel another node owns.
+                schedule = [
+                    link_info for link_info in loaded
+                    if all([link_info.get("link"), link_info.get("posting_strategy"), link_info.get("time_interval")])
+                    and owns_channel(link_info.get("platform"), link_info.get("channel_id"))
+                ]
+                link_states = {link_info["link"]: state_manager.get_link_state(link_info["link"]) for link_info in schedule}
+                logger.info("Checking schedule with %s links...", len(schedule))
+
+        # 2. Plan the upcoming posts in due order, spaced by the global cooldown
+        cycle_started = time.perf_counter()
+        upcoming = []
         for link_info in schedule:
-            link = link_info.get("link")
-            strategy = link_info.get("posting_strategy")
-            interval_mins = link_info.get("time_interval")
-            
-            # Skip if essential info is missing
-            if not all([link, strategy, interval_mins]):
-                continue
-
-            link_state = state_manager.get_link_state(link)
-            last_posted = link_state.get("last_post_time", 0)
-            post_count = link_state.get("post_count", 0)
-            
-            is_due = False
-            
-            # --- Advanced Strategy Logic ---
-            if strategy == "once" and post_count == 0:
-                is_due = True
-            elif isinstance(strategy, int) and post_count < strategy:
-                if post_count == 0 or (now - last_posted > interval_mins * 60):
-                    is_due = True
-            elif strategy == "recurrent":
-                # Apply "jitter" to the interval to make posts less predictable
-                jitter = interval_mins * 0.10
-                jittered_interval_seconds = (interval_mins + random.uniform(-jitter, jitter)) * 60
-                if now - last_posted > jittered_interval_seconds:
-                    is_due = True
-            
-            # If a link is due and not already in the pending queue, add it
-            if is_due:
-                # Check against the link URL to prevent duplicates in the pending queue
-                if link not in [p.get('link') for p in pending_links]:
-                    print(f"[SCHEDULER] Link '{link}' is due (Strategy: {strategy}). Adding to pending queue.")
-                    pending_links.append(link_info)
-        
-        # 3. Process one item from the pending queue if the global cooldown has passed
-        if pending_links:
-            bot_state = state_manager.load_bot_state()
-            cooldown_seconds = APP_CONFIG.get("link_post_cooldown_mins", 15) * 60
-            
-            if now - bot_state.get("global_last_link_post_time", 0) > cooldown_seconds:
-                print("[SCHEDULER] Global cooldown passed. Processing one link from queue.")
-                
-                # Get the next link to post from the left of the queue
-                link_to_post = pending_links.popleft()
-                
-                try:
-                    # --- CORRECTED LOGIC ---
-                    # The handler function now does the heavy lifting of crafting the message
-                    # and putting it on the correct queue.
-                    # We await it directly. It will print its own success/failure messages.
-                    await handle_scheduled_link_post(link_to_post, sender_queues, persona_manager, db)
-                    
-                    # If the handler executes without raising an exception, we consider it a success.
-                    # Now we update the state.
-                    print(f"[SCHEDULER] Successfully processed and queued message for '{link_to_post['link']}'.")
-                    
-                    # Update timers for both the specific link and the global cooldown
-                    state_manager.update_link_state(link_to_post['link'])
-                    bot_state["global_last_link_post_time"] = time.time()
-                    state_manager.save_bot_state(bot_state)
-
-                except Exception as e:
-                    # Catch any unexpected errors from the handler
-                    print(f"[SCHEDULER] CRITICAL ERROR while handling link post for '{link_to_post.get('link')}': {e}")
-            
-            else:
-                # If we are still in the global cooldown period
-                wait_time = (bot_state.get("global_last_link_post_time", 0) + cooldown_seconds) - now
-                print(f"[SCHEDULER] In global cooldown. {len(pending_links)} links are waiting. Next post possible in {int(wait_time)}s.")
\ No newline at end of file
+            due_at = _due_time(link_info, link_states.get(link_info["link"], {}), jitters)
+            if due_at is not None:
+                upcoming.append((max(due_at, retry_after.get(link_info["link"], 0)), link_info))
+        upcoming.sort(key=lambda item: item[0])
+        pending_links[:] = [link_info for due_at, link_info in upcoming if due_at <= now]
+
+        plan = []
+        next_slot = last_global_post + cooldown_seconds
+        for due_at, link_info in upcoming:
+            post_at = max(due_at, next_slot)
+            plan.append((post_at, link_info))
+            next_slot = post_at + cooldown_seconds
+            if post_at - now > max(lead_secs, defer_secs):
+                break
+
+        # 3. Start preparing every post whose slot is within the lead time
+        upcoming_links = {link_info["link"] for _, link_info in upcoming}
+        for link in list(prepared):
+            if link not in upcoming_links:
+                prepared.pop(link)[0].cancel()
+        for link in list(deferred):
+            if link not in upcoming_links:
+                deferred.pop(link)[0].cancel()
+        for post_at, link_info in plan:
+            link = link_info["link"]
+            post_count = link_states.get(link, {}).get("post_count", 0)
+            if post_at - now <= lead_secs and link not in prepared:
+                logger.info("Preparing link '%s' for %ss from now.", link, int(max(post_at - now, 0)))
+                task = asyncio.create_task(_prepare(link_info, persona_manager, db, post_count))
+                prepared[link] = (task, post_count)
+            elif post_at - now <= defer_secs and link not in prepared and _defer_pending(deferred, link, post_count):
+                deferred[link] = (asyncio.create_task(_defer(link_info, post_count, persona_manager, db)), link_post_key(link, post_count))
+        STAGE_DURATION.labels("scheduler", "due_check").observe(time.perf_counter() - cycle_started)
+
+        # 4. Post the head of the plan once its slot arrives
+        if plan and plan[0][0] <= now:
+            post_at, link_to_post = plan[0]
+            link = link_to_post["link"]
+            set_request_id(f"link:{link}")
+            task, prepared_count = prepared.pop(link)
+            try:
+                payload, prepared_at = await task
+                set_trace(payload and payload.get("trace_id"))
+                # Cheap revalidation: the link wasn't posted meanwhile (e.g. by another node) and the text isn't stale.
+                fresh_state = state_manager.get_link_state(link)
+                if fresh_state.get("post_count", 0) != prepared_count:
+                    logger.info("Link '%s' was posted elsewhere since it was prepared. Dropping it.", link)
+                    link_states[link] = fresh_state
+                    jitters.pop(link, None)
+                    continue
+                if payload and time.time() - prepared_at > max_age_secs:
+                    logger.info("Prepared post for '%s' is stale. Preparing it again.", link)
+                    payload, _ = await _prepare(link_to_post, persona_manager, db, prepared_count)
+
+                with track_stage("scheduler", "link_post"):
+                    if payload:
+                        await enqueue_link_post(payload, sender_queues)
+                LINK_POST_DELAY.labels().observe(max(time.time() - post_at, 0.0))
+
+                # As before, a post the LLM failed to write still counts, so a broken link can't retry in a loop.
+                logger.info("Successfully processed and queued message for '%s'.", link)
+
+                # Update timers for both the specific link and the global cooldown
+                state_manager.update_link_state(link)
+                last_global_post = time.time()
+                state_manager.update_bot_state(global_last_link_post_time=last_global_post)
+                link_states[link] = {**fresh_state, "last_post_time": last_global_post, "post_count": prepared_count + 1}
+                jitters.pop(link, None)
+                retry_after.pop(link, None)
+                MESSAGES_TOTAL.labels("scheduler", "link_posted").inc()
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Catch any unexpected errors from the handler
+                MESSAGES_TOTAL.labels("scheduler", "error").inc()
+                logger.critical("Unhandled error while handling link post for '%s': %s", link, e)
+                retry_after[link] = time.time() + SCHEDULE_RELOAD_SECS
+            continue
+
+        # 5. Sleep until the next slot, preparation or schedule reload
+        wake_at = schedule_loaded_at + SCHEDULE_RELOAD_SECS
+        for post_at, link_info in plan:
+            link = link_info["link"]
+            wake_at = min(wake_at, post_at if link in prepared else post_at - lead_secs)
+            if defer_secs and link not in prepared and _defer_pending(deferred, link, link_states.get(link, {}).get("post_count", 0)):
+                wake_at = min(wake_at, post_at - defer_secs)
+        if plan and len(pending_links) and plan[0][0] > now:
+            logger.info("In global cooldown. %s links are waiting. Next post possible in %ss.", len(pending_links), int(plan[0][0] - now))
+        await asyncio.sleep(max(wake_at - time.time(), MIN_SLEEP_SECS))